@@ -0,0 +1,89 @@
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.core import signing
+from django.utils import timezone
+
+CALENDAR_SALT = 'booking.calendar'
+SESSION_LENGTH = timedelta(hours=1)
+
+
+def calendar_token(user_id, version):
+    """
+    Returns the signed token that identifies a user's calendar feed. It is
+    valid until the user's `calendar_token_version` moves past `version`.
+    """
+    return signing.Signer(salt=CALENDAR_SALT).sign(f'{user_id}:{version}')
+
+
+def read_calendar_token(token):
+    """
+    Returns the user id and version a calendar token was issued for, or
+    None if it is invalid. Tokens from before versions count as version 0.
+    """
+    try:
+        value = signing.Signer(salt=CALENDAR_SALT).unsign(token)
+    except signing.BadSignature:
+        return None
+    user_id, _, version = value.partition(':')
+    return user_id, int(version or 0)
+
+
+def calendar_etag(user_id, last_modified, count):
+    """Validator for a feed, it changes whenever one of its bookings is saved or deleted."""
+    stamp = last_modified.isoformat() if last_modified else ''
+    return '"%s"' % hashlib.md5(f"{user_id}:{stamp}:{count}".encode(), usedforsecurity=False).hexdigest()
+
+
+def escape_text(value):
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\n', '\\n')
+    )
+
+
+def fold_line(line):
+    """Folds a content line to 75 octets as required by RFC 5545."""
+    parts = []
+    current = ''
+    for character in line:
+        # Continuation lines start with a space, which counts towards the limit
+        limit = 75 if not parts else 74
+        if len((current + character).encode('utf-8')) > limit:
+            parts.append(current)
+            current = ''
+        current += character
+    parts.append(current)
+    return '\r\n '.join(parts)
+
+
+def format_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_calendar(bookings, name):
+    """Renders bookings (with service, crew and client loaded) as an iCalendar document."""
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Kopero Studios//Bookings//EN',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{escape_text(name)}',
+    ]
+    for booking in bookings:
+        start = timezone.make_aware(datetime.combine(booking.date, booking.time))
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:{booking.id}@kopero-studios',
+            f'DTSTAMP:{format_datetime(booking.updated_at)}',
+            f'DTSTART:{format_datetime(start)}',
+            f'DTEND:{format_datetime(start + SESSION_LENGTH)}',
+            f'SUMMARY:{escape_text(booking.service.name)}',
+            f'DESCRIPTION:{escape_text(f"Booking {booking.booking_number} for {booking.client.full_name} with {booking.crew.full_name}")}',
+            f'STATUS:{"CANCELLED" if booking.status == "canceled" else "CONFIRMED"}',
+            'END:VEVENT',
+        ]
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(fold_line(line) for line in lines) + '\r\n'
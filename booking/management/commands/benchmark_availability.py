@@ -0,0 +1,72 @@
+import json
+import random
+from datetime import date, time, timedelta
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+from common.benchmarks import isolated_database, measure
+
+
+class Command(BaseCommand):
+    help = 'Compare one 31 day available times request against 31 single day requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--crew', type=int, default=20, help='Number of crew members to seed')
+        parser.add_argument('--bookings', type=int, default=20000, help='Number of bookings to seed')
+        parser.add_argument('--repeat', type=int, default=20, help='Measured runs per scenario')
+
+    def handle(self, *args, **options):
+        with isolated_database():
+            crew = self.seed(options['crew'], options['bookings'])
+            client = APIClient()
+            url = f'/api/v1/booking/available-times/{crew.id}/'
+            start = date.today()
+            days = [start + timedelta(days=offset) for offset in range(31)]
+
+            def single_day_requests():
+                for day in days:
+                    client.get(url, {'date': day.isoformat()})
+
+            def range_request():
+                client.get(url, {'from': days[0].isoformat(), 'to': days[-1].isoformat()})
+
+            results = {
+                '31_single_day_requests': measure(single_day_requests, repeat=options['repeat']),
+                '1_range_request': measure(range_request, repeat=options['repeat']),
+            }
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def seed(self, crew_count, booking_count):
+        from booking.models import Booking
+        from kopero_auth.models import Client, CrewMember
+        from services.models import Service
+
+        service = Service.objects.create(name='Benchmark session', tag='benchmark')
+        client = Client.objects.create(email='client@bench.local', username='bench-client')
+        crew = [
+            CrewMember.objects.create(email=f'crew{n}@bench.local', username=f'bench-crew-{n}', category=CrewMember.PHOTOGRAPHER)
+            for n in range(crew_count)
+        ]
+
+        rng = random.Random(42)
+        slots = set()
+        while len(slots) < booking_count:
+            slots.add((rng.randrange(crew_count), rng.randrange(-180, 180), rng.randrange(24)))
+
+        Booking.objects.bulk_create(
+            [
+                Booking(
+                    client=client,
+                    crew=crew[crew_index],
+                    service=service,
+                    booking_number=f'B{number:07d}',
+                    date=date.today() + timedelta(days=day_offset),
+                    time=time(hour=hour),
+                )
+                for number, (crew_index, day_offset, hour) in enumerate(slots)
+            ],
+            batch_size=1000,
+        )
+        call_command('rebuild_availability', stdout=self.stdout)
+        return crew[0]
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from booking.models import Booking, CrewAvailability
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the crew availability index from the bookings table, '
+        'needed after bookings were changed without signals, e.g. by QuerySet.update()'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--crew', help='Only rebuild the index of this crew member')
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.alive().exclude(status='canceled')
+        availability = CrewAvailability.objects.all()
+        if options['crew']:
+            bookings = bookings.filter(crew_id=options['crew'])
+            availability = availability.filter(crew_id=options['crew'])
+
+        booked_slots = {}
+        for crew_id, date, time in bookings.values_list('crew_id', 'date', 'time').iterator():
+            booked_slots[(crew_id, date)] = booked_slots.get((crew_id, date), 0) | (1 << time.hour)
+
+        with transaction.atomic():
+            availability.delete()
+            CrewAvailability.objects.bulk_create(
+                [
+                    CrewAvailability(crew_id=crew_id, date=date, booked_slots=slots)
+                    for (crew_id, date), slots in booked_slots.items()
+                ],
+                batch_size=1000,
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt availability for {len(booked_slots)} crew days'))
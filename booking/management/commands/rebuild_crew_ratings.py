@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from booking.models import Review
+from kopero_auth.cache import crew_directory_cache
+from kopero_auth.models import CrewMember
+
+RATINGS = range(1, 6)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the rating aggregates of every crew member from their reviews'
+
+    def handle(self, *args, **options):
+        aggregates = Review.objects.alive().values('crew_member_id').annotate(
+            total=Sum('rating'),
+            count=Count('id'),
+            **{f'count_{rating}': Count('id', filter=Q(rating=rating)) for rating in RATINGS}
+        )
+
+        crew_members = []
+        for row in aggregates.iterator():
+            crew_member = CrewMember(pk=row['crew_member_id'])
+            crew_member.rating_sum = row['total']
+            crew_member.rating_count = row['count']
+            crew_member.average_rating = row['total'] / row['count']
+            for rating in RATINGS:
+                setattr(crew_member, f'rating_{rating}_count', row[f'count_{rating}'])
+            crew_members.append(crew_member)
+
+        fields = ['rating_sum', 'rating_count', 'average_rating'] + [f'rating_{rating}_count' for rating in RATINGS]
+        with transaction.atomic():
+            CrewMember.objects.update(**{field: 0 for field in fields})
+            CrewMember.objects.bulk_update(crew_members, fields, batch_size=500)
+        # Every rating may have changed, retire the whole crew directory cache
+        crew_directory_cache.bump()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {len(crew_members)} crew members'))
@@ -0,0 +1,46 @@
+# Generated by Django 5.1.1 on 2026-10-18 00:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_availability(apps, schema_editor):
+    Booking = apps.get_model('booking', 'Booking')
+    CrewAvailability = apps.get_model('booking', 'CrewAvailability')
+
+    booked_slots = {}
+    bookings = Booking.objects.filter(is_deleted=False).exclude(status='canceled')
+    for crew_id, date, time in bookings.values_list('crew_id', 'date', 'time').iterator():
+        booked_slots[(crew_id, date)] = booked_slots.get((crew_id, date), 0) | (1 << time.hour)
+
+    CrewAvailability.objects.bulk_create(
+        [
+            CrewAvailability(crew_id=crew_id, date=date, booked_slots=slots)
+            for (crew_id, date), slots in booked_slots.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0002_initial'),
+        ('kopero_auth', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrewAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booked_slots', models.IntegerField(default=0)),
+                ('crew', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='kopero_auth.crewmember')),
+            ],
+            options={
+                'unique_together': {('crew', 'date')},
+            },
+        ),
+        migrations.RunPython(build_availability, migrations.RunPython.noop),
+    ]
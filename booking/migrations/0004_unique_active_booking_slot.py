@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 00:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0003_crewavailability'),
+        ('kopero_auth', '0001_initial'),
+        ('services', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_deleted', False), models.Q(('status', 'canceled'), _negated=True)), fields=('crew', 'date', 'time'), name='unique_active_booking_slot', violation_error_message='The selected time slot is not available.'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.1 on 2026-10-18 00:20
+
+from django.db import migrations
+
+
+def create_sequence(apps, schema_editor):
+    # Other databases use the common.Sequence table instead
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE SEQUENCE IF NOT EXISTS booking_number_seq")
+
+
+def drop_sequence(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP SEQUENCE IF EXISTS booking_number_seq")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_keyset_pagination_indexes'),
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
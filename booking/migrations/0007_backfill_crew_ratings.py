@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 00:25
+
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+
+
+def backfill_crew_ratings(apps, schema_editor):
+    Review = apps.get_model('booking', 'Review')
+    CrewMember = apps.get_model('kopero_auth', 'CrewMember')
+
+    aggregates = Review.objects.filter(is_deleted=False).values('crew_member_id').annotate(
+        total=Sum('rating'),
+        count=Count('id'),
+        **{f'count_{rating}': Count('id', filter=Q(rating=rating)) for rating in range(1, 6)}
+    )
+    for row in aggregates.iterator():
+        CrewMember.objects.filter(pk=row['crew_member_id']).update(
+            rating_sum=row['total'],
+            rating_count=row['count'],
+            average_rating=row['total'] / row['count'],
+            **{f'rating_{rating}_count': row[f'count_{rating}'] for rating in range(1, 6)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0006_booking_number_sequence'),
+        ('kopero_auth', '0003_crew_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_crew_ratings, migrations.RunPython.noop),
+    ]
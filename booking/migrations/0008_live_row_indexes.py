@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 00:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0007_backfill_crew_ratings'),
+        ('kopero_auth', '0004_image_variants'),
+        ('services', '0002_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['client', '-created_at', '-id'], name='booking_live_client_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['crew', '-created_at', '-id'], name='booking_live_crew_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['crew_member'], name='review_live_crew_idx'),
+        ),
+    ]
@@ -1,8 +1,10 @@
 import uuid
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.forms import ValidationError
 from common.models import FlaggedModelMixin, TimeStampedModelMixin
+from common.utils import generate_booking_number
 from kopero_auth.models import Client, CrewMember
 from services.models import Service
 
@@ -27,30 +29,52 @@ class Booking(TimeStampedModelMixin, FlaggedModelMixin):
     ]
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
 
+    _original_slot = (None, None)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the slot this booking was loaded with so the availability
+        # index can also be refreshed for the day a booking moved away from.
+        instance._original_slot = (instance.__dict__.get('crew_id'), instance.__dict__.get('date'))
+        return instance
+
     def generate_booking_number(self):
-        return str(uuid.uuid4())[:5]
+        return generate_booking_number()
 
     def save(self, *args, **kwargs):
         if not self.booking_number:
             self.booking_number = self.generate_booking_number()
         super().save(*args, **kwargs)
 
-    def clean(self):
-        overlapping_bookings = Booking.objects.filter(
-            crew=self.crew,
-            date=self.date,
-            time=self.time
-        )
-
-        if overlapping_bookings.exists():
-            raise ValidationError("The selected time slot is not available.")
-
     def __str__(self):
         return f"Booking {self.booking_number} for {self.client.username} with {self.crew.full_name}"
 
     class Meta:
         indexes = [
             models.Index(fields=['date', 'time', 'crew']),
+            models.Index(fields=['-created_at', '-id']),
+            # The booking list pages through a user's live bookings as client or crew
+            models.Index(
+                fields=['client', '-created_at', '-id'],
+                condition=Q(is_deleted=False),
+                name='booking_live_client_idx',
+            ),
+            models.Index(
+                fields=['crew', '-created_at', '-id'],
+                condition=Q(is_deleted=False),
+                name='booking_live_crew_idx',
+            ),
+        ]
+        constraints = [
+            # A crew member can only hold one active booking per slot, this is
+            # also what `full_clean` checks instead of a hand written query
+            models.UniqueConstraint(
+                fields=['crew', 'date', 'time'],
+                condition=Q(is_deleted=False) & ~Q(status='canceled'),
+                name='unique_active_booking_slot',
+                violation_error_message="The selected time slot is not available.",
+            ),
         ]
 
     def update_status(self, new_status):
@@ -70,12 +94,123 @@ class Review(TimeStampedModelMixin, FlaggedModelMixin):
     crew_member = models.ForeignKey(CrewMember, on_delete=models.CASCADE, related_name='crew_reviews')
     rating = models.PositiveIntegerField()
 
+    _original_rating = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the rating this review contributed when loaded so the crew
+        # aggregates can be adjusted by the difference
+        instance._original_rating = instance.counted_rating()
+        return instance
+
+    def counted_rating(self):
+        """Returns the (crew member, rating) this review adds to the crew aggregates."""
+        if self.__dict__.get('is_deleted') or self.__dict__.get('rating') is None:
+            return None
+        return (self.__dict__.get('crew_member_id'), int(self.__dict__['rating']))
+
     def __str__(self):
         return f"Review by {self.client.username} for crew {self.crew_member.full_name}"
 
     class Meta:
         unique_together = ('booking', 'client')
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            # Rating rebuilds and crew pages read the live reviews of a crew member
+            models.Index(
+                fields=['crew_member'],
+                condition=Q(is_deleted=False),
+                name='review_live_crew_idx',
+            ),
+        ]
 
     def clean(self):
         if self.rating < 1 or self.rating > 5:
             raise ValidationError("Rating must be between 1 and 5.")
+
+
+class CrewAvailabilityManager(models.Manager):
+    """
+    Manager for keeping the availability index in sync with bookings
+    """
+    def refresh(self, crew_id, date):
+        """Rebuilds the bitmap for one crew member on one day from the bookings table."""
+        return self.refresh_days(crew_id, [date])[0]
+
+    def refresh_days(self, crew_id, dates):
+        """
+        Rebuilds the bitmaps for one crew member on several days from the
+        bookings table.
+
+        The days' rows are locked before the bookings are read, so concurrent
+        rebuilds of a day run one after the other and the last one sees every
+        committed booking. Call it once the booking changes are committed,
+        see `refresh_on_commit`.
+        """
+        dates = sorted({models.DateField().to_python(date) for date in dates})
+        with transaction.atomic(using=self.db):
+            self.bulk_create([CrewAvailability(crew_id=crew_id, date=date) for date in dates], ignore_conflicts=True)
+            list(self.select_for_update().filter(crew_id=crew_id, date__in=dates).order_by('date').values_list('pk'))
+
+            booked_times = Booking.objects.alive().filter(
+                crew_id=crew_id,
+                date__in=dates,
+            ).exclude(status='canceled').values_list('date', 'time')
+
+            booked_slots = dict.fromkeys(dates, 0)
+            for booked_date, booked_time in booked_times:
+                booked_slots[booked_date] |= 1 << booked_time.hour
+
+            self.bulk_create(
+                [CrewAvailability(crew_id=crew_id, date=date, booked_slots=slots) for date, slots in booked_slots.items()],
+                update_conflicts=True,
+                unique_fields=['crew', 'date'],
+                update_fields=['booked_slots'],
+            )
+        return [booked_slots[date] for date in dates]
+
+    def refresh_on_commit(self, crew_id, dates):
+        """
+        Rebuilds the bitmaps once the current transaction commits, right away
+        outside of one. A rebuild inside the transaction could read before a
+        concurrent booking commits and write its stale bitmap after it.
+        """
+        dates = list(dates)
+        transaction.on_commit(lambda: self.refresh_days(crew_id, dates), using=self.db)
+
+
+class CrewAvailability(models.Model):
+    """
+    Per crew, per day index of booked hourly slots.
+    Bit N of `booked_slots` is set when the slot starting at hour N is taken.
+
+    Kept in sync by the Booking signals and the bulk booking serializer.
+    Writes that skip them, like `QuerySet.update()` or `bulk_create()` on
+    bookings, leave it stale: run `manage.py rebuild_availability` after them.
+    """
+    SLOTS_PER_DAY = 24
+
+    crew = models.ForeignKey(CrewMember, on_delete=models.CASCADE, related_name='availability')
+    date = models.DateField()
+    booked_slots = models.IntegerField(default=0)
+
+    objects = CrewAvailabilityManager()
+
+    class Meta:
+        unique_together = ('crew', 'date')
+
+    def __str__(self):
+        return f"Availability for {self.crew_id} on {self.date}"
+
+    @classmethod
+    def available_slots(cls, booked_slots):
+        """Returns the free slots of a day in the shape served by the available times endpoint."""
+        return [
+            {
+                'start_time': f"{hour:02d}:00",
+                'end_time': f"{(hour + 1) % cls.SLOTS_PER_DAY:02d}:00",
+            }
+            for hour in range(cls.SLOTS_PER_DAY)
+            if not booked_slots & (1 << hour)
+        ]
@@ -1,7 +1,13 @@
+from datetime import timedelta
 from requests import Response
-from .models import Booking, Review
+from .models import Booking, CrewAvailability, Review
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from rest_framework import status
+from rest_framework.settings import api_settings
+from common.utils import generate_booking_numbers
+from kopero_auth.models import Client, CrewMember
+from services.models import Service
 
 class ReadBookingSerializer(serializers.ModelSerializer):
     """
@@ -27,39 +33,181 @@ class BookingSerializer(serializers.ModelSerializer):
         model = Booking
         fields = ['id', 'client', 'service', 'booking_number', 'crew', 'total_price', 'is_booked', 'total_price', 'date', 'time']  # Include necessary fields
         read_only_fields = ['is_booked']
+        # The slot constraint is enforced by the insert itself, see `save_slot`
+        validators = []
 
     def get_total_price(self, obj):
         # Assuming a fixed duration of 1 hour
         duration = 1  # in hours
         return duration * obj.service.rate_per_hour
 
-    def validate(self, data):
-        date = data.get('date')
-        time = data.get('time')
-        crew = data.get('crew')
-
-        if Booking.objects.filter(crew=crew, date=date, time=time).exists():
-            raise serializers.ValidationError("This time slot is already booked.")
-
-        return data
-
     def create(self, validated_data):
         # Set status to 'pending'
         validated_data['status'] = 'pending'
         
-        # Create the booking instance
+        # Create the booking instance, the slot constraint rejects double bookings
         booking = Booking(**validated_data)
-        booking.save()
+        self.save_slot(booking, booking.save)
         
         return booking
 
     def update(self, instance, validated_data):
         if instance.is_booked:
             raise serializers.ValidationError("This booking is already confirmed")
-        return super().update(instance, validated_data)
-    
+        return self.save_slot(instance, lambda: super(BookingSerializer, self).update(instance, validated_data))
 
+    def save_slot(self, booking, save):
+        """
+        Runs `save` optimistically and turns a violation of the slot
+        constraint into a validation error.
+        """
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError:
+            slot_taken = Booking.objects.alive().filter(
+                crew_id=booking.crew_id,
+                date=booking.date,
+                time=booking.time,
+            ).exclude(status='canceled').exclude(pk=booking.pk).exists()
+            if slot_taken:
+                raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ["This time slot is already booked."]})
+            raise
     
+
+class SlotSerializer(serializers.Serializer):
+    """
+    A single date and time to book
+    """
+    date = serializers.DateField()
+    time = serializers.TimeField()
+
+
+class RecurrenceSerializer(serializers.Serializer):
+    """
+    A recurrence rule, e.g. every week at 10:00 for 13 sessions
+    """
+    FREQUENCY_DAYS = {'daily': 1, 'weekly': 7}
+
+    start_date = serializers.DateField()
+    time = serializers.TimeField()
+    frequency = serializers.ChoiceField(choices=list(FREQUENCY_DAYS), default='weekly')
+    interval = serializers.IntegerField(min_value=1, default=1)
+    count = serializers.IntegerField(min_value=1, required=False)
+    until = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get('count') is None and data.get('until') is None:
+            raise serializers.ValidationError("Either count or until is required.")
+        return data
+
+    def get_slots(self, data, limit):
+        """Expands the rule into (date, time) pairs, stopping one past `limit`."""
+        step = timedelta(days=self.FREQUENCY_DAYS[data['frequency']] * data['interval'])
+        count = data.get('count')
+        until = data.get('until')
+
+        slots = []
+        current = data['start_date']
+        while len(slots) <= limit:
+            if count is not None and len(slots) >= count:
+                break
+            if until is not None and current > until:
+                break
+            slots.append((current, data['time']))
+            current += step
+        return slots
+
+
+class BulkBookingSerializer(serializers.Serializer):
+    """
+    Handles booking several sessions with one crew member at once, given
+    either a list of slots or a recurrence rule. Conflicts are checked in
+    one query and the free slots are inserted in one statement.
+    """
+    max_sessions = 52
+    slot_taken_message = "This time slot is already booked."
+
+    crew = serializers.PrimaryKeyRelatedField(queryset=CrewMember.objects.all())
+    service = serializers.PrimaryKeyRelatedField(queryset=Service.objects.all())
+    slots = SlotSerializer(many=True, required=False)
+    recurrence = RecurrenceSerializer(required=False)
+
+    def validate(self, data):
+        if bool(data.get('slots')) == bool(data.get('recurrence')):
+            raise serializers.ValidationError("Provide either slots or a recurrence rule.")
+
+        if data.get('recurrence'):
+            sessions = self.fields['recurrence'].get_slots(data['recurrence'], self.max_sessions)
+        else:
+            sessions = [(slot['date'], slot['time']) for slot in data['slots']]
+
+        # Drop repeated slots while keeping the requested order
+        sessions = list(dict.fromkeys(sessions))
+        if len(sessions) > self.max_sessions:
+            raise serializers.ValidationError(f"A bulk booking cannot have more than {self.max_sessions} sessions.")
+
+        # Sessions are always booked for the logged in client, whatever the payload says
+        client = Client.objects.alive().filter(pk=self.context['request'].user.pk).first()
+        if client is None:
+            raise serializers.ValidationError("Only clients can book sessions.")
+        data['client'] = client
+
+        data['sessions'] = sessions
+        return data
+
+    def create(self, validated_data):
+        crew = validated_data['crew']
+        sessions = validated_data['sessions']
+
+        # One query over the (date, time, crew) index for every requested slot
+        booked = set(Booking.objects.alive().filter(
+            crew=crew,
+            date__in={date for date, _ in sessions},
+            time__in={time for _, time in sessions},
+        ).exclude(status='canceled').values_list('date', 'time'))
+
+        free_sessions = [session for session in sessions if session not in booked]
+        bookings = [
+            Booking(
+                client=validated_data['client'],
+                crew=crew,
+                service=validated_data['service'],
+                date=date,
+                time=time,
+                status='pending',
+                booking_number=booking_number,
+            )
+            for (date, time), booking_number in zip(free_sessions, generate_booking_numbers(len(free_sessions)))
+        ]
+
+        with transaction.atomic():
+            # Slots taken by a concurrent request since the check are skipped
+            # by the slot constraint instead of failing the whole batch
+            Booking.objects.bulk_create(bookings, ignore_conflicts=True)
+            inserted = set(Booking.objects.filter(pk__in=[booking.pk for booking in bookings]).values_list('pk', flat=True))
+            created = [booking for booking in bookings if booking.pk in inserted]
+            if created:
+                # bulk_create does not send post_save, keep the availability index in sync here
+                CrewAvailability.objects.refresh_on_commit(crew.pk, {booking.date for booking in created})
+
+        created_slots = {(booking.date, booking.time) for booking in created}
+        failed = [
+            {'date': date, 'time': time, 'detail': self.slot_taken_message}
+            for date, time in sessions
+            if (date, time) not in created_slots
+        ]
+        return {'created': created, 'failed': failed}
+
+    def to_representation(self, instance):
+        return {
+            'created': ReadBookingSerializer(instance['created'], many=True, context=self.context).data,
+            'failed': [
+                {**SlotSerializer(slot).data, 'detail': slot['detail']} for slot in instance['failed']
+            ],
+        }
+
+
 class ReviewSerializer(serializers.ModelSerializer):
     """
     Handles serialization of data used to review a crew member
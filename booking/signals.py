@@ -1,24 +1,65 @@
 from django.db import models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Cast
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Review, CrewMember
+from kopero_auth.cache import invalidate_crew_member
+from .models import Booking, CrewAvailability, Review, CrewMember
 
 @receiver(post_save, sender=Review)
-def update_average_rating_on_create_or_update(sender, instance, **kwargs):
-    update_average_rating(instance.crew_member)
+def update_average_rating_on_create_or_update(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    original_rating = instance._original_rating
+    current_rating = instance.counted_rating()
+    if original_rating == current_rating:
+        return
+
+    if original_rating is not None:
+        update_average_rating(*original_rating, sign=-1)
+    if current_rating is not None:
+        update_average_rating(*current_rating, sign=1)
+    instance._original_rating = current_rating
 
 @receiver(post_delete, sender=Review)
 def update_average_rating_on_delete(sender, instance, **kwargs):
-    update_average_rating(instance.crew_member)
+    if instance._original_rating is not None:
+        update_average_rating(*instance._original_rating, sign=-1)
+
+def update_average_rating(crew_member_id, rating, sign):
+    # Add (sign=1) or remove (sign=-1) one rating with a single in-database update
+    rating_sum = F('rating_sum') + sign * rating
+    rating_count = F('rating_count') + sign
+    aggregates = {
+        'rating_sum': rating_sum,
+        'rating_count': rating_count,
+        'average_rating': Case(
+            When(rating_count__gt=-sign, then=Cast(rating_sum, models.FloatField()) / Cast(rating_count, models.FloatField())),
+            default=Value(0.0),
+        ),
+    }
+    if 1 <= rating <= 5:
+        aggregates[f'rating_{rating}_count'] = F(f'rating_{rating}_count') + sign
+    CrewMember.objects.filter(pk=crew_member_id).update(**aggregates)
+    # The update skips the CrewMember signals, retire the cached directory here
+    invalidate_crew_member(crew_member_id)
+
+@receiver(post_save, sender=Booking)
+def update_availability_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_availability(instance)
+
+@receiver(post_delete, sender=Booking)
+def update_availability_on_delete(sender, instance, **kwargs):
+    refresh_availability(instance)
 
-def update_average_rating(crew_member):
-    # Get all reviews for the specified crew member
-    reviews = Review.objects.filter(crew_member=crew_member)
-    
-    # Calculate the average rating
-    if reviews.exists():
-        average = reviews.aggregate(models.Avg('rating'))['rating__avg']
-        crew_member.average_rating = average or 0
-    else:
-        crew_member.average_rating = 0
-    crew_member.save()
+def refresh_availability(booking):
+    # Refresh the day the booking is on now and, if it was moved, the day it left
+    current_slot = (booking.crew_id, booking.date)
+    days = {current_slot}
+    if None not in booking._original_slot:
+        days.add(booking._original_slot)
+    for crew_id, date in days:
+        CrewAvailability.objects.refresh_on_commit(crew_id, [date])
+    booking._original_slot = current_slot
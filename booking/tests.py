@@ -1,3 +1,611 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+import threading
+import uuid
+from io import StringIO
+from unittest import mock
+from datetime import date, time, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from booking.models import Booking, CrewAvailability, Review
+from booking.views import BookingListView
+from common.testing import QueryBudgetMixin
+from kopero_auth.authentication import CLIENT_ROLE, CREW_ROLE, tokens_for_user, user_state
+from kopero_auth.models import Client, CrewMember
+from services.models import Service
 
-# Create your tests here.
+
+class BookingFixturesMixin:
+    """
+    Creates the users and service needed to book a session
+    """
+    def create_fixtures(self):
+        self.service = Service.objects.create(name="Portrait session", tag="portrait")
+        self.client_user = Client.objects.create(email="client@example.com", username="client")
+        self.crew = CrewMember.objects.create(email="crew@example.com", username="crew", category=CrewMember.PHOTOGRAPHER)
+
+    def booking_payload(self, **overrides):
+        payload = {
+            "client": str(self.client_user.id),
+            "crew": str(self.crew.id),
+            "service": str(self.service.id),
+            "date": "2030-01-01",
+            "time": "10:00",
+        }
+        payload.update(overrides)
+        return payload
+
+
+class BookingSlotTests(BookingFixturesMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+
+    def test_booked_slot_is_rejected(self):
+        response = self.api.post(reverse("bookings"), self.booking_payload(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.api.post(reverse("bookings"), self.booking_payload(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data["non_field_errors"], ["This time slot is already booked."])
+
+    def test_canceled_slot_can_be_booked_again(self):
+        Booking.objects.create(
+            client=self.client_user,
+            crew=self.crew,
+            service=self.service,
+            date=date(2030, 1, 1),
+            time=time(10),
+            status="canceled",
+        )
+
+        response = self.api.post(reverse("bookings"), self.booking_payload(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+
+class AvailabilityIndexTests(BookingFixturesMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+
+    def booked_slots(self, day):
+        return CrewAvailability.objects.get(crew=self.crew, date=day).booked_slots
+
+    def test_index_follows_booking_cancel_and_move(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(
+                client=self.client_user, crew=self.crew, service=self.service, date=date(2030, 1, 1), time=time(10),
+            )
+            Booking.objects.create(
+                client=self.client_user, crew=self.crew, service=self.service, date=date(2030, 1, 1), time=time(14),
+            )
+        self.assertEqual(self.booked_slots(date(2030, 1, 1)), 1 << 10 | 1 << 14)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.date = date(2030, 1, 2)
+            booking.time = time(9)
+            booking.save()
+        self.assertEqual(self.booked_slots(date(2030, 1, 1)), 1 << 14)
+        self.assertEqual(self.booked_slots(date(2030, 1, 2)), 1 << 9)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = "canceled"
+            booking.save()
+        self.assertEqual(self.booked_slots(date(2030, 1, 2)), 0)
+
+    def test_index_is_written_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Booking.objects.create(
+                client=self.client_user, crew=self.crew, service=self.service, date=date(2030, 1, 1), time=time(10),
+            )
+            self.assertFalse(CrewAvailability.objects.filter(crew=self.crew).exists())
+        self.assertEqual(len(callbacks), 1)
+
+
+class BookingQueryBudgetTests(QueryBudgetMixin, BookingFixturesMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+        self.bookings = [
+            Booking.objects.create(
+                client=self.client_user,
+                crew=self.crew,
+                service=self.service,
+                date=date(2030, 1, 1 + hour // 24),
+                time=time(hour % 24),
+            )
+            for hour in range(30)
+        ]
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        # One count and one page query
+        with self.assertMaxQueries(2):
+            response = self.api.get(reverse("bookings"))
+        self.assertEqual(len(response.data["results"]), 10)
+
+        with self.assertMaxQueries(1):
+            response = self.api.get(reverse("bookings"), {"all": "true"})
+        self.assertEqual(len(response.data), 30)
+        self.assertEqual(response.data[0]["crew"], self.crew.full_name)
+
+    def test_cursor_pages_skip_the_count(self):
+        seen = []
+        url = reverse("bookings") + "?cursor="
+        while url:
+            with self.assertMaxQueries(1):
+                response = self.api.get(url)
+            self.assertNotIn("count", response.data)
+            seen.extend(booking["id"] for booking in response.data["results"])
+            url = response.data["next"]
+
+        expected = sorted(self.bookings, key=lambda booking: (booking.created_at, booking.id), reverse=True)
+        self.assertEqual(seen, [str(booking.id) for booking in expected])
+
+    def test_detail_queries(self):
+        # The booking with its relations and review
+        with self.assertMaxQueries(1):
+            response = self.api.get(reverse("booking", args=[self.bookings[0].pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["service_name"], self.service.name)
+
+
+class ConditionalBookingTests(QueryBudgetMixin, BookingFixturesMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+        self.booking = Booking.objects.create(
+            client=self.client_user,
+            crew=self.crew,
+            service=self.service,
+            date=date(2030, 1, 1),
+            time=time(10),
+        )
+        self.url = reverse("booking", args=[self.booking.pk])
+
+    def test_unchanged_booking_is_not_modified(self):
+        etag = self.api.get(self.url)["ETag"]
+
+        # Only the validators are read
+        with self.assertMaxQueries(1):
+            response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+        Booking.objects.filter(pk=self.booking.pk).update(is_paid=True, updated_at=self.booking.updated_at.replace(year=2031))
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_stale_if_match_is_refused(self):
+        etag = self.api.get(self.url)["ETag"]
+
+        response = self.api.put(self.url, {"time": "11:00"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+        response = self.api.put(self.url, {"time": "12:00"}, format="json", HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.time, time(11))
+
+    def test_preconditions_do_not_reveal_other_users_bookings(self):
+        etag = self.api.get(self.url)["ETag"]
+        other = Client.objects.create(email="other@example.com", username="other")
+        self.api.force_authenticate(other)
+
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertNotIn("ETag", response)
+        response = self.api.get(self.url, HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.api.get(reverse("booking", args=[uuid.uuid4()]), HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BookingActionTests(QueryBudgetMixin, BookingFixturesMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+        self.api = APIClient()
+        self.booking = Booking.objects.create(
+            client=self.client_user,
+            crew=self.crew,
+            service=self.service,
+            date=date(2030, 1, 1),
+            time=time(10),
+        )
+
+    def authenticate(self, user, role):
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user, role)['access']}")
+
+    def test_ownership_is_checked_from_the_token(self):
+        self.authenticate(self.client_user, CLIENT_ROLE)
+        user_state(self.client_user.pk)
+        # Only the booking is read, the user comes from the token claims and the cached user state
+        with self.assertMaxQueries(1):
+            response = self.api.post(reverse("booking-pay", args=[self.booking.pk]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.authenticate(self.crew, CREW_ROLE)
+        response = self.api.post(reverse("booking-pay", args=[self.booking.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.booking.refresh_from_db()
+        self.assertTrue(self.booking.is_paid)
+
+
+class RatingAggregateTests(BookingFixturesMixin, TestCase):
+    fields = ["rating_sum", "rating_count", "average_rating"] + [f"rating_{rating}_count" for rating in range(1, 6)]
+
+    def setUp(self):
+        self.create_fixtures()
+        self.bookings = [
+            Booking.objects.create(
+                client=self.client_user, crew=self.crew, service=self.service,
+                date=date(2030, 1, 1), time=time(hour), status="served",
+            )
+            for hour in (9, 10)
+        ]
+
+    def aggregates(self):
+        return CrewMember.objects.filter(pk=self.crew.pk).values(*self.fields).get()
+
+    def test_aggregates_follow_reviews_and_match_a_rebuild(self):
+        review = Review.objects.create(booking=self.bookings[0], client=self.client_user, crew_member=self.crew, rating=4)
+        self.assertEqual(self.aggregates(), dict.fromkeys(self.fields, 0) | {
+            "rating_sum": 4, "rating_count": 1, "average_rating": 4.0, "rating_4_count": 1,
+        })
+
+        review.rating = 2
+        review.save()
+        Review.objects.create(booking=self.bookings[1], client=self.client_user, crew_member=self.crew, rating=5)
+        self.assertEqual(self.aggregates(), dict.fromkeys(self.fields, 0) | {
+            "rating_sum": 7, "rating_count": 2, "average_rating": 3.5, "rating_2_count": 1, "rating_5_count": 1,
+        })
+
+        review.is_deleted = True
+        review.deleted_at = timezone.now()
+        review.save()
+        expected = dict.fromkeys(self.fields, 0) | {"rating_sum": 5, "rating_count": 1, "average_rating": 5.0, "rating_5_count": 1}
+        self.assertEqual(self.aggregates(), expected)
+
+        call_command("rebuild_crew_ratings", stdout=StringIO())
+        self.assertEqual(self.aggregates(), expected)
+
+
+class SoftDeleteTests(BookingFixturesMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+        self.booking = Booking.objects.create(
+            client=self.client_user, crew=self.crew, service=self.service, date=date(2030, 1, 1), time=time(10),
+        )
+
+    def test_deleted_rows_are_hidden_then_purged(self):
+        self.api.delete(reverse("booking", args=[self.booking.pk]))
+        self.assertEqual(self.api.get(reverse("booking", args=[self.booking.pk])).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.api.get(reverse("bookings")).data["count"], 0)
+
+        # A deleted crew member with a live booking is kept
+        other = Booking.objects.create(
+            client=self.client_user, crew=self.crew, service=self.service, date=date(2030, 1, 2), time=time(10),
+        )
+        long_ago = timezone.now() - timedelta(days=400)
+        Booking.objects.filter(pk=self.booking.pk).update(deleted_at=long_ago)
+        CrewMember.objects.filter(pk=self.crew.pk).update(is_deleted=True, deleted_at=long_ago)
+
+        call_command("purge_soft_deleted", days=90, stdout=StringIO())
+        self.assertQuerySetEqual(Booking.objects.all(), [other])
+        self.assertTrue(CrewMember.objects.filter(pk=self.crew.pk).exists())
+
+    def test_purge_keeps_parents_of_retained_deleted_rows(self):
+        long_ago = timezone.now() - timedelta(days=400)
+        Client.objects.filter(pk=self.client_user.pk).update(is_deleted=True, deleted_at=long_ago)
+        # Deleted within retention, then without a deletion time
+        Booking.objects.filter(pk=self.booking.pk).update(is_deleted=True, deleted_at=timezone.now())
+        call_command("purge_soft_deleted", days=90, stdout=StringIO())
+        self.assertTrue(Booking.objects.filter(pk=self.booking.pk).exists())
+
+        Booking.objects.filter(pk=self.booking.pk).update(deleted_at=None)
+        call_command("purge_soft_deleted", days=90, stdout=StringIO())
+        self.assertTrue(Booking.objects.filter(pk=self.booking.pk).exists())
+
+        Booking.objects.filter(pk=self.booking.pk).update(deleted_at=long_ago)
+        call_command("purge_soft_deleted", days=90, stdout=StringIO())
+        self.assertFalse(Client.objects.filter(pk=self.client_user.pk).exists())
+
+
+class AsyncReadViewTests(BookingFixturesMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+        self.api = APIClient()
+        for hour in (9, 10):
+            Booking.objects.create(
+                client=self.client_user, crew=self.crew, service=self.service, date=date(2030, 1, 1), time=time(hour),
+            )
+
+    def test_async_views_answer_like_the_sync_ones(self):
+        response = self.api.get(reverse("bookings_async"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.client_user, CLIENT_ROLE)['access']}")
+        for sync_name, async_name, kwargs, query in (
+            ("bookings", "bookings_async", {}, "?all=1"),
+            ("available_time", "available_time_async", {"crew_id": self.crew.pk}, "?date=2030-01-01"),
+            ("available_time", "available_time_async", {"crew_id": self.crew.pk}, "?from=2030-01-01&to=2030-01-02"),
+            ("crews", "crews_async", {}, "?cursor="),
+        ):
+            expected = self.api.get(reverse(sync_name, kwargs=kwargs) + query)
+            response = self.api.get(reverse(async_name, kwargs=kwargs) + query)
+            self.assertEqual(response.status_code, expected.status_code)
+            self.assertEqual(response.json(), expected.json())
+
+    def test_async_views_authenticate_users_missing_from_the_cache(self):
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.client_user, CLIENT_ROLE)['access']}")
+        for name, kwargs, query in (
+            ("bookings_async", {}, "?all=1"),
+            ("available_time_async", {"crew_id": self.crew.pk}, "?date=2030-01-01"),
+            ("crews_async", {}, "?cursor="),
+            ("services_async", {}, ""),
+        ):
+            # The user state is read with the async ORM on the first request
+            cache.clear()
+            response = self.api.get(reverse(name, kwargs=kwargs) + query)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, name)
+
+        Client.objects.filter(pk=self.client_user.pk).update(is_active=False)
+        cache.clear()
+        self.assertEqual(self.api.get(reverse("bookings_async")).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class BookingExportTests(BookingFixturesMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+        other_client = Client.objects.create(email="other@example.com", username="other")
+        self.own = [
+            Booking.objects.create(
+                client=self.client_user, crew=self.crew, service=self.service, date=date(2030, 1, 1), time=time(hour),
+            ).pk
+            for hour in range(9, 14)
+        ]
+        for hour in (14, 15):
+            Booking.objects.create(
+                client=other_client, crew=self.crew, service=self.service, date=date(2030, 1, 1), time=time(hour),
+            )
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.client_user, CLIENT_ROLE)['access']}")
+
+    def export(self, export_format):
+        # Two rows per chunk, so the client's five bookings span three chunks
+        with mock.patch.object(BookingListView, "export_chunk_size", 2):
+            response = self.api.get(reverse("bookings"), {"all": "true", "format": export_format})
+            # Services, crew and clients come with the bookings
+            with self.assertNumQueries(1):
+                body = b"".join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return body
+
+    def test_exports_hold_only_the_clients_bookings(self):
+        rows = [json.loads(line) for line in self.export("ndjson").splitlines()]
+        self.assertCountEqual([row["id"] for row in rows], [str(pk) for pk in self.own])
+        self.assertEqual({row["service_name"] for row in rows}, {self.service.name})
+
+        rows = list(csv.DictReader(StringIO(self.export("csv"))))
+        self.assertCountEqual([row["id"] for row in rows], [str(pk) for pk in self.own])
+        self.assertEqual({row["client"] for row in rows}, {self.client_user.full_name})
+
+
+@override_settings(READ_REPLICAS=dict(settings.READ_REPLICAS, ALIASES=['replica']))
+class ReplicaRoutingTests(BookingFixturesMixin, TransactionTestCase):
+    # Nothing replicates into `replica`, reads routed to it miss the booking
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        # Pins must be shared by every worker
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory.name},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        self.create_fixtures()
+        self.booking = Booking.objects.create(
+            client=self.client_user, crew=self.crew, service=self.service, date=date(2030, 1, 1), time=time(10),
+        )
+        self.api = APIClient()
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(self.client_user, CLIENT_ROLE)['access']}")
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        self.assertEqual(self.api.get(reverse("bookings")).json()["count"], 0)
+
+        response = self.api.post(reverse("booking-cancel", args=[self.booking.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.api.get(reverse("bookings")).json()["count"], 1)
+
+        # The user stays pinned without the cookie, until the pin expires
+        self.api.cookies.clear()
+        self.assertEqual(self.api.get(reverse("bookings_async")).json()["count"], 1)
+        cache.clear()
+        self.assertEqual(self.api.get(reverse("bookings")).json()["count"], 0)
+
+    def test_cache_entries_are_built_from_the_primary(self):
+        # Shared by every user, so a replica lagging behind a catalog or
+        # directory bump must not fill the new version
+        anonymous = APIClient()
+        for name in ("service-list", "services_async", "crews", "crews_async"):
+            self.assertEqual(anonymous.get(reverse(name)).json()["count"], 1, name)
+
+        Service.objects.create(name="Wedding", tag="wedding")
+        CrewMember.objects.create(email="editor@example.com", username="editor", category=CrewMember.PHOTOGRAPHER)
+        for name in ("service-list", "services_async", "crews", "crews_async"):
+            self.assertEqual(anonymous.get(reverse(name)).json()["count"], 2, name)
+
+    def test_process_local_pins_keep_users_on_the_primary(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.assertEqual(self.api.get(reverse("bookings")).json()["count"], 1)
+            self.assertEqual(self.api.get(reverse("bookings_async")).json()["count"], 1)
+
+
+class BulkBookingTests(QueryBudgetMixin, BookingFixturesMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+
+    def test_recurring_booking_reports_taken_slots(self):
+        Booking.objects.create(
+            client=self.client_user,
+            crew=self.crew,
+            service=self.service,
+            date=date(2030, 1, 15),
+            time=time(10),
+        )
+        payload = {
+            "client": str(self.client_user.id),
+            "crew": str(self.crew.id),
+            "service": str(self.service.id),
+            "recurrence": {"start_date": "2030-01-01", "time": "10:00", "frequency": "weekly", "count": 13},
+        }
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertMaxQueries(15):
+            response = self.api.post(reverse("bookings_bulk"), payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["created"]), 12)
+        self.assertEqual(response.data["failed"], [
+            {"date": "2030-01-15", "time": "10:00:00", "detail": "This time slot is already booked."},
+        ])
+        self.assertEqual(Booking.objects.filter(crew=self.crew).count(), 13)
+        self.assertEqual(CrewAvailability.objects.get(crew=self.crew, date=date(2030, 1, 22)).booked_slots, 1 << 10)
+
+    def test_bookings_are_made_for_the_logged_in_client(self):
+        other = Client.objects.create(email="other@example.com", username="other")
+        payload = {
+            "client": str(other.id),
+            "crew": str(self.crew.id),
+            "service": str(self.service.id),
+            "slots": [{"date": "2030-01-01", "time": "10:00"}, {"date": "2030-01-02", "time": "10:00"}],
+        }
+
+        response = self.api.post(reverse("bookings_bulk"), payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Booking.objects.filter(client=self.client_user).count(), 2)
+        self.assertFalse(Booking.objects.filter(client=other).exists())
+
+        self.api.force_authenticate(self.crew)
+        response = self.api.post(reverse("bookings_bulk"), payload, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_slots_or_recurrence_is_required(self):
+        response = self.api.post(reverse("bookings_bulk"), self.booking_payload(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FreeCrewTests(BookingFixturesMixin, TestCase):
+    def setUp(self):
+        self.create_fixtures()
+        self.late = CrewMember.objects.create(email="late@example.com", username="late", category=CrewMember.PHOTOGRAPHER)
+        self.free = CrewMember.objects.create(email="free@example.com", username="free", category=CrewMember.PHOTOGRAPHER)
+        # Runs until 10:30, and from 11:00 to noon
+        for crew, start in ((self.crew, time(9, 30)), (self.late, time(11))):
+            Booking.objects.create(client=self.client_user, crew=crew, service=self.service, date=date(2030, 1, 1), time=start)
+        self.api = APIClient()
+
+    def free_crew(self, **params):
+        response = self.api.get(reverse("free_crew"), {"date": "2030-01-01", "all": "true", **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {crew["id"] for crew in response.data}
+
+    def test_bookings_overlapping_the_time_or_window_are_busy(self):
+        everyone = {str(self.crew.pk), str(self.late.pk), str(self.free.pk)}
+        self.assertEqual(self.free_crew(time="10:00"), everyone - {str(self.crew.pk)})
+        self.assertEqual(self.free_crew(time="08:30"), everyone)
+        self.assertEqual(self.free_crew(start_time="10:00", end_time="11:00"), everyone - {str(self.crew.pk)})
+        self.assertEqual(self.free_crew(start_time="10:30", end_time="11:30"), everyone - {str(self.late.pk)})
+        self.assertEqual(self.free_crew(start_time="00:00", end_time="09:30"), everyone)
+
+
+class CalendarFeedTests(BookingFixturesMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.create_fixtures()
+        Booking.objects.create(
+            client=self.client_user, crew=self.crew, service=self.service, date=date(2030, 1, 1), time=time(10),
+        )
+        self.api = APIClient()
+        self.api.force_authenticate(self.client_user)
+
+    def feed_path(self, method="get"):
+        url = getattr(self.api, method)(reverse("booking_calendar")).data["url"]
+        return url.removeprefix("http://testserver")
+
+    def test_feed_is_served_and_revalidated(self):
+        path = self.feed_path()
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        self.assertEqual(response.content.count(b"BEGIN:VEVENT"), 1)
+
+        # The token check and the aggregate
+        with self.assertNumQueries(2):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_bad_and_revoked_tokens_are_refused(self):
+        path = self.feed_path()
+        self.assertEqual(self.client.get(path.replace(".ics", "x.ics")).status_code, status.HTTP_404_NOT_FOUND)
+
+        new_path = self.feed_path("post")
+        self.assertNotEqual(new_path, path)
+        self.assertEqual(self.client.get(path).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(new_path).status_code, status.HTTP_200_OK)
+
+        self.client_user.is_active = False
+        self.client_user.save()
+        self.assertEqual(self.client.get(new_path).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConcurrentBookingTests(BookingFixturesMixin, TransactionTestCase):
+    attempts = 8
+
+    def setUp(self):
+        # Every thread needs its own connection to the same test database,
+        # which sqlite only gives with a file (see kopero.settings.test)
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("The test database is in memory")
+        self.create_fixtures()
+
+    def test_only_one_parallel_booking_wins(self):
+        barrier = threading.Barrier(self.attempts)
+        status_codes = []
+
+        def book():
+            api = APIClient()
+            api.force_authenticate(self.client_user)
+            try:
+                barrier.wait()
+                response = api.post(reverse("bookings"), self.booking_payload(), format="json")
+                status_codes.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book) for _ in range(self.attempts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(status_codes.count(status.HTTP_201_CREATED), 1)
+        self.assertEqual(status_codes.count(status.HTTP_400_BAD_REQUEST), self.attempts - 1)
+        self.assertEqual(Booking.objects.filter(crew=self.crew, date=date(2030, 1, 1), time=time(10)).count(), 1)
@@ -1,10 +1,17 @@
 from django.urls import path
-from .views import AvailableTimeView, BookingListView, BookingDetailView, cancel_booking, complete_booking, mark_as_paid
+from .views import AsyncAvailableTimeView, AsyncBookingListView, AvailableTimeView, BookingListView, BookingDetailView, BulkBookingView, CalendarFeedView, FreeCrewView, calendar_feed, cancel_booking, complete_booking, mark_as_paid
 
 urlpatterns = [
     path("", BookingListView.as_view(), name="bookings"),
+    path("bulk/", BulkBookingView.as_view(), name="bookings_bulk"),
     path("<uuid:pk>/", BookingDetailView.as_view(), name="booking"),
     path('available-times/<uuid:crew_id>/', AvailableTimeView.as_view(), name='available_time'),
+    # Native async versions of the read endpoints above, for ASGI servers
+    path("async/", AsyncBookingListView.as_view(), name="bookings_async"),
+    path('async/available-times/<uuid:crew_id>/', AsyncAvailableTimeView.as_view(), name='available_time_async'),
+    path('free-crew/', FreeCrewView.as_view(), name='free_crew'),
+    path('calendar/', CalendarFeedView.as_view(), name='booking_calendar'),
+    path('calendar/<str:token>.ics', calendar_feed, name='booking_calendar_feed'),
     path('<uuid:booking_id>/cancel/', cancel_booking, name='booking-cancel'),  # Cancel a booking
     path('<uuid:booking_id>/pay/', mark_as_paid, name='booking-pay'),  # Pay for a booking
     path('<uuid:booking_id>/complete/', complete_booking, name='booking-complete'),
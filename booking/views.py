@@ -1,6 +1,11 @@
 from datetime import date, timedelta
 import datetime
+from django.core.cache import cache
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from requests import Response
 from datetime import datetime
 from rest_framework import generics
@@ -9,26 +14,27 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from rest_framework.views import APIView
-from django.db.models import Q
-from booking.models import Booking, Review
+from django.db.models import Count, Exists, F, Max, OuterRef, Q
+from booking.calendar import calendar_etag, calendar_token, read_calendar_token, render_calendar
+from booking.models import Booking, CrewAvailability, Review
 from rest_framework.response import Response
-from booking.serializers import BookingSerializer, ReadBookingSerializer, ReviewSerializer
-from common.views import ImageBaseListView, BaseDetailView, BaseListView
+from booking.serializers import BookingSerializer, BulkBookingSerializer, ReadBookingSerializer, ReviewSerializer
+from common.views import AsyncAPIView, AsyncListView, ImageBaseListView, BaseDetailView, BaseListView
+from kopero_auth.models import BaseUser, CrewMember
+from kopero_auth.serializers import ReadCrewSerializer
 
-class BookingListView(BaseListView):
+class BookingQuerysetMixin:
     """
-    Handles requests pertaining to all bookings
+    Narrows the bookings to the logged-in user's and applies the list filters
     """
-    permission_classes = [IsAuthenticated]
-    model = Booking
-    read_serializer_class = ReadBookingSerializer
-    serializer_class = BookingSerializer
-    
+
     def get_queryset(self):
         queryset = super().get_queryset()
         user = self.request.user  # Get the logged-in user
 
-        queryset = queryset.filter(Q(client=user) | Q(crew=user))
+        queryset = queryset.filter(Q(client_id=user.pk) | Q(crew_id=user.pk))
+        # Load everything ReadBookingSerializer renders in the same query
+        queryset = queryset.select_related('service', 'crew', 'client')
         
         q = self.request.GET.get("q", None)
         status_filter = self.request.GET.get("status", None)
@@ -54,11 +60,23 @@ class BookingListView(BaseListView):
 
         return queryset
 
+
+class BookingListView(BookingQuerysetMixin, BaseListView):
+    """
+    Handles requests pertaining to all bookings
+    """
+    permission_classes = [IsAuthenticated]
+    model = Booking
+    read_serializer_class = ReadBookingSerializer
+    serializer_class = BookingSerializer
+
     def get(self, request):
         queryset = self.get_queryset()
         all_status = request.GET.get("all", None)
 
         if all_status is not None:
+            if self.is_streaming_export(request):
+                return self.stream_queryset(queryset, self.get_read_serializer_class(), context={"request": request})
             serializer = self.get_read_serializer_class()(queryset, many=True, context={"request": request})
             return Response(serializer.data)
         else:
@@ -78,6 +96,32 @@ class BookingListView(BaseListView):
         booking.delete()
         return Response({"detail": "Booking deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
 
+
+class AsyncBookingListView(BookingQuerysetMixin, AsyncListView):
+    """
+    BookingListView's GET running on the event loop with the async ORM
+    """
+    permission_classes = [IsAuthenticated]
+    model = Booking
+    read_serializer_class = ReadBookingSerializer
+
+
+class BulkBookingView(APIView):
+    """
+    Books a list of slots or a recurring session with one crew member
+    and reports the slots that could not be booked
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkBookingSerializer(data=request.data, context={"request": request})
+        if serializer.is_valid():
+            result = serializer.save()
+            response_status = status.HTTP_201_CREATED if result['created'] else status.HTTP_400_BAD_REQUEST
+            return Response(serializer.data, status=response_status)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 class BookingDetailView(BaseDetailView):
     """
     Handles requests pertaining to specific booking
@@ -86,16 +130,28 @@ class BookingDetailView(BaseDetailView):
     model = Booking
     read_serializer_class = ReadBookingSerializer
     serializer_class = BookingSerializer
+    # The review prompt in the response depends on the review as well
+    last_modified_fields = ('updated_at', 'review__updated_at')
+
+    def get_queryset(self, request):
+        return self.model.objects.alive().select_related('service', 'crew', 'client', 'review')
+
+    def get_validator_queryset(self, request):
+        # Other users' bookings get their 403 from the handler, not a 304 or 412
+        return self.model.objects.alive().filter(client_id=request.user.pk)
 
     def get(self, request, pk):
         booking = self.get_object(request, pk) 
         
         # Check if the user is the client who made the booking
-        if request.user != booking.client:
+        if request.user.pk != booking.client_id:
             return Response({"detail": "You do not have permission to view this booking."}, status=status.HTTP_403_FORBIDDEN)
 
         # If the booking is marked as served and the user hasn't reviewed yet, provide the option to review
-        reviewed = Review.objects.filter(booking=booking, client=request.user).exists()
+        try:
+            reviewed = booking.review.client_id == request.user.pk
+        except Review.DoesNotExist:
+            reviewed = False
         
         if booking.status == 'served' and not reviewed:
             review_message = "Submit a review."
@@ -128,19 +184,19 @@ class BookingDetailView(BaseDetailView):
         if booking.status != 'served':
             return Response({"detail": "You cannot review a booking until served."}, status=status.HTTP_400_BAD_REQUEST)
 
-        review_exists = Review.objects.filter(booking=booking, client=request.user).exists()
+        review_exists = Review.objects.filter(booking=booking, client_id=request.user.pk).exists()
         if review_exists:
             return Response({"detail": "You have already submitted a review for this booking."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Ensure the photographer cannot review themselves
-        if request.user == booking.crew:
+        if request.user.pk == booking.crew_id:
             return Response({"detail": "Crew members cannot review their own bookings."}, status=status.HTTP_403_FORBIDDEN)
 
         # Create a new review
         review_data = {
             'booking': booking.id,
             'client': request.user.id,
-            'crew': booking.crew.id,
+            'crew': booking.crew_id,
             'rating': request.data.get('rating'),
         }
         review_serializer = ReviewSerializer(data=review_data)
@@ -161,7 +217,7 @@ class ReviewListView(BaseListView):
 
     def get_queryset(self):
         user = self.request.user
-        return Review.objects.filter(client=user)
+        return Review.objects.filter(client_id=user.pk)
 
     def perform_create(self, serializer):
         booking_id = self.request.data.get('booking')
@@ -170,33 +226,62 @@ class ReviewListView(BaseListView):
         except Booking.DoesNotExist:
             return Response({"detail": "Booking does not exist."}, status=404)
 
-        if booking.client != self.request.user:
+        if booking.client_id != self.request.user.pk:
             return Response({"detail": "You cannot review this booking."}, status=403)
 
         serializer.save(client=self.request.user, crew=booking.crew)
 
 
-class AvailableTimeView(APIView):
+class AvailableTimeMixin:
     """
-    View for picking date and time to be used for booking
+    Parsing and slot computation shared by the sync and async available
+    time views. The parse methods raise ValueError with the message to
+    answer with.
     """
-    def get(self, request, crew_id):
+    max_range_days = 62
+
+    def parse_date(self, request):
         date = request.query_params.get('date')
         if not date:
-            return Response({"error": "Date parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
-
+            raise ValueError("Date parameter is required.")
         # Parse the date string into a date object
         try:
-            selected_date = datetime.strptime(date, '%Y-%m-%d').date()
+            return datetime.strptime(date, '%Y-%m-%d').date()
         except ValueError:
-            return Response({"error": "Invalid date format. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+            raise ValueError("Invalid date format. Use YYYY-MM-DD.")
 
-        # Fetch booked times for the crew member on the specified date
-        booked_times = Booking.objects.filter(
+    def parse_range(self, request):
+        """Returns the `from` date and the number of days up to `to`."""
+        try:
+            start_date = datetime.strptime(request.query_params.get('from', ''), '%Y-%m-%d').date()
+            end_date = datetime.strptime(request.query_params.get('to', ''), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError("Both from and to are required. Use YYYY-MM-DD.")
+
+        days = (end_date - start_date).days + 1
+        if days < 1:
+            raise ValueError("The from date must not be after the to date.")
+        if days > self.max_range_days:
+            raise ValueError(f"Date range cannot exceed {self.max_range_days} days.")
+        return start_date, days
+
+    def is_range_request(self, request):
+        return bool(request.query_params.get('from') or request.query_params.get('to'))
+
+    def booked_times_queryset(self, crew_id, selected_date):
+        return Booking.objects.alive().filter(
+            crew_id=crew_id,
+            date=selected_date,
+        ).exclude(status='canceled').values_list('time', flat=True)  # Get a flat list of booked times
+
+    def booked_slots_queryset(self, crew_id, start_date, days):
+        # One indexed read for the whole range, days without a row are fully free
+        return CrewAvailability.objects.filter(
             crew_id=crew_id,
-            date=selected_date
-        ).values_list('time', flat=True)  # Get a flat list of booked times
+            date__range=(start_date, start_date + timedelta(days=days - 1))
+        ).values_list('date', 'booked_slots')
 
+    def free_hours(self, selected_date, booked_times):
         # Define working hours
         working_start = datetime.combine(selected_date, datetime.strptime('00:00:00', '%H:%M:%S').time())
         working_end = datetime.combine(selected_date, datetime.strptime('23:59:59', '%H:%M:%S').time())
@@ -215,17 +300,203 @@ class AvailableTimeView(APIView):
                     'end_time': (current_time + timedelta(hours=1)).strftime('%H:%M')
                 })
             current_time += timedelta(hours=1)
+        return available_times
+
+    def free_days(self, start_date, days, booked_slots):
+        available_times = {}
+        for offset in range(days):
+            day = start_date + timedelta(days=offset)
+            available_times[day.isoformat()] = CrewAvailability.available_slots(booked_slots.get(day, 0))
+        return available_times
+
+
+class AvailableTimeView(AvailableTimeMixin, APIView):
+    """
+    View for picking date and time to be used for booking.
+    Pass `date` for a single day, or `from` and `to` for a range of days
+    answered from the crew availability index.
+    """
+
+    def get(self, request, crew_id):
+        try:
+            if self.is_range_request(request):
+                start_date, days = self.parse_range(request)
+                booked_slots = dict(self.booked_slots_queryset(crew_id, start_date, days))
+                return Response(self.free_days(start_date, days, booked_slots), status=status.HTTP_200_OK)
+            selected_date = self.parse_date(request)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Fetch booked times for the crew member on the specified date
+        booked_times = list(self.booked_times_queryset(crew_id, selected_date))
+        return Response(self.free_hours(selected_date, booked_times), status=status.HTTP_200_OK)
+
+
+class AsyncAvailableTimeView(AvailableTimeMixin, AsyncAPIView):
+    """
+    AvailableTimeView running on the event loop with the async ORM
+    """
+
+    async def get(self, request, crew_id):
+        try:
+            if self.is_range_request(request):
+                start_date, days = self.parse_range(request)
+                booked_slots = {day: slots async for day, slots in self.booked_slots_queryset(crew_id, start_date, days)}
+                return Response(self.free_days(start_date, days, booked_slots), status=status.HTTP_200_OK)
+            selected_date = self.parse_date(request)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        booked_times = [time async for time in self.booked_times_queryset(crew_id, selected_date)]
+        return Response(self.free_hours(selected_date, booked_times), status=status.HTTP_200_OK)
+
+
+# Bookings take one hourly slot
+BOOKING_LENGTH = timedelta(hours=1)
+
+
+def overlapping_bookings(day, start_time, end_time=None):
+    """
+    Filter for the bookings of `day` that overlap the window from
+    `start_time` to `end_time`, or to one booking length later.
+    """
+    start = datetime.combine(day, start_time)
+    end = datetime.combine(day, end_time) if end_time else start + BOOKING_LENGTH
+    overlapping = Q(date=day)
+    # A booking that starts up to a booking length before the window still runs into it
+    earliest = start - BOOKING_LENGTH
+    if earliest.date() == day:
+        overlapping &= Q(time__gt=earliest.time())
+    if end.date() == day:
+        overlapping &= Q(time__lt=end.time())
+    return overlapping
+
+
+class FreeCrewView(generics.GenericAPIView):
+    """
+    Lists the crew members that are free on a date for one booking at a
+    `time`, or for the whole window between `start_time` and `end_time`,
+    best rated first.
+    """
+    serializer_class = ReadCrewSerializer
+
+    def get_queryset(self, crew_filter, booking_filter):
+        # Anti-join against the (date, time, crew) index of the bookings table
+        busy = Booking.objects.alive().filter(
+            booking_filter,
+            crew=OuterRef('pk'),
+        ).exclude(status='canceled')
+
+        return CrewMember.objects.alive().filter(
+            is_active=True,
+            **crew_filter
+        ).exclude(Exists(busy)).order_by('-average_rating', 'id')
+
+    def get(self, request):
+        date = request.query_params.get('date')
+        if not date:
+            return Response({"error": "Date parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            selected_date = datetime.strptime(date, '%Y-%m-%d').date()
+            if request.query_params.get('time'):
+                selected_time = datetime.strptime(request.query_params['time'], '%H:%M').time()
+                booking_filter = overlapping_bookings(selected_date, selected_time)
+            elif request.query_params.get('start_time') and request.query_params.get('end_time'):
+                start_time = datetime.strptime(request.query_params['start_time'], '%H:%M').time()
+                end_time = datetime.strptime(request.query_params['end_time'], '%H:%M').time()
+                if start_time >= end_time:
+                    return Response({"error": "start_time must be before end_time."}, status=status.HTTP_400_BAD_REQUEST)
+                booking_filter = overlapping_bookings(selected_date, start_time, end_time)
+            else:
+                return Response({"error": "Either time or start_time and end_time are required."}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError:
+            return Response({"error": "Invalid date or time format. Use YYYY-MM-DD and HH:MM."}, status=status.HTTP_400_BAD_REQUEST)
+
+        crew_filter = {}
+        category = request.query_params.get('category')
+        if category is not None:
+            crew_filter['category'] = category
+
+        queryset = self.get_queryset(crew_filter, booking_filter)
+        if request.query_params.get('all') is not None:
+            serializer = self.get_serializer(queryset, many=True)
+            return Response(serializer.data)
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class CalendarFeedView(APIView):
+    """
+    Returns the private iCalendar feed URL of the logged in client or crew
+    member. POST revokes the current URL and returns a new one.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        version = BaseUser.objects.filter(pk=request.user.pk).values_list('calendar_token_version', flat=True).first()
+        return self.feed_url(request, version or 0)
+
+    def post(self, request):
+        users = BaseUser.objects.filter(pk=request.user.pk)
+        users.update(calendar_token_version=F('calendar_token_version') + 1)
+        return self.feed_url(request, users.values_list('calendar_token_version', flat=True).first() or 0)
+
+    def feed_url(self, request, version):
+        path = reverse('booking_calendar_feed', args=[calendar_token(request.user.pk, version)])
+        return Response({"url": request.build_absolute_uri(path)}, status=status.HTTP_200_OK)
+
+
+CALENDAR_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def calendar_feed(request, token):
+    """
+    Serves the bookings of a client or crew member as an iCalendar feed.
+    Unchanged feeds are answered with a 304 after checking the token and
+    one aggregate query, and rendered feeds are cached under their ETag,
+    so they are only rebuilt after one of the user's bookings changes.
+    """
+    issued_for = read_calendar_token(token)
+    if issued_for is None:
+        raise Http404("Calendar not found.")
+    user_id, version = issued_for
+    # Revoked tokens and users that can no longer sign in get no feed
+    if not BaseUser.objects.alive().filter(pk=user_id, is_active=True, calendar_token_version=version).exists():
+        raise Http404("Calendar not found.")
+
+    bookings = Booking.objects.alive().filter(Q(client_id=user_id) | Q(crew_id=user_id))
+    state = bookings.aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    etag = calendar_etag(user_id, state['last_modified'], state['count'])
+    last_modified = int(state['last_modified'].timestamp()) if state['last_modified'] else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        cache_key = f'booking-calendar:{user_id}:{etag}'
+        body = cache.get(cache_key)
+        if body is None:
+            body = render_calendar(
+                bookings.select_related('service', 'crew', 'client').order_by('date', 'time'),
+                "Kopero Studios bookings",
+            )
+            cache.set(cache_key, body, CALENDAR_CACHE_TIMEOUT)
+        response = HttpResponse(body, content_type='text/calendar; charset=utf-8')
+
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
-        return Response(available_times, status=status.HTTP_200_OK)
-    
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def cancel_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
-    print(f"Request User: {request.user}, Booking Client: {booking.client}")
     # Only the client can cancel the booking
-    if booking.client.email != request.user.email:
+    if booking.client_id != request.user.pk:
         return Response({"detail": "You do not have permission to cancel this booking."}, status=403)
 
     # Update the booking status
@@ -236,7 +507,7 @@ def cancel_booking(request, booking_id):
 @permission_classes([IsAuthenticated])
 def mark_as_paid(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
-    if booking.crew.email != request.user.email:
+    if booking.crew_id != request.user.pk:
         return Response({"detail": "You do not have permission to mark this booking as paid."}, status=403)
 
     booking.mark_as_paid()
@@ -248,7 +519,7 @@ def complete_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
 
     # Only the crew can complete the booking
-    if booking.crew.email != request.user.email:
+    if booking.crew_id != request.user.pk:
         return Response({"detail": "You do not have permission to complete this booking."}, status=403)
 
     booking.update_status('completed')
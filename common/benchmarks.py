@@ -0,0 +1,169 @@
+import asyncio
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def isolated_database(keepdb=False):
+    """
+    Runs the enclosed block against a throwaway test database so that
+    benchmarks can seed data without touching the configured database.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+@contextmanager
+def prepared(func, setup=None):
+    """Yields `func` ready to be called, given the value of `setup()` when there is one."""
+    if setup is None:
+        yield func
+    else:
+        with setup() as value:
+            yield lambda: func(value)
+
+
+def measure(func, repeat=20, warmup=2, setup=None):
+    """
+    Calls `func` `repeat` times and returns latency percentiles in
+    milliseconds together with the number of queries per call.
+
+    With `setup`, a context manager factory, every call runs inside its
+    own `with setup() as value` block and is passed `value`. The setup is
+    neither timed nor counted.
+    """
+    for _ in range(warmup):
+        with prepared(func, setup) as call:
+            call()
+
+    timings = []
+    query_count = 0
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(repeat):
+            with prepared(func, setup) as call:
+                before = len(queries)
+                start = time.perf_counter()
+                call()
+                timings.append((time.perf_counter() - start) * 1000)
+                query_count += len(queries) - before
+
+    timings.sort()
+    return {
+        "calls": repeat,
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "queries_per_call": round(query_count / repeat, 2),
+    }
+
+
+def peak_memory(func, setup=None):
+    """
+    Calls `func` once while tracing allocations and returns the peak of
+    the memory it held at once, in KiB. `setup` is as for `measure`.
+    """
+    with prepared(func, setup) as call:
+        tracemalloc.start()
+        try:
+            call()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def read_response(reader):
+    """Reads one HTTP/1.1 response and returns its status and whether the connection stays open."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by the server")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return int(status_line.split()[1]), headers.get('connection', '').lower() != 'close'
+
+
+async def load_connection(host, port, request, deadline, timings, errors):
+    """Sends `request` over one keep-alive connection until `deadline`."""
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            errors.append(None)
+            status, keep_alive = None, False
+        else:
+            if status < 400:
+                timings.append((time.perf_counter() - start) * 1000)
+            else:
+                errors.append(status)
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load_test(host, port, path, connections=500, duration=10, headers=None):
+    """
+    Keeps `connections` concurrent keep-alive connections busy with GET
+    requests for `path` during `duration` seconds and returns the request
+    rate and latency percentiles in milliseconds.
+    """
+    lines = [f'GET {path} HTTP/1.1', f'Host: {host}:{port}', 'Accept: application/json']
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    timings, errors = [], []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        load_connection(host, port, request, deadline, timings, errors) for _ in range(connections)
+    ))
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    return {
+        "connections": connections,
+        "requests": len(timings),
+        "errors": len(errors),
+        "requests_per_second": round(len(timings) / elapsed, 1),
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+    }
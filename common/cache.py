@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.http import parse_etags
+
+
+def is_process_local(alias):
+    """Whether the cache `alias` lives in this process only, so other workers never see its writes."""
+    return isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+class LRUCache:
+    """
+    Small thread-safe in-process least recently used cache, whose entries
+    expire after `timeout` seconds when one is given
+    """
+
+    def __init__(self, maxsize=256, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class VersionedCache:
+    """
+    Two tier read-through cache whose entries are invalidated all at once
+    by bumping a version number.
+
+    Entries are kept in an in-process LRU and, optionally, in a shared
+    Django cache so other workers can reuse them. The version lives in the
+    shared cache and is part of every entry key, so bumping it from any
+    process retires every tier without having to delete anything. Entries
+    may also belong to a scope with its own version, which is bumped to
+    retire just that part of the cache.
+
+    Concurrent misses for the same entry are coalesced: threads of a worker
+    wait on a lock and, with a shared tier, workers wait for the one that
+    holds the rebuild lock in the shared cache. The `a` prefixed methods are
+    the same for async views, where only the shared rebuild lock applies.
+
+    A process-local backend (locmem, dummy) keeps the version per worker,
+    so a bump only reaches the worker that made it. The shared tier is
+    skipped for such backends and entries of the in-process LRU expire
+    after `local_timeout` seconds, which bounds how long other workers
+    serve stale entries.
+
+    Entries are built from the primary database even when the request
+    reads from a replica.
+    """
+
+    lock_stripes = 64
+    rebuild_poll_interval = 0.05
+
+    def __init__(self, namespace, alias='default', local_size=256, shared=True, timeout=None, rebuild_timeout=5,
+                 local_timeout=None):
+        self.namespace = namespace
+        self.alias = alias
+        self._shared = shared
+        self.timeout = timeout
+        self.rebuild_timeout = rebuild_timeout
+        self.local = LRUCache(local_size, local_timeout)
+        self._locks = [threading.Lock() for _ in range(self.lock_stripes)]
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @property
+    def shared(self):
+        return self._shared and not is_process_local(self.alias)
+
+    def version_key(self, scope=None):
+        if scope is None:
+            return f'{self.namespace}:version'
+        return f'{self.namespace}:version:{scope}'
+
+    def get_version(self, scope=None):
+        keys = [self.version_key()]
+        if scope is not None:
+            keys.append(self.version_key(scope))
+
+        versions = self.backend.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # Start from the clock so a version lost to eviction can never
+                # come back with a number that stale entries were stored under
+                self.backend.add(key, time.time_ns(), timeout=None)
+                versions[key] = self.backend.get(key, time.time_ns())
+        return '.'.join(str(versions[key]) for key in keys)
+
+    async def aget_version(self, scope=None):
+        keys = [self.version_key()]
+        if scope is not None:
+            keys.append(self.version_key(scope))
+
+        versions = await self.backend.aget_many(keys)
+        for key in keys:
+            if key not in versions:
+                await self.backend.aadd(key, time.time_ns(), timeout=None)
+                versions[key] = await self.backend.aget(key, time.time_ns())
+        return '.'.join(str(versions[key]) for key in keys)
+
+    def bump(self, scope=None):
+        key = self.version_key(scope)
+        try:
+            return self.backend.incr(key)
+        except ValueError:
+            version = time.time_ns()
+            self.backend.set(key, version, timeout=None)
+            return version
+
+    def make_key(self, key, version):
+        return f'{self.namespace}:{version}:{key}'
+
+    def etag(self, key, version):
+        digest = hashlib.md5(self.make_key(key, version).encode(), usedforsecurity=False).hexdigest()
+        return f'"{digest}"'
+
+    def build(self, default):
+        # Entries outlive replica lag, a replica could fill a bumped version
+        # with the rows it was bumped for missing
+        from common.routers import primary_reads
+        with primary_reads():
+            return default()
+
+    async def abuild(self, default):
+        from common.routers import primary_reads
+        with primary_reads():
+            return await default()
+
+    def get_or_set(self, key, default, version=None, scope=None):
+        """Returns the cached value of `key`, calling `default()` to build it on a miss."""
+        if version is None:
+            version = self.get_version(scope)
+        full_key = self.make_key(key, version)
+
+        value = self.local.get(full_key)
+        if value is not None:
+            return value
+
+        with self._locks[hash(full_key) % self.lock_stripes]:
+            # Another thread may have built the entry while we waited
+            value = self.local.get(full_key)
+            if value is None:
+                value = self._get_shared(full_key, default) if self.shared else self.build(default)
+                self.local.set(full_key, value)
+        return value
+
+    def _get_shared(self, full_key, default):
+        value = self.backend.get(full_key)
+        if value is not None:
+            return value
+
+        lock_key = f'{full_key}:rebuild'
+        if self.backend.add(lock_key, 1, timeout=self.rebuild_timeout):
+            try:
+                value = self.build(default)
+                self.backend.set(full_key, value, timeout=self.timeout)
+            finally:
+                self.backend.delete(lock_key)
+            return value
+
+        # Another worker is rebuilding the entry, wait for it rather than
+        # rebuilding it again, but never longer than the rebuild timeout
+        deadline = time.monotonic() + self.rebuild_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.rebuild_poll_interval)
+            value = self.backend.get(full_key)
+            if value is not None:
+                return value
+        return self.build(default)
+
+    async def aget_or_set(self, key, default, version=None, scope=None):
+        """`get_or_set` for async callers, `default` is a coroutine function."""
+        if version is None:
+            version = await self.aget_version(scope)
+        full_key = self.make_key(key, version)
+
+        value = self.local.get(full_key)
+        if value is None:
+            value = await self._aget_shared(full_key, default) if self.shared else await self.abuild(default)
+            self.local.set(full_key, value)
+        return value
+
+    async def _aget_shared(self, full_key, default):
+        value = await self.backend.aget(full_key)
+        if value is not None:
+            return value
+
+        lock_key = f'{full_key}:rebuild'
+        if await self.backend.aadd(lock_key, 1, timeout=self.rebuild_timeout):
+            try:
+                value = await self.abuild(default)
+                await self.backend.aset(full_key, value, timeout=self.timeout)
+            finally:
+                await self.backend.adelete(lock_key)
+            return value
+
+        deadline = time.monotonic() + self.rebuild_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.rebuild_poll_interval)
+            value = await self.backend.aget(full_key)
+            if value is not None:
+                return value
+        return await self.abuild(default)
+
+
+def etag_matches(request, etag):
+    """Whether the request's If-None-Match header matches `etag`."""
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    etags = parse_etags(header)
+    return '*' in etags or etag.removeprefix('W/') in {tag.removeprefix('W/') for tag in etags}
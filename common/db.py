@@ -0,0 +1,37 @@
+from django.db import connections
+
+
+def pool_stats():
+    """
+    Returns the stats of this process's connection pool for every database
+    alias configured with one, once the pool was opened by a first query.
+    Counters are totals since the pool opened, so a scraper can turn them
+    into rates.
+    """
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if not pool or pool.closed:
+            continue
+        raw = pool.get_stats()
+        size, available = raw.get('pool_size', 0), raw.get('pool_available', 0)
+        checkouts, wait_ms = raw.get('requests_num', 0), raw.get('requests_wait_ms', 0)
+        stats[alias] = {
+            'min_size': raw.get('pool_min', 0),
+            'max_size': raw.get('pool_max', 0),
+            'size': size,
+            'available': available,
+            'in_use': size - available,
+            'waiting': raw.get('requests_waiting', 0),
+            'checkouts': checkouts,
+            'checkouts_queued': raw.get('requests_queued', 0),
+            'checkout_errors': raw.get('requests_errors', 0),
+            # Time checkouts spent queued for a free connection, averaged over
+            # every checkout; the health check of a connection is not included
+            'queue_wait_ms_total': wait_ms,
+            'queue_wait_ms_avg': round(wait_ms / checkouts, 3) if checkouts else 0.0,
+            'connections_opened': raw.get('connections_num', 0),
+            'connections_lost': raw.get('connections_lost', 0),
+            'connections_bad': raw.get('returns_bad', 0),
+        }
+    return stats
@@ -0,0 +1,180 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Encoder options per output format, keyed by file extension
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+def variant_path(name, variant, extension, content):
+    """
+    Returns where the `variant` of the image stored at `name` is written.
+    The name carries a hash of the content so it can be cached forever.
+    """
+    root, _ = os.path.splitext(name)
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f"variants/{root}/{variant}.{digest}.{extension}"
+
+
+def variant_paths(variants):
+    return {
+        entry[extension]
+        for variant, entry in variants.items() if variant != 'source'
+        for extension in FORMATS if extension in entry
+    }
+
+
+def generate_variants(field_file, sizes=None):
+    """
+    Writes a resized WebP and JPEG copy of the image in `field_file` for
+    every variant in `sizes` (the longest edge in pixels) and returns the
+    map stored in the model's `image_variants`.
+    """
+    sizes = sizes or settings.IMAGE_VARIANTS['SIZES']
+    storage, name = field_file.storage, field_file.name
+    largest = max(sizes.values())
+
+    with storage.open(name) as source:
+        image = Image.open(source)
+        # Let the JPEG decoder skip the detail the largest variant drops
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+
+    variants = {'source': name}
+    # Each variant is scaled down from the previous, larger one
+    for variant, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+        image = image.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        entry = {'width': image.width, 'height': image.height}
+        for extension, options in FORMATS.items():
+            output = image if extension == 'webp' or image.mode == 'RGB' else image.convert('RGB')
+            buffer = io.BytesIO()
+            output.save(buffer, **options)
+            content = buffer.getvalue()
+            path = variant_path(name, variant, extension, content)
+            # The same content hash means the same bytes are already there
+            entry[extension] = path if storage.exists(path) else storage.save(path, ContentFile(content))
+        variants[variant] = entry
+    return variants
+
+
+def needs_variants(instance, field='image'):
+    field_file = getattr(instance, field)
+    return bool(field_file) and instance.image_variants.get('source') != field_file.name
+
+
+def refresh_variants(model, pk, field='image', force=False):
+    """
+    Generates the variants of one object's image and stores them, unless the
+    image was replaced in the meantime. Variants that are no longer used are
+    deleted.
+    """
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None or not getattr(instance, field) or not (force or needs_variants(instance, field)):
+        return False
+
+    field_file = getattr(instance, field)
+    variants = generate_variants(field_file)
+    current = model._default_manager.filter(pk=pk).values_list(field, flat=True).first()
+    if current != variants['source']:
+        return False
+    stale = variant_paths(instance.image_variants) - variant_paths(variants)
+    instance.image_variants = variants
+    # A regular save so the caches listening to the model are invalidated
+    instance.save(update_fields=['image_variants'])
+    for path in stale:
+        field_file.storage.delete(path)
+    return True
+
+
+class ImageVariantPool:
+    """
+    Bounded thread pool generating image variants after uploads commit.
+    Pillow releases the GIL while resizing and encoding, so the variants are
+    built next to the request workers without holding them. With no workers
+    configured, variants are generated inline.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def get_executor(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image-variants')
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, model, pk, field):
+        close_old_connections()
+        try:
+            refresh_variants(model, pk, field)
+        except Exception:
+            logger.exception("Could not generate image variants for %s %s", model._meta.label, pk)
+        finally:
+            close_old_connections()
+
+    def schedule(self, instance, field='image'):
+        """Generates the variants of `instance` once the current transaction commits."""
+        if not needs_variants(instance, field):
+            return
+        model, pk = type(instance), instance.pk
+        if not self.workers:
+            transaction.on_commit(lambda: refresh_variants(model, pk, field))
+        else:
+            transaction.on_commit(lambda: self.get_executor().submit(self.run, model, pk, field))
+
+
+image_variants = ImageVariantPool(settings.IMAGE_VARIANTS['WORKERS'])
+
+
+def image_variant_models():
+    return [apps.get_model(label) for label in settings.IMAGE_VARIANTS['MODELS']]
+
+
+def image_srcset(instance, request=None, field='image'):
+    """
+    Returns the URLs of the variants of `instance`'s image by variant and
+    format, with a srcset string per format, or None until they exist.
+    """
+    field_file = getattr(instance, field)
+    variants = instance.image_variants
+    if not field_file or variants.get('source') != field_file.name:
+        return None
+
+    def url(path):
+        location = field_file.storage.url(path)
+        return request.build_absolute_uri(location) if request is not None else location
+
+    sizes = {variant: entry for variant, entry in variants.items() if variant != 'source'}
+    data = {
+        variant: dict(entry, **{extension: url(entry[extension]) for extension in FORMATS})
+        for variant, entry in sizes.items()
+    }
+    data['srcset'] = {
+        extension: ', '.join(
+            f"{entry[extension]} {entry['width']}w"
+            for entry in sorted(data.values(), key=lambda entry: entry['width'])
+        )
+        for extension in FORMATS
+    }
+    return data
@@ -0,0 +1,150 @@
+import contextlib
+import datetime
+import smtplib
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from common.models import OutboundEmail
+
+
+def enqueue_email(subject, message, from_email, recipient_list, html_message=None, **kwargs):
+    """
+    Drop-in replacement for `django.core.mail.send_mail` that stores the
+    email in the outbox with a single insert instead of talking to SMTP.
+    """
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient_list),
+        alternatives=[(html_message, 'text/html')] if html_message else [],
+    )
+
+
+def enqueue_message(message):
+    """Stores an `EmailMessage` in the outbox."""
+    return OutboundEmail.objects.create(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+        headers=dict(message.extra_headers),
+        alternatives=[list(alternative) for alternative in getattr(message, 'alternatives', [])],
+    )
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.to,
+        cc=email.cc,
+        bcc=email.bcc,
+        reply_to=email.reply_to,
+        headers=email.headers,
+        connection=connection,
+    )
+    for content, mimetype in email.alternatives:
+        message.attach_alternative(content, mimetype)
+    return message
+
+
+class OutboxSender:
+    """
+    Drains the email outbox in batches over one reused connection.
+
+    A batch is claimed by pushing `next_attempt_at` a lease into the future,
+    with rows locked by another worker skipped, so several workers can run
+    at once and an email claimed by a worker that died is picked up again
+    once its lease expires. Failed sends are retried with exponential
+    backoff until `max_attempts`, then marked as failed.
+    """
+
+    def __init__(self, batch_size=50, max_attempts=5, backoff=60, max_backoff=60 * 60, lease=300, connection=None):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.connection = connection or get_connection()
+
+    def claim(self):
+        now = timezone.now()
+        with transaction.atomic():
+            emails = list(
+                OutboundEmail.objects.select_for_update(skip_locked=True)
+                .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')[:self.batch_size]
+            )
+            OutboundEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+                attempts=F('attempts') + 1,
+                next_attempt_at=now + datetime.timedelta(seconds=self.lease),
+            )
+        for email in emails:
+            email.attempts += 1
+        return emails
+
+    def retry_delay(self, attempts):
+        return datetime.timedelta(seconds=min(self.backoff * 2 ** (attempts - 1), self.max_backoff))
+
+    def open_connection(self):
+        """Opens the connection, returning the error that prevented it, if any."""
+        try:
+            self.connection.open()
+        except Exception as error:
+            return repr(error)
+        return None
+
+    def send_batch(self):
+        """Sends one batch and returns the number of (sent, failed) emails."""
+        emails = self.claim()
+        if not emails:
+            return 0, 0
+
+        sent, failed = [], []
+        try:
+            connection_error = self.open_connection()
+            for email in emails:
+                if connection_error is not None:
+                    # Without a connection the rest of the batch is retried later
+                    email.last_error = connection_error
+                    failed.append(email)
+                    continue
+                try:
+                    self.connection.send_messages([build_message(email, self.connection)])
+                except Exception as error:
+                    # Any error, even one building the message, only fails this email
+                    email.last_error = repr(error)
+                    failed.append(email)
+                    if isinstance(error, smtplib.SMTPServerDisconnected):
+                        # Reconnect for the rest of the batch
+                        with contextlib.suppress(Exception):
+                            self.connection.close()
+                        connection_error = self.open_connection()
+                else:
+                    sent.append(email)
+        finally:
+            # Emails left unrecorded are sent again once their lease expires
+            self.record(sent, failed)
+        return len(sent), len(failed)
+
+    def record(self, sent, failed):
+        now = timezone.now()
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in sent]).update(
+            status=OutboundEmail.SENT, sent_at=now, last_error='',
+        )
+        for email in failed:
+            if email.attempts >= self.max_attempts:
+                email.status = OutboundEmail.FAILED
+            else:
+                email.next_attempt_at = now + self.retry_delay(email.attempts)
+        OutboundEmail.objects.bulk_update(failed, ['status', 'next_attempt_at', 'last_error'])
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,411 @@
+import json
+import random
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import date, time, timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.test import APIClient
+from common.benchmarks import isolated_database, measure, peak_memory
+
+BENCHMARKED_URLCONFS = ('booking.urls', 'services.urls', 'kopero_auth.urls')
+# The router's API root is shadowed by the service list, which shares its path
+UNREACHABLE_ROUTES = {'api-root'}
+PASSWORD = 'benchmark-pass'
+HOURS = range(8, 20)
+DAYS = range(-365, 365)
+
+
+def route_names(patterns):
+    """Names of the routes of a urlconf, included urlconfs too."""
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= route_names(pattern.url_patterns)
+        elif pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def random_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def insert_users(model, users, batch_size):
+    """
+    bulk_create for users, which are stored in two tables with multi-table
+    inheritance: the BaseUser rows are bulk created and the rows of the
+    child table inserted with executemany.
+    """
+    from kopero_auth.models import BaseUser
+
+    parent_fields = BaseUser._meta.concrete_fields
+    BaseUser.objects.bulk_create(
+        [BaseUser(**{field.attname: getattr(user, field.attname) for field in parent_fields}) for user in users],
+        batch_size=batch_size,
+    )
+    fields = model._meta.local_concrete_fields
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(field.pre_save(user, True), connection) for field in fields]
+            for user in users
+        ])
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a throwaway database with a large, reproducible dataset and benchmark every route of '
+        'the booking, services and auth apps in-process, reporting latency percentiles, queries and '
+        'peak memory per request as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=1_000_000)
+        parser.add_argument('--clients', type=int, default=50_000)
+        parser.add_argument('--crew', type=int, default=500)
+        parser.add_argument('--reviews', type=int, default=200_000)
+        parser.add_argument('--services', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42, help='Seed of the generated dataset')
+        parser.add_argument('--anchor', type=date.fromisoformat, default=date(2030, 1, 1),
+                            help='Day the seeded bookings are centered on, the year around it is booked')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per insert while seeding')
+        parser.add_argument('--repeat', type=int, default=20, help='Measured requests per endpoint')
+        parser.add_argument('--only', help='Only benchmark the endpoints whose name contains this')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database, and its dataset, for the next run')
+        parser.add_argument('--output', help='Also write the results to this file')
+        parser.add_argument('--baseline', help='Results of an earlier run to compare with')
+        parser.add_argument('--threshold', type=float, default=1.25,
+                            help='p95 ratio to the baseline reported as a regression')
+        parser.add_argument('--min-delta-ms', type=float, default=1.0,
+                            help='Smallest p95 increase reported as a regression, to ignore noise on fast endpoints')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+
+        with isolated_database(keepdb=options['keepdb']):
+            from booking.models import Booking
+            if not Booking.objects.exists():
+                self.seed(options)
+            fixtures = self.fixtures(options['anchor'])
+            scenarios = self.scenarios(fixtures, options['anchor'])
+            results = {
+                'dataset': self.dataset(),
+                'repeat': options['repeat'],
+                'uncovered_routes': self.uncovered_routes(scenarios),
+                'endpoints': {},
+            }
+            for scenario in scenarios:
+                if options['only'] and options['only'] not in scenario['name']:
+                    continue
+                self.stderr.write(f"{scenario['name']}: {scenario['method'].upper()} {scenario['path']}")
+                results['endpoints'][scenario['name']] = self.run(scenario, options['repeat'])
+
+        if baseline is not None:
+            results['regressions'] = self.regressions(results, baseline, options['threshold'], options['min_delta_ms'])
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        self.stdout.write(output)
+        if results.get('regressions'):
+            raise CommandError(f"{len(results['regressions'])} endpoint(s) regressed against {options['baseline']}.")
+
+    def seed(self, options):
+        from booking.models import Booking, Review
+        from common.utils import generate_booking_numbers
+        from kopero_auth.models import Client, CrewMember
+        from services.models import Service
+
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        capacity = options['crew'] * len(DAYS) * len(HOURS)
+        if options['bookings'] > capacity:
+            raise CommandError(f"{options['crew']} crew members can hold at most {capacity} bookings.")
+        password = make_password(PASSWORD)
+
+        self.stderr.write('Seeding services, crew and clients')
+        services = Service.objects.bulk_create([
+            Service(id=random_uuid(rng), name=f'Benchmark service {n}', tag='benchmark', rate_per_hour=1000 + 250 * n)
+            for n in range(options['services'])
+        ])
+        categories = [choice for choice, _ in CrewMember.CATEGORY_CHOICES]
+        crew = []
+        for n in range(options['crew']):
+            pk = random_uuid(rng)
+            crew.append(CrewMember(
+                id=pk, baseuser_ptr_id=pk, email=f'crew{n}@bench.local', username=f'bench-crew-{n}',
+                password=password, category=categories[n % len(categories)],
+            ))
+        insert_users(CrewMember, crew, batch_size)
+        client_ids = []
+        for start in range(0, options['clients'], batch_size):
+            clients = []
+            for n in range(start, min(start + batch_size, options['clients'])):
+                pk = random_uuid(rng)
+                clients.append(Client(
+                    id=pk, baseuser_ptr_id=pk, email=f'client{n}@bench.local', username=f'bench-client-{n}',
+                    password=password,
+                ))
+            insert_users(Client, clients, batch_size)
+            client_ids += [client.pk for client in clients]
+
+        # Every booking takes a distinct (crew, day, hour) slot
+        self.stderr.write(f"Seeding {options['bookings']} bookings")
+        slots = rng.sample(range(capacity), options['bookings'])
+        served = []
+        for start in range(0, len(slots), batch_size):
+            batch = slots[start:start + batch_size]
+            bookings = []
+            for slot, booking_number in zip(batch, generate_booking_numbers(len(batch))):
+                crew_index, rest = divmod(slot, len(DAYS) * len(HOURS))
+                day, hour = divmod(rest, len(HOURS))
+                booking_date = options['anchor'] + timedelta(days=DAYS[day])
+                if booking_date < options['anchor']:
+                    booking_status = rng.choices(['served', 'completed', 'canceled'], weights=[6, 3, 1])[0]
+                else:
+                    booking_status = rng.choices(['pending', 'paid'], weights=[7, 3])[0]
+                booking = Booking(
+                    id=random_uuid(rng),
+                    client_id=rng.choice(client_ids),
+                    crew_id=crew[crew_index].pk,
+                    service_id=rng.choice(services).pk,
+                    booking_number=booking_number,
+                    date=booking_date,
+                    time=time(HOURS[hour]),
+                    status=booking_status,
+                    is_booked=booking_status != 'pending',
+                    is_paid=booking_status in ('paid', 'served', 'completed'),
+                )
+                bookings.append(booking)
+                if booking_status == 'served' and len(served) < options['reviews']:
+                    served.append(booking)
+            Booking.objects.bulk_create(bookings, batch_size=batch_size)
+
+        self.stderr.write(f'Seeding {len(served)} reviews')
+        for start in range(0, len(served), batch_size):
+            Review.objects.bulk_create([
+                Review(
+                    booking_id=booking.pk, client_id=booking.client_id, crew_member_id=booking.crew_id,
+                    rating=rng.choices(range(1, 6), weights=[1, 1, 2, 4, 6])[0],
+                )
+                for booking in served[start:start + batch_size]
+            ], batch_size=batch_size)
+
+        call_command('rebuild_availability', stdout=self.stderr)
+        call_command('rebuild_crew_ratings', stdout=self.stderr)
+
+    def dataset(self):
+        from booking.models import Booking, Review
+        from kopero_auth.models import Client, CrewMember
+        from services.models import Service
+
+        return {
+            'bookings': Booking.objects.count(),
+            'clients': Client.objects.count(),
+            'crew': CrewMember.objects.count(),
+            'reviews': Review.objects.count(),
+            'services': Service.objects.count(),
+        }
+
+    def fixtures(self, anchor):
+        """The users and rows the requests are made for, the busiest client and crew member."""
+        from booking.models import Booking
+        from kopero_auth.models import Client, CrewMember
+        from services.models import Service
+
+        client = Client.objects.alive().annotate(booking_count=Count('client_bookings')).order_by('-booking_count', 'id').first()
+        crew = CrewMember.objects.alive().annotate(booking_count=Count('crew_bookings')).order_by('-booking_count', 'id').first()
+        if client is None or crew is None or not Service.objects.exists():
+            raise CommandError('The dataset needs at least one client, crew member and service.')
+        bookings = Booking.objects.alive().order_by('date', 'time', 'id')
+        return {
+            'client': client,
+            'crew': crew,
+            'service': Service.objects.order_by('name').first(),
+            'pending': bookings.filter(client=client, status='pending').first(),
+            'unreviewed': bookings.filter(client=client, status='served', review__isnull=True).first(),
+            'crew_pending': bookings.filter(crew=crew, status='pending').first(),
+        }
+
+    def scenarios(self, fixtures, anchor):
+        """
+        One or more requests per route. Requests that write are rolled
+        back, so every run measures the same dataset.
+        """
+        from booking.calendar import calendar_token
+        from kopero_auth.authentication import CLIENT_ROLE, CREW_ROLE, tokens_for_user
+
+        client, crew, service = fixtures['client'], fixtures['crew'], fixtures['service']
+        pending, unreviewed, crew_pending = fixtures['pending'], fixtures['unreviewed'], fixtures['crew_pending']
+        missing = uuid.UUID(int=0)
+
+        def pk_of(*rows):
+            # The first row that exists, or an id that matches nothing
+            return next((row.pk for row in rows if row is not None), missing)
+        users = {'client': (client, CLIENT_ROLE), 'crew': (crew, CREW_ROLE)}
+        day, later = anchor.isoformat(), anchor + timedelta(days=400)
+        reset_token = PasswordResetTokenGenerator()
+
+        def refresh_tokens():
+            # Logging out or refreshing blacklists the token, so each call gets its own
+            return lambda: {'refresh': tokens_for_user(client, CLIENT_ROLE)['refresh']}
+
+        def scenario(name, route, method='get', kwargs=None, query='', data=None, user='client', write=False):
+            return {
+                'name': name, 'route': route, 'method': method,
+                'path': reverse(route, kwargs=kwargs) + query,
+                'data': data, 'user': users.get(user), 'write': write,
+            }
+
+        booking_payload = {
+            'client': str(client.pk), 'crew': str(crew.pk), 'service': str(service.pk),
+            'date': later.isoformat(), 'time': '10:00',
+        }
+        return [
+            # booking
+            scenario('bookings', 'bookings'),
+            scenario('bookings:keyset', 'bookings', query='?cursor='),
+            scenario('bookings:crew', 'bookings', user='crew'),
+            scenario('bookings:create', 'bookings', 'post', data=booking_payload, write=True),
+            scenario('bookings_async', 'bookings_async'),
+            scenario('bookings_bulk', 'bookings_bulk', 'post', write=True, data={
+                'crew': str(crew.pk), 'service': str(service.pk),
+                'recurrence': {'start_date': later.isoformat(), 'time': '11:00', 'frequency': 'weekly', 'count': 8},
+            }),
+            scenario('booking', 'booking', kwargs={'pk': pk_of(pending, unreviewed, crew_pending)}),
+            scenario('booking:review', 'booking', 'post', kwargs={'pk': pk_of(unreviewed)},
+                     data={'rating': 5}, write=True),
+            scenario('booking:delete', 'booking', 'delete', kwargs={'pk': pk_of(pending)}, write=True),
+            scenario('available_time', 'available_time', kwargs={'crew_id': crew.pk}, query=f'?date={day}'),
+            scenario('available_time:31_days', 'available_time', kwargs={'crew_id': crew.pk},
+                     query=f"?from={day}&to={(anchor + timedelta(days=30)).isoformat()}"),
+            scenario('available_time_async', 'available_time_async', kwargs={'crew_id': crew.pk}, query=f'?date={day}'),
+            scenario('free_crew', 'free_crew', query=f'?date={day}&time=10:00'),
+            scenario('free_crew:window', 'free_crew', query=f'?date={day}&start_time=09:00&end_time=17:00'),
+            scenario('booking_calendar', 'booking_calendar'),
+            scenario('booking_calendar_feed', 'booking_calendar_feed', kwargs={'token': calendar_token(client.pk, client.calendar_token_version)}, user=None),
+            scenario('booking-cancel', 'booking-cancel', 'post', kwargs={'booking_id': pk_of(pending)}, write=True),
+            scenario('booking-pay', 'booking-pay', 'post', kwargs={'booking_id': pk_of(crew_pending)},
+                     user='crew', write=True),
+            scenario('booking-complete', 'booking-complete', 'post', kwargs={'booking_id': pk_of(crew_pending)},
+                     user='crew', write=True),
+            # services
+            scenario('service-list', 'service-list'),
+            scenario('service-list:create', 'service-list', 'post', write=True,
+                     data={'name': 'Benchmark new service', 'tag': 'benchmark', 'rate_per_hour': 1500}),
+            scenario('service-detail', 'service-detail', kwargs={'pk': service.pk}),
+            scenario('service-detail:update', 'service-detail', 'patch', kwargs={'pk': service.pk},
+                     data={'description': 'Updated by the benchmark'}, write=True),
+            scenario('services_async', 'services_async'),
+            scenario('service_async', 'service_async', kwargs={'pk': service.pk}),
+            # kopero_auth
+            scenario('register_crew_member', 'register_crew_member', 'post', user=None, write=True, data={
+                'email': 'new-crew@bench.local', 'username': 'bench-new-crew', 'password': PASSWORD,
+                'first_name': 'New', 'last_name': 'Benchmark',
+                'category': crew.category,
+            }),
+            scenario('register_customer', 'register_customer', 'post', user=None, write=True, data={
+                'email': 'new-client@bench.local', 'username': 'bench-new-client', 'password': PASSWORD,
+                'first_name': 'New', 'last_name': 'Benchmark',
+            }),
+            scenario('login_crew_member', 'login_crew_member', 'post', user=None,
+                     data={'email': crew.email, 'password': PASSWORD}),
+            scenario('login_client', 'login_client', 'post', user=None,
+                     data={'email': client.email, 'password': PASSWORD}),
+            scenario('logout', 'logout', 'post', data=refresh_tokens(), write=True),
+            scenario('token_refresh', 'token_refresh', 'post', user=None, data=refresh_tokens(), write=True),
+            scenario('client_password_reset_request', 'client_password_reset_request', 'post', user=None,
+                     data={'email': client.email}, write=True),
+            scenario('client_password_reset_confirm', 'client_password_reset_confirm', 'post', user=None, write=True, data={
+                'uidb64': urlsafe_base64_encode(client.pk.bytes), 'token': reset_token.make_token(client),
+                'new_password': PASSWORD,
+            }),
+            scenario('crew_password_reset_request', 'crew_password_reset_request', 'post', user=None,
+                     data={'email': crew.email}, write=True),
+            scenario('crew_password_reset_confirm', 'crew_password_reset_confirm', 'post', user=None, write=True, data={
+                'uidb64': urlsafe_base64_encode(crew.pk.bytes), 'token': reset_token.make_token(crew),
+                'new_password': PASSWORD,
+            }),
+            scenario('clients', 'clients'),
+            scenario('clients:keyset', 'clients', query='?cursor='),
+            scenario('client_details', 'client_details', kwargs={'pk': client.pk}),
+            scenario('client_details:update', 'client_details', 'patch', kwargs={'pk': client.pk},
+                     data={'bio': 'Updated by the benchmark'}, write=True),
+            scenario('crews', 'crews'),
+            scenario('crews:category', 'crews', query=f'?category={crew.category}'),
+            scenario('crews_async', 'crews_async'),
+            scenario('crew_details', 'crew_details', kwargs={'pk': crew.pk}),
+            scenario('crew_details:update', 'crew_details', 'patch', kwargs={'pk': crew.pk},
+                     data={'bio': 'Updated by the benchmark'}, write=True),
+        ]
+
+    def uncovered_routes(self, scenarios):
+        names = set()
+        for urlconf in BENCHMARKED_URLCONFS:
+            names |= route_names(get_resolver(urlconf).url_patterns)
+        return sorted(names - UNREACHABLE_ROUTES - {scenario['route'] for scenario in scenarios})
+
+    def run(self, scenario, repeat):
+        # Server errors are reported as the endpoint's status rather than raised
+        api = APIClient(raise_request_exception=False)
+        if scenario['user'] is not None:
+            from kopero_auth.authentication import tokens_for_user
+            api.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(*scenario['user'])['access']}")
+        send = getattr(api, scenario['method'])
+        data = scenario['data']
+        last = {}
+
+        @contextmanager
+        def prepare():
+            # Payloads are built untimed, inside the transaction the write is rolled back with
+            with transaction.atomic() if scenario['write'] else nullcontext():
+                yield data() if callable(data) else data
+                if scenario['write']:
+                    transaction.set_rollback(True)
+
+        def request(payload):
+            if payload or scenario['write']:
+                response = send(scenario['path'], payload, format='json')
+            else:
+                response = send(scenario['path'])
+            last['status'] = response.status_code
+
+        stats = measure(request, repeat=repeat, setup=prepare)
+        stats['peak_memory_kb'] = peak_memory(request, setup=prepare)
+        stats['status'] = last['status']
+        return {'method': scenario['method'].upper(), 'path': scenario['path'], **stats}
+
+    def regressions(self, results, baseline, threshold, min_delta_ms):
+        """Endpoints that got slower, or run more queries, than in the baseline."""
+        regressions = []
+        for name, current in results['endpoints'].items():
+            previous = baseline.get('endpoints', {}).get(name)
+            if previous is None:
+                continue
+            slower = (
+                current['p95_ms'] > previous['p95_ms'] * threshold
+                and current['p95_ms'] - previous['p95_ms'] >= min_delta_ms
+            )
+            more_queries = current['queries_per_call'] > previous['queries_per_call']
+            if slower or more_queries:
+                regressions.append({
+                    'endpoint': name,
+                    'p95_ms': [previous['p95_ms'], current['p95_ms']],
+                    'queries_per_call': [previous['queries_per_call'], current['queries_per_call']],
+                })
+        return regressions
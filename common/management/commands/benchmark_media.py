@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.utils.http import http_date
+from django.views.static import serve
+from common.benchmarks import measure
+from common.media import serve_media
+
+
+class Command(BaseCommand):
+    help = 'Compare media throughput of common.media.serve_media against django.views.static.serve'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=4 * 1024 * 1024, help='Size of the served file in bytes')
+        parser.add_argument('--range', type=int, default=256 * 1024, help='Bytes asked for by range requests')
+        parser.add_argument('--repeat', type=int, default=50, help='Measured requests per scenario')
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        with tempfile.TemporaryDirectory() as media_root:
+            name = 'benchmark.3f2a9c1b7d4e.jpg'
+            with open(os.path.join(media_root, name), 'wb') as file:
+                file.write(os.urandom(options['size']))
+            modified = http_date(os.stat(os.path.join(media_root, name)).st_mtime)
+            range_header = f"bytes=0-{options['range'] - 1}"
+
+            def run(view, **headers):
+                def request():
+                    response = view(factory.get(f'/media/{name}', headers=headers), name)
+                    size = sum(len(chunk) for chunk in response) if not response.streaming else sum(len(chunk) for chunk in response.streaming_content)
+                    response.close()
+                    request.bytes = size
+                request.bytes = 0
+                return request
+
+            static_view = lambda request, path: serve(request, path, document_root=media_root)
+            scenarios = {
+                'full_file': {},
+                'range': {'Range': range_header},
+                'revalidation': {'If-Modified-Since': modified},
+            }
+            results = {}
+            with override_settings(MEDIA_ROOT=media_root):
+                for scenario, headers in scenarios.items():
+                    for label, view in (('static_serve', static_view), ('serve_media', serve_media)):
+                        results[f'{scenario}:{label}'] = self.throughput(run(view, **headers), options['repeat'])
+                with override_settings(MEDIA_SERVING={'ACCEL_REDIRECT': 'x-accel-redirect', 'ACCEL_PREFIX': '/internal-media/', 'MAX_AGE': 3600}):
+                    results['full_file:serve_media_x_accel_redirect'] = self.throughput(run(serve_media), options['repeat'])
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def throughput(self, request, repeat):
+        stats = measure(request, repeat=repeat)
+        stats['bytes_per_response'] = request.bytes
+        stats['requests_per_second'] = round(1000 / stats['mean_ms'], 1)
+        stats['mb_per_second'] = round(request.bytes * stats['requests_per_second'] / 1024 / 1024, 1)
+        return stats
@@ -0,0 +1,118 @@
+import json
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from unittest import mock
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.urls import resolve
+from rest_framework.test import APIClient
+from common.benchmarks import isolated_database
+from common.metrics import MetricsRegistry
+from common.middleware import MetricsMiddleware
+
+METRICS_MIDDLEWARE = 'common.middleware.MetricsMiddleware'
+
+
+class Command(BaseCommand):
+    help = 'Measure the overhead of common.middleware.MetricsMiddleware on full request handling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=50, help='Bookings of the listed client')
+        parser.add_argument('--requests', type=int, default=2000, help='Measured requests per endpoint and mode')
+
+    def handle(self, *args, **options):
+        with isolated_database(), tempfile.TemporaryDirectory() as directory:
+            headers, crew_id = self.seed(options['bookings'])
+            endpoints = {
+                'services': '/api/v1/services/',
+                'bookings': '/api/v1/booking/',
+                'available_times': f'/api/v1/booking/available-times/{crew_id}/?date={date.today().isoformat()}',
+            }
+            # Flushes to a file as in production, from the background thread
+            registry = MetricsRegistry(directory=directory, flush_interval=1)
+            with mock.patch('common.middleware.metrics', registry):
+                clients = {'without_metrics': self.client_for(False, headers), 'with_metrics': self.client_for(True, headers)}
+                results = {'middleware_only': self.middleware_only(options['requests'] * 10)}
+                for name, path in endpoints.items():
+                    results[name] = self.compare(clients, path, options['requests'])
+                    results[name]['middleware_only_pct'] = round(
+                        results['middleware_only']['per_request_us'] / 1000 / results[name]['without_metrics_p50_ms'] * 100, 2
+                    )
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def client_for(self, with_metrics, headers):
+        """An API client whose handler loaded the middleware with or without metrics."""
+        middleware = [path for path in settings.MIDDLEWARE if path != METRICS_MIDDLEWARE]
+        if with_metrics:
+            middleware.insert(0, METRICS_MIDDLEWARE)
+        client = APIClient()
+        client.credentials(**headers)
+        with override_settings(MIDDLEWARE=middleware):
+            # The handler loads the middleware on its first request only
+            client.get('/api/v1/services/')
+        return client
+
+    def middleware_only(self, requests):
+        """Time the middleware adds around a view answering at once, free of the noise of a full request."""
+        request = RequestFactory().get('/api/v1/services/')
+        request.resolver_match = resolve('/api/v1/services/')
+        response = HttpResponse()
+        bare = lambda request: response
+        measured = MetricsMiddleware(bare)
+        timings = {}
+        for label, handler in (('bare', bare), ('measured', measured)):
+            start = time.perf_counter()
+            for _ in range(requests):
+                handler(request)
+            timings[label] = (time.perf_counter() - start) / requests
+        return {'per_request_us': round((timings['measured'] - timings['bare']) * 1e6, 2)}
+
+    def compare(self, clients, path, requests):
+        """
+        Alternates single requests of both modes, swapping which goes first
+        as the second of a pair is measurably faster, so drift and noise
+        affect both modes alike.
+        """
+        timings = {mode: [] for mode in clients}
+        modes = list(clients.items())
+        for index in range(requests):
+            for mode, client in modes if index % 2 else reversed(modes):
+                start = time.perf_counter()
+                client.get(path)
+                timings[mode].append((time.perf_counter() - start) * 1000)
+
+        without, with_ = statistics.median(timings['without_metrics']), statistics.median(timings['with_metrics'])
+        return {
+            'without_metrics_p50_ms': round(without, 3),
+            'with_metrics_p50_ms': round(with_, 3),
+            'overhead_us': round((with_ - without) * 1000, 1),
+            'overhead_pct': round((with_ - without) / without * 100, 2),
+        }
+
+    def seed(self, booking_count):
+        from booking.models import Booking
+        from kopero_auth.authentication import CLIENT_ROLE, tokens_for_user
+        from kopero_auth.models import Client, CrewMember
+        from services.models import Service
+
+        service = Service.objects.create(name='Benchmark session', tag='benchmark')
+        client = Client.objects.create(email='client@bench.local', username='bench-client')
+        crew = CrewMember.objects.create(email='crew@bench.local', username='bench-crew', category=CrewMember.PHOTOGRAPHER)
+        Booking.objects.bulk_create([
+            Booking(
+                client=client,
+                crew=crew,
+                service=service,
+                booking_number=f'B{number:07d}',
+                date=date.today() + timedelta(days=number // 8),
+                time=f'{9 + number % 8:02d}:00',
+            )
+            for number in range(booking_count)
+        ])
+        token = tokens_for_user(client, CLIENT_ROLE)['access']
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}, crew.pk
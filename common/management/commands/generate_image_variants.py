@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from common.images import image_variant_models, refresh_variants
+
+
+def refresh(label, pk, force):
+    from django.apps import apps
+    return refresh_variants(apps.get_model(label), pk, force=force)
+
+
+class Command(BaseCommand):
+    help = 'Generate the resized variants of every stored image that does not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Images processed in parallel')
+        parser.add_argument('--force', action='store_true', help='Also regenerate images that already have variants')
+
+    def handle(self, *args, **options):
+        tasks = []
+        for model in image_variant_models():
+            queryset = model._default_manager.exclude(image__isnull=True).exclude(image='')
+            for pk, name, variants in queryset.values_list('pk', 'image', 'image_variants').iterator():
+                if options['force'] or variants.get('source') != name:
+                    tasks.append((model._meta.label, pk))
+
+        # The workers open their own connections, do not share ours
+        connections.close_all()
+        generated = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            futures = {executor.submit(refresh, label, pk, options['force']): (label, pk) for label, pk in tasks}
+            for future in as_completed(futures):
+                try:
+                    generated += bool(future.result())
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{futures[future][0]} {futures[future][1]}: {error}')
+
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {generated} images, {failed} failed'))
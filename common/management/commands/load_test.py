@@ -0,0 +1,58 @@
+import asyncio
+import datetime
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.urls import reverse
+from common.benchmarks import load_test
+from kopero_auth.authentication import CLIENT_ROLE, tokens_for_user
+from kopero_auth.models import Client, CrewMember
+from services.models import Service
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the sync and async read endpoints of a running server, e.g. '
+        '`uvicorn kopero.asgi:application --workers 4`, sharing this database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8000)
+        parser.add_argument('--connections', type=int, default=500, help='Concurrent keep-alive connections')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per endpoint and mode')
+        parser.add_argument('--email', help='Client whose bookings are listed, defaults to the one with most bookings')
+        parser.add_argument('--date', default=datetime.date.today().isoformat(), help='Day asked for available times')
+
+    def handle(self, *args, **options):
+        client = self.get_client(options['email'])
+        crew = CrewMember.objects.alive().first()
+        service = Service.objects.first()
+        if client is None or crew is None or service is None:
+            raise CommandError('The database needs at least one client, crew member and service.')
+        headers = {'Authorization': f"Bearer {tokens_for_user(client, CLIENT_ROLE)['access']}"}
+
+        crew_kwargs = {'crew_id': crew.pk}
+        endpoints = {
+            'available_times': ('available_time', 'available_time_async', crew_kwargs, f"?date={options['date']}"),
+            'bookings': ('bookings', 'bookings_async', {}, ''),
+            'services': ('service-list', 'services_async', {}, ''),
+            'service': ('service-detail', 'service_async', {'pk': service.pk}, ''),
+            'crews': ('crews', 'crews_async', {}, ''),
+        }
+        results = {}
+        for name, (sync_name, async_name, kwargs, query) in endpoints.items():
+            for mode, url_name in (('sync', sync_name), ('async', async_name)):
+                path = reverse(url_name, kwargs=kwargs) + query
+                self.stderr.write(f'{name}:{mode} {path}')
+                results[f'{name}:{mode}'] = asyncio.run(load_test(
+                    options['host'], options['port'], path,
+                    connections=options['connections'], duration=options['duration'], headers=headers,
+                ))
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def get_client(self, email):
+        if email:
+            return Client.objects.filter(email=email).first()
+        return Client.objects.annotate(booking_count=Count('client_bookings')).order_by('-booking_count').first()
@@ -0,0 +1,58 @@
+import datetime
+import time
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from common.models import SoftDeleteQuerySet
+
+
+def retained_dependents(model, before):
+    """
+    Conditions matching rows that retained rows still depend on through a
+    cascading foreign key: live rows, such as the bookings of a deleted
+    client, and rows soft-deleted after `before` or without a deletion time.
+    """
+    for relation in model._meta.related_objects:
+        related = relation.related_model
+        if relation.on_delete is models.CASCADE and isinstance(related._default_manager.all(), SoftDeleteQuerySet):
+            retained = related._default_manager.exclude(is_deleted=True, deleted_at__lt=before)
+            yield Exists(retained.filter(**{relation.field.name: OuterRef('pk')}))
+
+
+class Command(BaseCommand):
+    help = 'Hard-delete rows soft-deleted longer than the retention period in batches, run it on a schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SOFT_DELETE['RETENTION_DAYS'], help='Retention period in days')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be deleted')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(days=options['days'])
+        for label in settings.SOFT_DELETE['MODELS']:
+            model = apps.get_model(label)
+            queryset = model._default_manager.purgeable(before)
+            # Deleting them would cascade into rows still within retention
+            for condition in retained_dependents(model, before):
+                queryset = queryset.exclude(condition)
+            queryset = queryset.order_by('pk')
+
+            if options['dry_run']:
+                self.stdout.write(f'{label}: {queryset.count()} rows to delete')
+                continue
+
+            deleted = 0
+            while True:
+                pks = list(queryset.values_list('pk', flat=True)[:options['batch_size']])
+                if not pks:
+                    break
+                # Delete through the ORM so cascades and signals run
+                model._default_manager.filter(pk__in=pks).delete()
+                deleted += len(pks)
+                if options['pause']:
+                    time.sleep(options['pause'])
+            self.stdout.write(self.style.SUCCESS(f'{label}: deleted {deleted} rows'))
@@ -0,0 +1,40 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from common.mail import OutboxSender
+
+
+class Command(BaseCommand):
+    help = 'Send the emails waiting in the outbox over one reused connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.EMAIL_OUTBOX['BATCH_SIZE'])
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting once it is empty')
+        parser.add_argument('--poll-interval', type=float, default=settings.EMAIL_OUTBOX['POLL_INTERVAL'])
+
+    def handle(self, *args, **options):
+        sender = OutboxSender(
+            batch_size=options['batch_size'],
+            max_attempts=settings.EMAIL_OUTBOX['MAX_ATTEMPTS'],
+            backoff=settings.EMAIL_OUTBOX['BACKOFF'],
+            lease=settings.EMAIL_OUTBOX['LEASE'],
+        )
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = sender.send_batch()
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    continue
+                if not options['loop']:
+                    break
+                # Nothing due, let the connection go while idle
+                sender.close()
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sender.close()
+
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} failed attempts'))
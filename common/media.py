@@ -0,0 +1,129 @@
+import mimetypes
+import os
+import posixpath
+import re
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+# File names carrying a hash of their content, such as `card.3f2a9c1b7d4e.webp`
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.[^./]+$')
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def file_etag(stat):
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def parse_range(header, size):
+    """
+    Returns the (start, end) byte positions, end included, of a single range
+    `Range` header, None when the whole file should be sent, or False when
+    the range cannot be satisfied.
+    """
+    match = RANGE.match(header.strip())
+    if match is None:
+        # Multiple or malformed ranges, answering with the whole file is allowed
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last or int(last) == 0:
+            return False
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serves a file from MEDIA_ROOT with ETag and Last-Modified validators,
+    single `Range` requests and long lived caching for content-hashed names.
+
+    With MEDIA_SERVING['ACCEL_REDIRECT'] set, the body is handed to the
+    front proxy with X-Accel-Redirect (nginx) or X-Sendfile (Apache,
+    lighttpd) once the validators were checked, so the worker only spends a
+    stat call on it. Otherwise full files go through `wsgi.file_wrapper`.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(fullpath)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        raise Http404("File does not exist")
+    if not os.path.isfile(fullpath):
+        raise Http404("File does not exist")
+
+    etag = file_etag(stat)
+    # HTTP dates have a one second resolution
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = file_response(request, path, fullpath, stat, etag, last_modified)
+
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(last_modified))
+    if HASHED_NAME.search(path):
+        patch_cache_control(response, public=True, max_age=365 * 24 * 60 * 60, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_SERVING['MAX_AGE'])
+    return response
+
+
+def file_response(request, path, fullpath, stat, etag, last_modified):
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+
+    accel_redirect = settings.MEDIA_SERVING['ACCEL_REDIRECT']
+    if accel_redirect == 'x-accel-redirect':
+        # nginx answers Range requests itself from the internal location
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_SERVING['ACCEL_PREFIX'] + path
+        return response
+    if accel_redirect == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = fullpath
+        return response
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (if_range is None or if_range in (etag, http_date(last_modified))):
+        byte_range = parse_range(range_header, stat.st_size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416, content_type=content_type)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+    elif byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        body = iter_range(open(fullpath, 'rb'), start, length) if request.method != 'HEAD' else []
+        response = StreamingHttpResponse(body, status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Content-Length'] = str(length)
+    else:
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+        response['Content-Length'] = str(stat.st_size)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return response
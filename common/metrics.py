@@ -0,0 +1,279 @@
+import atexit
+import bisect
+import fcntl
+import json
+import os
+import secrets
+import threading
+import time
+from contextvars import ContextVar
+from django.conf import settings
+
+# Upper bounds of the request latency histogram, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNRESOLVED = '<unresolved>'
+# Series of the workers that exited, folded together by MetricsRegistry
+RETIRED_FILE = 'metrics-retired.json'
+
+# Measurements of the request being answered, set by MetricsMiddleware
+request_metrics = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Measurements of one request, filled in while it is answered."""
+
+    __slots__ = ('queries', 'sql_seconds', 'serialization_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper, installed on every connection when it opens
+    (see common.signals), adding the query to the request's metrics.
+    """
+    measured = request_metrics.get()
+    if measured is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        measured.sql_seconds += time.perf_counter() - start
+        measured.queries += 1
+
+
+def new_series():
+    return {
+        'statuses': {},
+        'buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+        'count': 0,
+        'seconds': 0.0,
+        'queries': 0,
+        'sql_seconds': 0.0,
+        'serialization_seconds': 0.0,
+    }
+
+
+def merge_series(target, source):
+    for code, count in source['statuses'].items():
+        target['statuses'][code] = target['statuses'].get(code, 0) + count
+    target['buckets'] = [a + b for a, b in zip(target['buckets'], source['buckets'])]
+    for field in ('count', 'seconds', 'queries', 'sql_seconds', 'serialization_seconds'):
+        target[field] += source[field]
+
+
+class MetricsRegistry:
+    """
+    Per endpoint request metrics of this process.
+
+    Series are keyed by URL name and method and only ever grow, like
+    Prometheus counters. With a `directory`, a background thread writes
+    this process's series to a file of its own every `flush_interval`
+    seconds, and `collect` merges the files of every worker, including
+    workers that exited, so totals survive restarts.
+
+    Files are named after the worker's PID and a random token, so a worker
+    that is given a recycled PID does not overwrite the file of the one
+    that exited. `collect` folds the files of exited workers into a single
+    retired file and deletes them, so they do not pile up.
+    """
+
+    def __init__(self, directory='', flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._series = {}
+        self._pid = None
+        self._token = None
+        self._flusher = None
+
+    def observe(self, endpoint, method, status, seconds, measured):
+        key = f'{endpoint} {method}'
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = new_series()
+            code = str(status)
+            series['statuses'][code] = series['statuses'].get(code, 0) + 1
+            series['buckets'][index] += 1
+            series['count'] += 1
+            series['seconds'] += seconds
+            series['queries'] += measured.queries
+            series['sql_seconds'] += measured.sql_seconds
+            series['serialization_seconds'] += measured.serialization_seconds
+        if self.directory and self._pid != os.getpid():
+            self.start_flusher()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: dict(series, statuses=dict(series['statuses']), buckets=list(series['buckets']))
+                for key, series in self._series.items()
+            }
+
+    def start_flusher(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked from a process that already had series, they are its own
+                self._series = {}
+            self._pid = os.getpid()
+            self._token = secrets.token_hex(4)
+            self._flusher = threading.Thread(target=self.flush_forever, name='metrics-flush', daemon=True)
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def path(self, pid, token):
+        return os.path.join(self.directory, f'metrics-{pid}-{token}.json')
+
+    def flush(self):
+        """Writes this process's series to its file, atomically."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(self._pid, self._token)
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(self.snapshot(), file)
+        os.replace(f'{path}.tmp', path)
+
+    def collect(self):
+        """Returns the series of every worker merged, this process's being current."""
+        if not self.directory:
+            return self.snapshot()
+
+        merged = {}
+        own = self.path(self._pid, self._token) if self._pid == os.getpid() else None
+        sources = [self.snapshot()]
+        if os.path.isdir(self.directory):
+            # Scrapes of other workers must not fold the same files meanwhile
+            with open(os.path.join(self.directory, 'metrics.lock'), 'w') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                retired = self.retire_exited()
+                sources.append(retired['series'])
+                for name in os.listdir(self.directory):
+                    path = os.path.join(self.directory, name)
+                    if worker_pid(name) is None or path == own or name in retired['folded']:
+                        continue
+                    source = read_json(path)
+                    if source is not None:
+                        sources.append(source)
+        for source in sources:
+            for key, series in source.items():
+                merge_series(merged.setdefault(key, new_series()), series)
+        return merged
+
+    def retire_exited(self):
+        """
+        Folds the files of workers that exited into the retired file, then
+        deletes them, and returns the retired series. The retired file lists
+        the files it holds, so a file left by an interrupted fold is
+        deleted rather than counted twice.
+        """
+        retired_path = os.path.join(self.directory, RETIRED_FILE)
+        retired = read_json(retired_path) or {'series': {}, 'folded': []}
+        names = set(os.listdir(self.directory))
+        retired['folded'] = [name for name in retired['folded'] if name in names]
+        exited = [
+            name for name in sorted(names)
+            if name not in retired['folded'] and worker_pid(name) is not None and not process_exists(worker_pid(name))
+        ]
+        if exited:
+            for name in exited:
+                for key, series in (read_json(os.path.join(self.directory, name)) or {}).items():
+                    merge_series(retired['series'].setdefault(key, new_series()), series)
+            retired['folded'] += exited
+            with open(f'{retired_path}.tmp', 'w') as file:
+                json.dump(retired, file)
+            os.replace(f'{retired_path}.tmp', retired_path)
+        for name in retired['folded']:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        return retired
+
+
+def worker_pid(name):
+    """The PID of the worker that wrote the metrics file `name`, None for other files."""
+    if not name.startswith('metrics-') or not name.endswith('.json'):
+        return None
+    try:
+        return int(name[len('metrics-'):-len('.json')].split('-')[0])
+    except ValueError:
+        return None
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, but run by another user
+        return True
+    return True
+
+
+def read_json(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+# Content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(series_by_key):
+    """Renders merged series in the Prometheus text exposition format."""
+    families = {
+        'requests': ['# HELP kopero_http_requests_total Requests answered, by endpoint, method and status.',
+                     '# TYPE kopero_http_requests_total counter'],
+        'duration': ['# HELP kopero_http_request_duration_seconds Time to answer requests.',
+                     '# TYPE kopero_http_request_duration_seconds histogram'],
+        'queries': ['# HELP kopero_http_sql_queries_total SQL queries run while answering requests.',
+                    '# TYPE kopero_http_sql_queries_total counter'],
+        'sql': ['# HELP kopero_http_sql_duration_seconds_total Time spent in SQL queries while answering requests.',
+                '# TYPE kopero_http_sql_duration_seconds_total counter'],
+        'serialization': ['# HELP kopero_http_serialization_duration_seconds_total Time spent rendering response bodies.',
+                          '# TYPE kopero_http_serialization_duration_seconds_total counter'],
+    }
+    for key in sorted(series_by_key):
+        series = series_by_key[key]
+        endpoint, method = key.rsplit(' ', 1)
+        labels = f'endpoint="{escape_label(endpoint)}",method="{method}"'
+        for code, count in sorted(series['statuses'].items()):
+            families['requests'].append(f'kopero_http_requests_total{{{labels},status="{code}"}} {count}')
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), series['buckets']):
+            cumulative += count
+            families['duration'].append(f'kopero_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        families['duration'].append(f'kopero_http_request_duration_seconds_sum{{{labels}}} {series["seconds"]}')
+        families['duration'].append(f'kopero_http_request_duration_seconds_count{{{labels}}} {series["count"]}')
+        families['queries'].append(f'kopero_http_sql_queries_total{{{labels}}} {series["queries"]}')
+        families['sql'].append(f'kopero_http_sql_duration_seconds_total{{{labels}}} {series["sql_seconds"]}')
+        families['serialization'].append(
+            f'kopero_http_serialization_duration_seconds_total{{{labels}}} {series["serialization_seconds"]}'
+        )
+    return '\n'.join(line for family in families.values() for line in family) + '\n'
+
+
+metrics = MetricsRegistry(
+    directory=settings.METRICS['DIRECTORY'],
+    flush_interval=settings.METRICS['FLUSH_INTERVAL'],
+)
@@ -0,0 +1,107 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from common.metrics import UNRESOLVED, RequestMetrics, metrics, request_metrics
+from common.routers import SAFE_METHODS, known_user_pk, pin_key, start_routing, stop_routing
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Routes the reads of safe requests to the read replicas (see
+    common.routers.ReplicaRouter) and pins clients that just wrote
+    something to the primary, by user in the cache and with a cookie.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = start_routing(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            stop_routing(token)
+        user_pk = self.pin(request, response)
+        if user_pk is not None:
+            self.backend.set(pin_key(user_pk), 1, timeout=settings.READ_REPLICAS['STICKY_SECONDS'])
+        return response
+
+    async def __acall__(self, request):
+        token = start_routing(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            stop_routing(token)
+        user_pk = self.pin(request, response)
+        if user_pk is not None:
+            await self.backend.aset(pin_key(user_pk), 1, timeout=settings.READ_REPLICAS['STICKY_SECONDS'])
+        return response
+
+    @property
+    def backend(self):
+        return caches[settings.READ_REPLICAS['CACHE']]
+
+    def pin(self, request, response):
+        """Sets the pin cookie after a successful write and returns the user id to pin, if any."""
+        config = settings.READ_REPLICAS
+        if not config['ALIASES'] or request.method in SAFE_METHODS or response.status_code >= 400:
+            return None
+        response.set_cookie(config['COOKIE'], '1', max_age=config['STICKY_SECONDS'], httponly=True, samesite='Lax')
+        return known_user_pk(request)
+
+
+class MetricsMiddleware:
+    """
+    Records the count, latency, SQL queries and time and serialization time
+    of every request by endpoint (the resolved URL name) and method, see
+    common.metrics. Goes first so the latency covers the other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        measured = RequestMetrics()
+        token = request_metrics.set(measured)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+        finally:
+            request_metrics.reset(token)
+            self.observe(request, status, time.perf_counter() - start, measured)
+        return response
+
+    async def __acall__(self, request):
+        measured = RequestMetrics()
+        token = request_metrics.set(measured)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+        finally:
+            request_metrics.reset(token)
+            self.observe(request, status, time.perf_counter() - start, measured)
+        return response
+
+    def observe(self, request, status, seconds, measured):
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.view_name if match is not None and match.view_name else UNRESOLVED
+        metrics.observe(endpoint, request.method, status, seconds, measured)
@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 import uuid
 
 class TimeStampedModelMixin(models.Model):
@@ -36,6 +37,34 @@ class TimeStampedModelMixin(models.Model):
             return self.name
         return str(self.id)
 
+class SoftDeleteQuerySet(models.QuerySet):
+    """
+    QuerySet of models flagged with `is_deleted`. Reads of live rows go
+    through `alive()`, which the partial indexes on `is_deleted = false` are
+    declared for.
+    """
+
+    def alive(self):
+        return self.filter(is_deleted=False)
+
+    def deleted(self):
+        return self.filter(is_deleted=True)
+
+    def purgeable(self, before):
+        """Soft-deleted rows whose deletion is older than `before`."""
+        return self.filter(is_deleted=True, deleted_at__lt=before)
+
+
+SoftDeleteManager = models.Manager.from_queryset(SoftDeleteQuerySet)
+
+
+def live_only(queryset):
+    """Leaves the soft-deleted rows out of `queryset` if its model has them."""
+    if isinstance(queryset, SoftDeleteQuerySet):
+        return queryset.alive()
+    return queryset
+
+
 class FlaggedModelMixin(models.Model):
     """
     This abstract model contains shared functionality pertaining to
@@ -46,15 +75,64 @@ class FlaggedModelMixin(models.Model):
     - deleted_at: this goes hand in hand with `is_deleted`.
     Gives the timestamp when an object is marked as deleted.
     - is_active: this is marks the instance as active
+    Live rows are read with `objects.alive()`.
     """
 
     is_active = models.BooleanField(default=True)
     is_deleted = models.BooleanField(default=False)
     deleted_at = models.DateTimeField(null=True)
 
+    objects = SoftDeleteManager()
+
     class Meta:
         abstract = True
-        indexes = [
-            models.Index(fields=["is_active"]),
-            models.Index(fields=["is_deleted"]),
-        ]
+
+
+class Sequence(models.Model):
+    """
+    Named counter used by `common.sequences.SequenceAllocator` on databases
+    without native sequences.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} at {self.last_value}"
+
+
+class OutboundEmail(models.Model):
+    """
+    Email waiting in the outbox, sent by the `send_outbound_email` command.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.TextField()
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list, blank=True)
+    bcc = models.JSONField(default=list, blank=True)
+    reply_to = models.JSONField(default=list, blank=True)
+    headers = models.JSONField(default=dict, blank=True)
+    # (content, mimetype) pairs, such as an HTML version of the body
+    alternatives = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)}"
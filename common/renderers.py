@@ -0,0 +1,87 @@
+import csv
+import json
+import time
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+from common.metrics import request_metrics
+
+
+class Echo:
+    """
+    File-like object whose `write` hands the written value back,
+    so csv.writer can be used to produce rows for a streaming response.
+    """
+    def write(self, value):
+        return value
+
+
+class MeasuredJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer adding the time it takes to the serialization time of the
+    request's metrics (see common.middleware.MetricsMiddleware)
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        measured = request_metrics.get()
+        if measured is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        start = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            measured.serialization_seconds += time.perf_counter() - start
+
+
+class RowRenderer(BaseRenderer):
+    """
+    Base class for renderers that write one serialized object per row.
+    `render` handles regular (paginated) responses and `stream` turns an
+    iterable of serialized rows into chunks for a StreamingHttpResponse.
+    """
+    charset = 'utf-8'
+
+    def get_rows(self, data):
+        if isinstance(data, dict) and isinstance(data.get('results'), list):
+            return data['results']
+        if isinstance(data, dict):
+            return [data]
+        return data or []
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''.join(self.stream(self.get_rows(data)))
+
+    def stream(self, rows):
+        raise NotImplementedError('.stream() must be implemented.')
+
+
+class NDJSONRenderer(RowRenderer):
+    """
+    Renders rows as newline delimited JSON
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def stream(self, rows):
+        for row in rows:
+            yield (json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n').encode(self.charset)
+
+
+class CSVRenderer(RowRenderer):
+    """
+    Renders rows as CSV with a header taken from the first row
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        header = None
+        for row in rows:
+            if header is None:
+                header = list(row.keys())
+                yield writer.writerow(header).encode(self.charset)
+            yield writer.writerow([self.format_value(row.get(field)) for field in header]).encode(self.charset)
+
+    def format_value(self, value):
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, cls=JSONEncoder)
+        return '' if value is None else value
@@ -0,0 +1,107 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import LazyObject, empty
+from common.cache import is_process_local
+from kopero_auth.authentication import ClaimsUser
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Routing state of the request being answered, set by ReplicaRoutingMiddleware
+replica_routing = ContextVar('replica_routing', default=None)
+
+
+def known_user_pk(request):
+    """The id of the request's user if it is known without a query."""
+    user = request.__dict__.get('user')
+    if user is None:
+        return None
+    if isinstance(user, LazyObject) and not isinstance(user, ClaimsUser) and user._wrapped is empty:
+        # A session user that nothing has loaded yet
+        return None
+    return user.pk if user.is_authenticated else None
+
+
+def pin_key(user_pk):
+    return f'replica-pin:{user_pk}'
+
+
+class ReplicaRouting:
+    """
+    Read routing of one safe request: a replica picked for the whole
+    request, unless the user is pinned to the primary. The pin is looked up
+    once the user is known, which for token authentication is when the view
+    authenticated the request.
+
+    Pins kept in a process-local cache (locmem, dummy) never reach the
+    other workers, so with such a cache every known user reads from the
+    primary and only anonymous reads go to the replica.
+    """
+
+    def __init__(self, request, replica):
+        self.request = request
+        self.replica = replica
+        self.pinned = None
+
+    def read_alias(self):
+        if self.pinned is None:
+            user_pk = known_user_pk(self.request)
+            if user_pk is None:
+                return self.replica
+            alias = settings.READ_REPLICAS['CACHE']
+            self.pinned = is_process_local(alias) or caches[alias].get(pin_key(user_pk)) is not None
+        return DEFAULT_DB_ALIAS if self.pinned else self.replica
+
+
+def start_routing(request):
+    """
+    Lets the reads of a safe request go to a replica, unless the client
+    wrote something within the sticky window. Returns the token to pass to
+    `stop_routing`.
+    """
+    config = settings.READ_REPLICAS
+    if not config['ALIASES'] or request.method not in SAFE_METHODS or config['COOKIE'] in request.COOKIES:
+        return replica_routing.set(None)
+    return replica_routing.set(ReplicaRouting(request, random.choice(config['ALIASES'])))
+
+
+def stop_routing(token):
+    replica_routing.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Sends the reads made inside the block to the primary."""
+    token = replica_routing.set(None)
+    try:
+        yield
+    finally:
+        replica_routing.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of safe requests to a read replica and everything else
+    to the primary.
+
+    Reads inside a transaction and every write stay on the primary. After a
+    successful write, ReplicaRoutingMiddleware pins the user to the primary
+    for READ_REPLICAS['STICKY_SECONDS'], so they read their own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = replica_routing.get()
+        if routing is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return routing.read_alias()
+
+    def db_for_write(self, model, **hints):
+        # Also for instances that were read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
@@ -0,0 +1,60 @@
+import os
+import threading
+from collections import deque
+from django.db import connections, router, transaction
+from django.db.models import F
+from common.models import Sequence
+
+
+class SequenceAllocator:
+    """
+    Hands out unique integers from a named database sequence.
+
+    Values are reserved `block_size` at a time and handed out from process
+    memory, so only one allocation in a block costs a round trip. On
+    PostgreSQL the block comes from a native sequence named `<name>_seq`,
+    which is never rolled back and never locks, so any number of processes
+    can allocate at once. Other databases fall back to a row in the
+    `Sequence` table.
+    """
+
+    def __init__(self, name, block_size=100):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._block = deque()
+        self._pid = None
+
+    def next_value(self):
+        return self.next_values(1)[0]
+
+    def next_values(self, count):
+        """Returns `count` unique values, reserving at most one new block for them."""
+        with self._lock:
+            # A forked worker must not reuse the block reserved by its parent
+            if self._pid != os.getpid():
+                self._block.clear()
+                self._pid = os.getpid()
+            if len(self._block) < count:
+                self._block.extend(self.reserve(count - len(self._block)))
+            return [self._block.popleft() for _ in range(count)]
+
+    def reserve(self, minimum=1):
+        alias = router.db_for_write(Sequence)
+        connection = connections[alias]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT nextval(%s) FROM generate_series(1, %s)",
+                    [f"{self.name}_seq", max(minimum, self.block_size)],
+                )
+                return sorted(row[0] for row in cursor.fetchall())
+
+        # A table counter is rolled back with the surrounding transaction,
+        # so inside one only reserve the values that are used in it
+        size = minimum if connection.in_atomic_block else max(minimum, self.block_size)
+        with transaction.atomic(using=alias):
+            Sequence.objects.using(alias).get_or_create(name=self.name)
+            Sequence.objects.using(alias).filter(name=self.name).update(last_value=F('last_value') + size)
+            last_value = Sequence.objects.using(alias).values_list('last_value', flat=True).get(name=self.name)
+        return range(last_value - size + 1, last_value + 1)
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from common.images import image_srcset
 class BaseModelSerializer(serializers.ModelSerializer):
     """
    Base Serializer class that implements shared functionality
@@ -19,3 +20,19 @@ class BaseModelSerializerWithoutCommon(serializers.ModelSerializer):
     class Meta:
         read_only_fields = ("id",)
         fields = '__all__'
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Read only map of the resized variants of the model's image, by variant
+    and format, with a srcset string per format. None until they are built.
+    """
+
+    def __init__(self, image_field='image', **kwargs):
+        self.image_field = image_field
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return image_srcset(instance, self.context.get('request'), self.image_field)
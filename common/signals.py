@@ -0,0 +1,10 @@
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from common.metrics import time_query
+
+
+@receiver(connection_created)
+def install_query_metrics(sender, connection, **kwargs):
+    # Connections are opened again after being closed, or taken from the pool
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
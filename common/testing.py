@@ -0,0 +1,33 @@
+from contextlib import contextmanager
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test.utils import CaptureQueriesContext
+
+
+@contextmanager
+def query_budget(max_queries, using=DEFAULT_DB_ALIAS):
+    """
+    Fails with an AssertionError when the enclosed block runs more than
+    `max_queries` queries, listing the queries that were executed.
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+
+    executed = len(context)
+    if executed > max_queries:
+        queries = "\n".join(
+            "%d. %s" % (number, query["sql"])
+            for number, query in enumerate(context.captured_queries, start=1)
+        )
+        raise AssertionError(
+            "%d queries executed, the budget is %d\nCaptured queries were:\n%s"
+            % (executed, max_queries, queries)
+        )
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin that provides `assertMaxQueries`, an upper bound
+    counterpart of `assertNumQueries` for declaring an endpoint's query budget.
+    """
+    def assertMaxQueries(self, max_queries, using=DEFAULT_DB_ALIAS):
+        return query_budget(max_queries, using=using)
@@ -1,3 +1,268 @@
-from django.test import TestCase
+import io
+import json
+import os
+import smtplib
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+from common.db import pool_stats
+from common.images import image_variants, refresh_variants
+from common.mail import OutboxSender, enqueue_email
+from common.metrics import RETIRED_FILE, MetricsRegistry, new_series
+from common.models import OutboundEmail, Sequence
+from common.sequences import SequenceAllocator
+from common.utils import encode_base32
+from kopero_auth.authentication import CLIENT_ROLE, tokens_for_user
+from kopero_auth.models import Client
+from services.models import Service
 
-# Create your tests here.
+
+class EncodeBase32Tests(TestCase):
+    def test_encoding(self):
+        self.assertEqual(encode_base32(0), "000000")
+        self.assertEqual(encode_base32(31), "00000Z")
+        self.assertEqual(encode_base32(32 * 18 + 1), "0000J1")
+
+
+class SequenceAllocatorTests(TransactionTestCase):
+    def test_workers_get_disjoint_blocks(self):
+        # Two allocators stand in for two worker processes
+        first = SequenceAllocator("test", block_size=5)
+        second = SequenceAllocator("test", block_size=5)
+
+        values = [allocator.next_value() for _ in range(7) for allocator in (first, second)]
+
+        self.assertEqual(len(set(values)), len(values))
+        # Three blocks of five were reserved for fourteen values
+        self.assertEqual(Sequence.objects.get(name="test").last_value, 20)
+
+    def test_only_one_value_is_reserved_inside_a_transaction(self):
+        allocator = SequenceAllocator("test", block_size=5)
+        with transaction.atomic():
+            self.assertEqual(allocator.next_value(), 1)
+        self.assertEqual(Sequence.objects.get(name="test").last_value, 1)
+
+
+class PoolStatsTests(TestCase):
+    def test_stats_of_pooled_aliases(self):
+        self.assertEqual(pool_stats(), {})
+
+        pool = mock.Mock(closed=False)
+        pool.get_stats.return_value = {
+            'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1,
+            'requests_waiting': 3, 'requests_num': 8, 'requests_wait_ms': 20,
+        }
+        with mock.patch.object(type(connections['default']), 'pool', pool, create=True):
+            stats = pool_stats()['default']
+        self.assertEqual(stats['in_use'], 3)
+        self.assertEqual(stats['waiting'], 3)
+        self.assertEqual(stats['queue_wait_ms_avg'], 2.5)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.registry = MetricsRegistry(directory=directory.name, flush_interval=3600)
+        for module in ("common.middleware", "common.views"):
+            patcher = mock.patch(f"{module}.metrics", self.registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.api = APIClient()
+
+    def authenticate(self, is_staff):
+        user = Client.objects.create(email=f"{is_staff}@example.com", username=str(is_staff), is_staff=is_staff)
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens_for_user(user, CLIENT_ROLE)['access']}")
+
+    def test_requests_are_recorded_by_endpoint(self):
+        # Also a fresh version of the cached catalog
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(name="Portraits", tag="photo")
+        self.api.get("/api/v1/services/")
+        self.api.get("/nowhere/")
+
+        series = self.registry.snapshot()
+        services = series["service-list GET"]
+        self.assertEqual((services["count"], services["statuses"]), (1, {"200": 1}))
+        self.assertGreaterEqual(services["queries"], 1)
+        self.assertGreater(services["serialization_seconds"], 0)
+        self.assertEqual(series["<unresolved> GET"]["statuses"], {"404": 1})
+
+    def test_metrics_of_every_worker_are_exposed_to_admins(self):
+        # Files of a worker that exited and of a live one, merged with this
+        # process's series
+        other = new_series()
+        other.update(statuses={"200": 1}, count=1, seconds=0.25, queries=2)
+        other["buckets"][-1] = 1
+        exited = subprocess.Popen([sys.executable, "-c", ""])
+        exited.wait()
+        exited_path = self.registry.path(exited.pid, "0a1b2c3d")
+        for path in (exited_path, self.registry.path(os.getppid(), "4e5f6a7b")):
+            with open(path, "w") as file:
+                json.dump({"service-list GET": other}, file)
+
+        self.authenticate(is_staff=False)
+        self.assertEqual(self.api.get("/metrics").status_code, 403)
+        self.api.get("/api/v1/services/")
+
+        self.authenticate(is_staff=True)
+        response = self.api.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        labels = 'endpoint="service-list",method="GET"'
+        self.assertIn(f'kopero_http_requests_total{{{labels},status="200"}} 3', body)
+        self.assertIn(f'kopero_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3', body)
+        self.assertIn(f'kopero_http_request_duration_seconds_count{{{labels}}} 3', body)
+        self.assertIn('kopero_http_requests_total{endpoint="metrics",method="GET",status="403"} 1', body)
+
+        # The exited worker's file was folded into the retired one, once
+        self.assertFalse(os.path.exists(exited_path))
+        self.assertTrue(os.path.exists(os.path.join(self.registry.directory, RETIRED_FILE)))
+        body = self.api.get("/metrics").content.decode()
+        self.assertIn(f'kopero_http_requests_total{{{labels},status="200"}} 3', body)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class OutboxSenderTests(TestCase):
+    def test_batch_is_sent_and_failures_are_retried(self):
+        first = enqueue_email("Hello", "Body", None, ["first@example.com"], html_message="<p>Body</p>")
+        second = enqueue_email("Hello", "Body", None, ["second@example.com"])
+        sender = OutboxSender(batch_size=10, max_attempts=2, backoff=0)
+        send_messages = sender.connection.send_messages
+
+        def flaky_send(messages):
+            if messages[0].to == ["second@example.com"]:
+                raise smtplib.SMTPRecipientsRefused({})
+            return send_messages(messages)
+
+        with mock.patch.object(sender.connection, "send_messages", flaky_send):
+            self.assertEqual(sender.send_batch(), (1, 1))
+            # Retried once the backoff has passed, then given up on
+            self.assertEqual(sender.send_batch(), (0, 1))
+            self.assertEqual(sender.send_batch(), (0, 0))
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], "text/html")
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, OutboundEmail.SENT)
+        self.assertEqual((second.status, second.attempts), (OutboundEmail.FAILED, 2))
+
+    def test_failed_reconnect_fails_the_rest_of_the_batch(self):
+        emails = [enqueue_email("Hello", "Body", None, [f"{name}@example.com"]) for name in ("first", "second", "third")]
+        sender = OutboxSender(batch_size=10, backoff=0)
+        send_messages = sender.connection.send_messages
+
+        def disconnecting_send(messages):
+            if messages[0].to == ["first@example.com"]:
+                raise smtplib.SMTPServerDisconnected("gone")
+            return send_messages(messages)
+
+        with mock.patch.object(sender.connection, "send_messages", disconnecting_send), \
+                mock.patch.object(sender.connection, "open", side_effect=[None, OSError("refused")]):
+            self.assertEqual(sender.send_batch(), (0, 3))
+
+        self.assertEqual(len(mail.outbox), 0)
+        for email in emails:
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboundEmail.PENDING, 1))
+        self.assertIn("refused", emails[2].last_error)
+
+    def test_unexpected_errors_only_fail_their_email(self):
+        broken = enqueue_email("Hello", "Body", None, ["broken@example.com"])
+        broken.alternatives = [("<p>Body</p>", None, "extra")]
+        broken.save()
+        working = enqueue_email("Hello", "Body", None, ["working@example.com"])
+
+        self.assertEqual(OutboxSender().send_batch(), (1, 1))
+        broken.refresh_from_db()
+        working.refresh_from_db()
+        self.assertEqual(working.status, OutboundEmail.SENT)
+        self.assertIn("ValueError", broken.last_error)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        os.makedirs(os.path.join(self.media_root.name, "variants"))
+        with open(os.path.join(self.media_root.name, "variants", "card.3f2a9c1b7d4e.jpg"), "wb") as file:
+            file.write(bytes(range(256)) * 4)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.url = "/media/variants/card.3f2a9c1b7d4e.jpg"
+
+    def test_range_and_validators(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), bytes(range(10, 20)))
+        self.assertEqual(response["Content-Range"], "bytes 10-19/1024")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2000-")
+        self.assertEqual(response.status_code, 416)
+
+    def test_files_outside_media_root_are_not_served(self):
+        self.assertEqual(self.client.get("/media/../settings.py").status_code, 404)
+        self.assertEqual(self.client.get("/media/variants/").status_code, 404)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=self.media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        # Generate inline instead of on the pool's threads
+        patcher = mock.patch.object(image_variants, "workers", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, color):
+        buffer = io.BytesIO()
+        Image.new("RGB", (2000, 1000), color).save(buffer, format="PNG")
+        return ContentFile(buffer.getvalue(), name="session.png")
+
+    def test_variants_are_written_after_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            service = Service.objects.create(name="Portrait", tag="portrait", image=self.upload("red"))
+        service.refresh_from_db()
+        storage = service.image.storage
+
+        variants = service.image_variants
+        self.assertEqual(variants["source"], service.image.name)
+        self.assertEqual({name: (entry["width"], entry["height"]) for name, entry in variants.items() if name != "source"},
+                         {"thumbnail": (160, 80), "card": (480, 240), "full": (1600, 800)})
+        for name in ("thumbnail", "card", "full"):
+            for extension, format in (("webp", "WEBP"), ("jpeg", "JPEG")):
+                path = variants[name][extension]
+                self.assertTrue(storage.exists(path))
+                with storage.open(path) as file, Image.open(file) as image:
+                    self.assertEqual(image.format, format)
+                    self.assertEqual(image.width, variants[name]["width"])
+
+        # A new image replaces the variants and deletes the old files
+        with self.captureOnCommitCallbacks(execute=True):
+            service.image = self.upload("blue")
+            service.save()
+        service.refresh_from_db()
+        self.assertEqual(service.image_variants["source"], service.image.name)
+        self.assertTrue(storage.exists(service.image_variants["card"]["webp"]))
+        self.assertFalse(storage.exists(variants["card"]["webp"]))
+
+        # Regenerating the same image keeps the content hashed names
+        self.assertTrue(refresh_variants(Service, service.pk, force=True))
+        self.assertEqual(Service.objects.get(pk=service.pk).image_variants, service.image_variants)
@@ -1,17 +1,26 @@
-import random
-import string
-from django.db.models import Max
-from booking.models import Booking
+from django.conf import settings
+from common.sequences import SequenceAllocator
+
+# Crockford's base32 leaves out I, L, O and U so numbers are easy to read out
+CROCKFORD_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+booking_numbers = SequenceAllocator('booking_number', block_size=settings.BOOKING_NUMBER_BLOCK_SIZE)
+
+
+def encode_base32(number, width=6):
+    """Encodes a non-negative integer with Crockford's base32, zero padded to `width`."""
+    digits = []
+    while number:
+        number, remainder = divmod(number, 32)
+        digits.append(CROCKFORD_ALPHABET[remainder])
+    return ''.join(reversed(digits)).rjust(width, '0')
+
 
 def generate_booking_number():
-    """Generates a unique booking number in the format AADADD0001 with incrementing numbers."""
-
-    random_letters = ''.join(random.choices(string.ascii_uppercase, k=6))
-    last_booking_number = Booking.objects.aggregate(Max('booking_number'))['booking_number__max']
-    
-    if last_booking_number:
-        last_number = int(last_booking_number[-4:])
-        new_number = f"{last_number + 1:04d}"
-    else:
-        new_number = "0001"
-    return f"{random_letters}{new_number}"
\ No newline at end of file
+    """Generates a unique booking number in the format KS00001A from the booking number sequence."""
+    return generate_booking_numbers(1)[0]
+
+
+def generate_booking_numbers(count):
+    """Generates `count` unique booking numbers with at most one round trip."""
+    return [f"KS{encode_base32(value)}" for value in booking_numbers.next_values(count)]
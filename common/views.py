@@ -1,29 +1,96 @@
-import datetime
+import hashlib
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from django.db.models import Model
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import exceptions, status
 from rest_framework.generics import GenericAPIView
+from rest_framework.permissions import IsAdminUser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 from django.db.models import Q
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from common.db import pool_stats
+from common.metrics import PROMETHEUS_CONTENT_TYPE, metrics, render_prometheus
+from common.models import live_only
+from common.pagination import AsyncPageNumberPagination, KeysetPagination
+from common.renderers import CSVRenderer, MeasuredJSONRenderer, NDJSONRenderer
+from kopero_auth.authentication import ClaimsJWTAuthentication
 
 # Create your views here.
-class BaseListView(GenericAPIView):
+class KeysetPaginationMixin:
     """
-        Fetch all instances of a resource or create new resource
+    Opt-in keyset pagination for list views.
+    Requests carrying a `cursor` query parameter (empty for the first page)
+    are paginated by `keyset_ordering` instead of page numbers, which skips
+    the COUNT query and keeps deep pages as cheap as the first one.
     """
 
-    model = None
-    filter_object = None
-    read_serializer_class = None
+    keyset_pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
 
-    def get_read_serializer_class(self):
-        if self.read_serializer_class is not None:
-            return self.read_serializer_class
-        return self.serializer_class
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_param = self.keyset_pagination_class.cursor_query_param
+            if cursor_param in self.request.query_params:
+                self._paginator = self.keyset_pagination_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+
+class StreamingExportMixin:
+    """
+    Streams `?all=` responses requested with `format=ndjson` or `format=csv`.
+    The queryset is read in chunks with a server-side cursor and every chunk
+    is serialized and written out before the next one is fetched, so memory
+    stays flat whatever the number of rows.
+    """
+
+    export_renderer_classes = (NDJSONRenderer, CSVRenderer)
+    export_chunk_size = 2000
+
+    def get_renderers(self):
+        return super().get_renderers() + [renderer() for renderer in self.export_renderer_classes]
+
+    def is_streaming_export(self, request):
+        return isinstance(getattr(request, 'accepted_renderer', None), self.export_renderer_classes)
+
+    def stream_queryset(self, queryset, serializer_class, context=None):
+        renderer = self.request.accepted_renderer
+        if context is None:
+            context = {'request': self.request}
+
+        def rows():
+            chunk = []
+            for instance in queryset.iterator(chunk_size=self.export_chunk_size):
+                chunk.append(instance)
+                if len(chunk) == self.export_chunk_size:
+                    yield from serializer_class(chunk, many=True, context=context).data
+                    chunk = []
+            if chunk:
+                yield from serializer_class(chunk, many=True, context=context).data
+
+        response = StreamingHttpResponse(renderer.stream(rows()), content_type=f'{renderer.media_type}; charset={renderer.charset}')
+        filename = queryset.model._meta.model_name
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{renderer.format}"'
+        return response
+
+
+class BaseListView(StreamingExportMixin, KeysetPaginationMixin, GenericAPIView):
+    """
+        Fetch all instances of a resource or create new resource
+    """
 
-    # Start with filtering for non-deleted records, if applicable
     model = None
-    filter_object = Q()  # Initialize with an empty Q object
+    filter_object = Q()  # Extra filter applied to every request
     read_serializer_class = None
 
     def get_read_serializer_class(self):
@@ -34,16 +101,16 @@ class BaseListView(GenericAPIView):
     def get_queryset(self):
         if not self.model:
             raise AssertionError(f"{self.__class__.__name__} should either include a `model` attribute or override the `get_queryset` method.")
-        
-        if hasattr(self.model, "is_deleted"):
-            self.filter_object &= Q(is_deleted=False)
 
-        return self.model.objects.filter(self.filter_object)
+        # Soft-deleted records are left out, if applicable
+        return live_only(self.model.objects.filter(self.filter_object))
 
     def get(self, request):
         all_status = request.GET.get("all", None)
         if all_status is not None:
             queryset = self.get_queryset()
+            if self.is_streaming_export(request):
+                return self.stream_queryset(queryset, self.get_read_serializer_class())
             serializer = self.get_read_serializer_class()(queryset, many=True)
             return Response(serializer.data)
         else:
@@ -69,6 +136,8 @@ class ImageBaseListView(BaseListView):
         all_status = request.GET.get("all", None)
         if all_status is not None:
             queryset = self.get_queryset()
+            if self.is_streaming_export(request):
+                return self.stream_queryset(queryset, self.get_read_serializer_class(), context={'request':request})
             serializer = self.get_read_serializer_class()(queryset, many=True,context={'request':request})
             return Response(serializer.data)
         else:
@@ -85,7 +154,126 @@ class ImageBaseListView(BaseListView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class BaseDetailView(GenericAPIView):
+class PreconditionResponse(Exception):
+    """Short-circuits a request with a 304 or 412 response before the handler runs."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+class ConditionalRequestMixin:
+    """
+    ETag and Last-Modified validators for detail views, computed from
+    `last_modified_fields` (`updated_at` by default).
+
+    Requests carrying preconditions are checked with a single `values_list`
+    query on `get_validator_queryset` before the object is loaded: GET and HEAD answer `If-None-Match`
+    and `If-Modified-Since` with 304 Not Modified, and PUT and PATCH whose
+    `If-Match` or `If-Unmodified-Since` is stale are refused with 412
+    Precondition Failed, without hydrating or serializing the object.
+    Successful responses carry the validators of the object they served,
+    so plain requests cost no extra query. Models without the fields are
+    served as before.
+    """
+
+    last_modified_fields = ('updated_at',)
+    conditional_methods = ('GET', 'HEAD', 'PUT', 'PATCH')
+    precondition_headers = ('HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE')
+
+    def has_validators(self, model):
+        try:
+            model._meta.get_field(self.last_modified_fields[0])
+        except FieldDoesNotExist:
+            return False
+        return True
+
+    def make_validators(self, request, model, pk, values):
+        timestamps = [value for value in values if value is not None]
+        last_modified = int(max(timestamps).timestamp()) if timestamps else None
+        representation = getattr(request.accepted_renderer, 'format', '')
+        source = ':'.join([model._meta.label, str(pk), representation] + [str(value) for value in values])
+        etag = f'"{hashlib.md5(source.encode(), usedforsecurity=False).hexdigest()}"'
+        return etag, last_modified
+
+    def get_validator_queryset(self, request):
+        """
+        Objects whose validators a request may learn. Views that check
+        ownership in the handler narrow it the same way, or a 304 or 412
+        would answer for objects the user is not allowed to see.
+        """
+        return self.get_queryset(request)
+
+    def get_validators(self, request, pk):
+        """Reads the validators of `pk` without loading the object."""
+        queryset = self.get_validator_queryset(request)
+        if isinstance(queryset, type) and issubclass(queryset, Model):
+            queryset = queryset._default_manager.all()
+        if not self.has_validators(queryset.model):
+            return None, None
+
+        values = queryset.filter(pk=pk).values_list(*self.last_modified_fields).first()
+        if values is None:
+            return None, None
+        return self.make_validators(request, queryset.model, pk, values)
+
+    def get_object_validators(self, request, instance):
+        """Computes the same validators as `get_validators` from a loaded object."""
+        if not self.has_validators(instance):
+            return None, None
+
+        values = []
+        for field in self.last_modified_fields:
+            value = instance
+            for attribute in field.split('__'):
+                try:
+                    value = getattr(value, attribute)
+                except ObjectDoesNotExist:
+                    value = None
+                if value is None:
+                    break
+            values.append(value)
+        return self.make_validators(request, type(instance), instance.pk, values)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.conditional_object = None
+        pk = kwargs.get('pk')
+        if pk is None or request.method not in self.conditional_methods:
+            return
+        if not any(header in request.META for header in self.precondition_headers):
+            return
+
+        etag, last_modified = self.get_validators(request, pk)
+        if etag is None:
+            return
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            if response.status_code == status.HTTP_304_NOT_MODIFIED:
+                self.set_validators(response, etag, last_modified)
+            raise PreconditionResponse(response)
+
+    def set_validators(self, response, etag, last_modified):
+        response.headers.setdefault('ETag', etag)
+        if last_modified is not None:
+            response.headers.setdefault('Last-Modified', http_date(last_modified))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, PreconditionResponse):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        instance = getattr(self, 'conditional_object', None)
+        if instance is not None and request.method in self.conditional_methods and response.status_code == status.HTTP_200_OK:
+            # Writes update the instance in place, so this hands back its new validators
+            etag, last_modified = self.get_object_validators(request, instance)
+            if etag is not None:
+                self.set_validators(response, etag, last_modified)
+        return response
+
+
+class BaseDetailView(ConditionalRequestMixin, GenericAPIView):
     """
     Update, Delete, or View a resource
     """
@@ -100,12 +288,12 @@ class BaseDetailView(GenericAPIView):
         return self.serializer_class
 
     def get_queryset(self, request):
-        queryset = self.model
-        return queryset
+        return live_only(self.model._default_manager.all())
 
     def get_object(self, request, pk):
         queryset = self.get_queryset(request)
-        return get_object_or_404(queryset, pk=pk)
+        self.conditional_object = get_object_or_404(queryset, pk=pk)
+        return self.conditional_object
 
     def get(self, request, pk):
         item = self.get_object(request, pk)
@@ -118,7 +306,7 @@ class BaseDetailView(GenericAPIView):
             item, data=request.data, partial=True
         )
         if serializer.is_valid():
-            serializer.save(modified_by=request.user)
+            serializer.save(modified_by_id=request.user.pk)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -126,8 +314,8 @@ class BaseDetailView(GenericAPIView):
         item = self.get_object(request, pk)
         if hasattr(item, "is_deleted"):
             item.is_deleted = True
-            item.deleted_at = datetime.datetime.now(tz=timezone.utc)
-            item.modified_by = request.user
+            item.deleted_at = timezone.now()
+            item.modified_by_id = request.user.pk
             item.save()
         else:
             item.delete()
@@ -151,7 +339,7 @@ class ImageBaseDetailView(BaseDetailView):
             item, data=request.data, partial=True, context={'request':request}
         )
         if serializer.is_valid():
-            serializer.save(modified_by=request.user)
+            serializer.save(modified_by_id=request.user.pk)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -159,9 +347,171 @@ class ImageBaseDetailView(BaseDetailView):
         item = self.get_object(request, pk)
         if hasattr(item, "is_deleted"):
             item.is_deleted = True
-            item.deleted_at = datetime.datetime.now(tz=timezone.utc)
-            item.modified_by = request.user
+            item.deleted_at = timezone.now()
+            item.modified_by_id = request.user.pk
             item.save()
         else:
             item.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AsyncAPIView(View):
+    """
+    JSON view running natively on the ASGI event loop.
+
+    DRF views are synchronous, so under ASGI every request is handed to a
+    thread. Subclasses implement `async def get` (or `post`, reading the
+    parsed `request.data`) with the async ORM and return a DRF Response,
+    which is rendered as JSON. The request is a DRF
+    Request authenticated from the access token claims and the cached user
+    state, awaited before the permission checks; token authentication stays
+    on the sync views.
+    """
+
+    authentication_classes = (ClaimsJWTAuthentication,)
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    parser_classes = api_settings.DEFAULT_PARSER_CLASSES
+    renderer_class = MeasuredJSONRenderer
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token authenticated like APIView, so exempt from CSRF the same way
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self.request = Request(
+            request,
+            parsers=[parser() for parser in self.parser_classes],
+            authenticators=[auth() for auth in self.authentication_classes],
+        )
+        try:
+            await self.perform_authentication(self.request)
+            self.check_permissions(self.request)
+            response = await super().dispatch(self.request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        return self.finalize_response(self.request, response)
+
+    def get_renderer_context(self):
+        return {'view': self, 'args': self.args, 'kwargs': self.kwargs, 'request': self.request}
+
+    async def perform_authentication(self, request):
+        """
+        Request._authenticate awaiting the authenticators' `aauthenticate`,
+        as the user state they read may need a query.
+        """
+        for authenticator in request.authenticators:
+            try:
+                user_auth_tuple = await authenticator.aauthenticate(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    def check_permissions(self, request):
+        for permission in [permission() for permission in self.permission_classes]:
+            if not permission.has_permission(request, self):
+                if request.authenticators and not request.successful_authenticator:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied(
+                    detail=getattr(permission, 'message', None), code=getattr(permission, 'code', None)
+                )
+
+    def handle_exception(self, exc):
+        """Turns the exception into a response the way APIView does."""
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            authenticators = self.request.authenticators
+            auth_header = authenticators[0].authenticate_header(self.request) if authenticators else None
+            if auth_header:
+                exc.auth_header = auth_header
+            else:
+                exc.status_code = status.HTTP_403_FORBIDDEN
+
+        response = api_settings.EXCEPTION_HANDLER(exc, self.get_renderer_context())
+        if response is None:
+            raise exc
+        return response
+
+    def finalize_response(self, request, response):
+        if not isinstance(response, Response):
+            return response
+        renderer = self.renderer_class()
+        response.accepted_renderer = renderer
+        response.accepted_media_type = renderer.media_type
+        response.renderer_context = self.get_renderer_context()
+        # Rendering is CPU only, do it here rather than from a thread
+        return response.render()
+
+
+class AsyncGenericView(AsyncAPIView):
+    """
+    AsyncAPIView with a paginator whose `apaginate_queryset` reads the page
+    with the async ORM.
+    """
+
+    pagination_class = AsyncPageNumberPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
+
+class AsyncListView(KeysetPaginationMixin, AsyncGenericView):
+    """
+    Async counterpart of BaseListView's GET, with the same page number
+    and keyset pagination. `?all=` returns every row as one JSON list.
+    """
+
+    model = None
+    read_serializer_class = None
+
+    def get_queryset(self):
+        if not self.model:
+            raise AssertionError(f"{self.__class__.__name__} should either include a `model` attribute or override the `get_queryset` method.")
+        return live_only(self.model.objects.all())
+
+    async def get(self, request):
+        return Response(await self.list(request))
+
+    async def list(self, request):
+        """Returns the serialized page, or every row with `?all=`."""
+        queryset = self.get_queryset()
+        page = None
+        if request.query_params.get("all") is None:
+            page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        rows = page if page is not None else [row async for row in queryset]
+        data = self.read_serializer_class(rows, many=True, context=self.get_serializer_context()).data
+        if page is None:
+            return data
+        return self.paginator.get_paginated_response(data).data
+
+
+class DatabasePoolStatsView(APIView):
+    """
+    Connection pool stats of the worker process answering the request
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(pool_stats())
+
+
+class MetricsView(APIView):
+    """
+    Per endpoint request metrics of every worker in the Prometheus text format
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(render_prometheus(metrics.collect()), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -9,6 +9,22 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # MEDIA settings
 MEDIA_URL = '/media/'  # URL to access media files
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Directory to store media files
+# Media is served by common.media.serve_media. Set ACCEL_REDIRECT to
+# 'x-accel-redirect' (nginx, with an internal location at ACCEL_PREFIX
+# aliasing MEDIA_ROOT) or 'x-sendfile' to let the front proxy send the files
+MEDIA_SERVING = {
+    'ACCEL_REDIRECT': config('MEDIA_ACCEL_REDIRECT', default=''),
+    'ACCEL_PREFIX': config('MEDIA_ACCEL_PREFIX', default='/internal-media/'),
+    'MAX_AGE': config('MEDIA_MAX_AGE', cast=int, default=60 * 60),
+}
+
+# Resized copies of uploaded images, see common.images. SIZES is the longest
+# edge of each variant in pixels, WORKERS=0 builds them inline after commit
+IMAGE_VARIANTS = {
+    'SIZES': {'thumbnail': 160, 'card': 480, 'full': 1600},
+    'WORKERS': config('IMAGE_VARIANTS_WORKERS', cast=int, default=2),
+    'MODELS': ['kopero_auth.BaseUser', 'services.Service'],
+}
 
 # Site configuration
 SITE_ID = config("SITE_ID", cast=int)
@@ -43,6 +59,7 @@ THIRD_PARTY_APPS = [
 
 # Local apps
 LOCAL_APPS = [
+    'common.apps.CommonConfig',
     'kopero_auth.apps.KoperoAuthConfig',
     'services.apps.ServicesConfig',
     'booking.apps.BookingConfig',
@@ -54,12 +71,14 @@ INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 # Middleware
 MIDDLEWARE = [
+    'common.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'common.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
@@ -93,7 +112,7 @@ AUTH_USER_MODEL = 'kopero_auth.BaseUser'
 # REST framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'kopero_auth.authentication.ClaimsJWTAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -102,6 +121,62 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': config('PAGE_SIZE', cast=int, default=10),
     'COERCE_DECIMAL_TO_STRING': False,
+    'DEFAULT_RENDERER_CLASSES': (
+        'common.renderers.MeasuredJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Per endpoint request metrics, see common.metrics. Each worker process
+# writes its own file to METRICS_DIRECTORY, which /metrics merges, folding
+# the files of exited workers into one; the directory must be local to the
+# host. Leave it empty to only report the metrics of the worker answering
+# the scrape.
+METRICS = {
+    'DIRECTORY': config('METRICS_DIRECTORY', default=''),
+    'FLUSH_INTERVAL': config('METRICS_FLUSH_INTERVAL', cast=float, default=5),
+}
+
+# Caches, point CACHE_BACKEND/CACHE_LOCATION at a shared backend (e.g. redis)
+# in production. The local memory or file based backends stand in for it.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='kopero'),
+    }
+}
+
+# Read replicas, see common.routers. The environment settings add the
+# replica DATABASES and list their aliases. Safe requests read from one of
+# them, unless the client wrote something in the last STICKY_SECONDS.
+# CACHE holds the per user pins and must be shared by every worker, with a
+# locmem CACHE the reads of authenticated users all stay on the primary.
+DATABASE_ROUTERS = ['common.routers.ReplicaRouter']
+READ_REPLICAS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': config('REPLICA_STICKY_SECONDS', cast=int, default=10),
+    'COOKIE': 'pin_primary',
+    'CACHE': 'default',
+}
+
+# Services catalog read-through cache. With a locmem ALIAS every worker keeps
+# its own catalog version, other workers then serve entries for up to
+# LOCAL_TIMEOUT seconds after a change.
+CATALOG_CACHE = {
+    'ALIAS': 'default',
+    'SHARED': config('CATALOG_CACHE_SHARED', cast=bool, default=True),
+    'LOCAL_SIZE': config('CATALOG_CACHE_LOCAL_SIZE', cast=int, default=256),
+    'LOCAL_TIMEOUT': config('CATALOG_CACHE_LOCAL_TIMEOUT', cast=int, default=60),
+    'TIMEOUT': config('CATALOG_CACHE_TIMEOUT', cast=int, default=60 * 60 * 24),
+}
+
+# Crew directory cache, invalidated by kopero_auth.signals, LOCAL_TIMEOUT as above
+CREW_DIRECTORY_CACHE = {
+    'ALIAS': 'default',
+    'SHARED': config('CREW_DIRECTORY_CACHE_SHARED', cast=bool, default=True),
+    'LOCAL_SIZE': config('CREW_DIRECTORY_CACHE_LOCAL_SIZE', cast=int, default=512),
+    'LOCAL_TIMEOUT': config('CREW_DIRECTORY_CACHE_LOCAL_TIMEOUT', cast=int, default=60),
+    'TIMEOUT': config('CREW_DIRECTORY_CACHE_TIMEOUT', cast=int, default=60 * 60),
 }
 
 # Simple JWT settings
@@ -118,6 +193,25 @@ SIMPLE_JWT = {
     'USER_ID_FIELD': 'id',
     'USER_ID_CLAIM': 'user_id',
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    'TOKEN_REFRESH_SERIALIZER': 'kopero_auth.serializers.FilteredTokenRefreshSerializer',
+}
+
+# Active, deleted and staff flags of token users, re-checked at least this often
+USER_STATE_CACHE = {
+    'ALIAS': 'default',
+    'TIMEOUT': config('USER_STATE_CACHE_TIMEOUT', cast=int, default=60),
+}
+
+# In-process filter in front of the token blacklist, see kopero_auth.blacklist.
+# The filter and recently blacklisted tokens are shared through ALIAS, a cache
+# shared by every process; run rebuild_token_blacklist_filter more often than
+# REBUILD_INTERVAL so requests never rebuild it. With a locmem ALIAS the filter
+# is bypassed, every token is looked up in the blacklist and the
+# kopero_auth.W001 system check warns about it.
+TOKEN_BLACKLIST_FILTER = {
+    'ALIAS': 'default',
+    'REBUILD_INTERVAL': config('TOKEN_BLACKLIST_FILTER_REBUILD_INTERVAL', cast=int, default=300),
+    'ERROR_RATE': config('TOKEN_BLACKLIST_FILTER_ERROR_RATE', cast=float, default=0.01),
 }
 
 USE_JWT = True
@@ -139,6 +233,13 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing pool used by kopero_auth.hashing, WORKERS=0 hashes inline
+PASSWORD_HASHING = {
+    'WORKERS': config('PASSWORD_HASHING_WORKERS', cast=int, default=2),
+    'MAX_PENDING': config('PASSWORD_HASHING_MAX_PENDING', cast=int, default=16),
+    'RETRY_AFTER': config('PASSWORD_HASHING_RETRY_AFTER', cast=int, default=2),
+}
+
 # Internationalization
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -157,6 +258,15 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 
+# Outbox drained by the send_outbound_email command, see common.mail
+EMAIL_OUTBOX = {
+    'BATCH_SIZE': config('EMAIL_OUTBOX_BATCH_SIZE', cast=int, default=50),
+    'MAX_ATTEMPTS': config('EMAIL_OUTBOX_MAX_ATTEMPTS', cast=int, default=5),
+    'BACKOFF': config('EMAIL_OUTBOX_BACKOFF', cast=int, default=60),
+    'LEASE': config('EMAIL_OUTBOX_LEASE', cast=int, default=300),
+    'POLL_INTERVAL': config('EMAIL_OUTBOX_POLL_INTERVAL', cast=float, default=5),
+}
+
 # CORS_ALLOW_HEADERS = list(default_headers) + [
 #     'authorization',
 # ]
@@ -169,3 +279,13 @@ EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 # ]
 
 FRONTEND_URL = "https://kopero-studios.vercel.app"
+
+# Soft-deleted rows of MODELS are hard-deleted by the purge_soft_deleted
+# command once they have been deleted for RETENTION_DAYS
+SOFT_DELETE = {
+    'RETENTION_DAYS': config('SOFT_DELETE_RETENTION_DAYS', cast=int, default=90),
+    'MODELS': ['booking.Review', 'booking.Booking', 'kopero_auth.Client', 'kopero_auth.CrewMember'],
+}
+
+# Booking numbers reserved per worker in one round trip
+BOOKING_NUMBER_BLOCK_SIZE = config("BOOKING_NUMBER_BLOCK_SIZE", cast=int, default=100)
@@ -16,4 +16,37 @@ DATABASES = {
     )
 }
 
-ALLOWED_HOSTS = config("ALLOWED_HOSTS", cast=Csv())
\ No newline at end of file
+# Every worker process keeps a psycopg pool of persistent connections, so
+# requests skip the TLS and auth handshake. Connections are checked when
+# taken from the pool and replaced if the server or a proxy dropped them.
+# The pool's stats are served by common.views.DatabasePoolStatsView.
+# Size it so workers * DB_POOL_MAX_SIZE stays below the server's max_connections.
+if config("DB_POOL", cast=bool, default=True):
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+        "min_size": config("DB_POOL_MIN_SIZE", cast=int, default=2),
+        "max_size": config("DB_POOL_MAX_SIZE", cast=int, default=10),
+        # Seconds a request waits for a free connection before failing
+        "timeout": config("DB_POOL_TIMEOUT", cast=float, default=10),
+        # Seconds before idle connections above min_size are closed
+        "max_idle": config("DB_POOL_MAX_IDLE", cast=float, default=600),
+        # Seconds before a connection is recycled
+        "max_lifetime": config("DB_POOL_MAX_LIFETIME", cast=float, default=3600),
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = config("CONN_MAX_AGE", cast=int, default=60)
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+ALLOWED_HOSTS = config("ALLOWED_HOSTS", cast=Csv())
+
+# Read replicas, as comma separated DATABASE_REPLICA_URLS. They share the
+# pool and health check settings of the primary.
+for index, url in enumerate(config("DATABASE_REPLICA_URLS", cast=Csv(), default=""), start=1):
+    replica = dj_database_url_fix(dj_database_url.parse(url))
+    replica["OPTIONS"] = {**DATABASES["default"].get("OPTIONS", {}), **replica.get("OPTIONS", {})}
+    replica["CONN_MAX_AGE"] = DATABASES["default"]["CONN_MAX_AGE"]
+    replica["CONN_HEALTH_CHECKS"] = DATABASES["default"]["CONN_HEALTH_CHECKS"]
+    # Tests read the test primary through the replica connection
+    replica["TEST"] = {"MIRROR": "default"}
+    DATABASES[f"replica_{index}"] = replica
+    READ_REPLICAS["ALIASES"].append(f"replica_{index}")
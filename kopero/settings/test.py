@@ -0,0 +1,25 @@
+from .base import *
+
+# Database
+# The test runner creates `default` and `replica` from scratch. Nothing
+# replicates into `replica`, so a test that routes reads to it with
+# READ_REPLICAS['ALIASES'] sees a replica that is lagging behind.
+# `default` is a file rather than sqlite's in-memory test database, so
+# threads of the concurrency tests get connections to the same database.
+# Transactions take the write lock when they begin and wait for it, rather
+# than failing when a read lock cannot be upgraded.
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test.sqlite3',
+        'OPTIONS': {'timeout': 20, 'transaction_mode': 'IMMEDIATE'},
+        'TEST': {'NAME': BASE_DIR / 'test_default.sqlite3'},
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_replica.sqlite3',
+    },
+}
+
+# Fast hashing, the tests do not need slow password hashes
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
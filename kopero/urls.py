@@ -15,15 +15,21 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import include, path
-from django.conf.urls.static import static
+import re
+from django.urls import include, path, re_path
 from django.conf import settings
+from common.media import serve_media
+from common.views import DatabasePoolStatsView, MetricsView
 
-MEDIA_ROUTE = static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+MEDIA_ROUTE = [
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+]
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/auth/', include('kopero_auth.urls')),
     path('api/v1/services/', include('services.urls')),
     path('api/v1/booking/', include('booking.urls')),
+    path('api/v1/status/db-pool/', DatabasePoolStatsView.as_view(), name='db_pool_stats'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ] + MEDIA_ROUTE
@@ -1,6 +1,8 @@
 from allauth.account.adapter import DefaultAccountAdapter
+from allauth.core import context as allauth_context
 from django.contrib.sites.shortcuts import get_current_site
 from django.core.mail import EmailMessage
+from common.mail import enqueue_message
 from django.http.response import HttpResponseRedirect
 from django.template.loader import render_to_string
 from django.template import TemplateDoesNotExist
@@ -45,6 +47,18 @@ class CustomAccountAdapter(DefaultAccountAdapter):
             user.save()
         return user
 
+    def send_mail(self, template_prefix, email, context):
+        """
+        Queues the rendered email in the outbox instead of sending it inline.
+        """
+        ctx = {
+            "email": email,
+            "current_site": get_current_site(allauth_context.request),
+        }
+        ctx.update(context)
+        msg = self.render_mail(template_prefix, email, ctx)
+        enqueue_message(msg)
+
     def clean_email(self, email):
         """
         Normalize the email address by lowercasing it.
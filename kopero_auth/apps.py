@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class KoperoAuthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'kopero_auth'
+
+    def ready(self):
+        import kopero_auth.checks
+        import kopero_auth.signals
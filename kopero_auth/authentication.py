@@ -0,0 +1,175 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .blacklist import token_blacklist_filter
+
+CLIENT_ROLE = 'client'
+CREW_ROLE = 'crew'
+REFUSED_STATE = {'is_active': False, 'is_deleted': True, 'is_staff': False}
+
+
+def user_state_key(user_id):
+    return f'user-state:{user_id}'
+
+
+def user_state_queryset(user_id):
+    # From the primary, a replica may not have a new user yet
+    users = get_user_model().objects.using(DEFAULT_DB_ALIAS)
+    return users.filter(pk=user_id).values('is_active', 'is_deleted', 'is_staff')
+
+
+def user_state(user_id):
+    """
+    The active, deleted and staff flags of a user, cached for
+    USER_STATE_CACHE['TIMEOUT'] seconds so a deactivated, deleted or demoted
+    user loses access within that time whatever their token claims.
+    Saving a user drops the entry, see kopero_auth.signals.
+    """
+    backend = caches[settings.USER_STATE_CACHE['ALIAS']]
+    key = user_state_key(user_id)
+    state = backend.get(key)
+    if state is None:
+        # Users that do not exist are cached too, as refused
+        state = user_state_queryset(user_id).first() or REFUSED_STATE
+        backend.set(key, state, settings.USER_STATE_CACHE['TIMEOUT'])
+    return state
+
+
+async def auser_state(user_id):
+    """`user_state` for views running on the event loop."""
+    backend = caches[settings.USER_STATE_CACHE['ALIAS']]
+    key = user_state_key(user_id)
+    state = await backend.aget(key)
+    if state is None:
+        state = await user_state_queryset(user_id).afirst() or REFUSED_STATE
+        await backend.aset(key, state, settings.USER_STATE_CACHE['TIMEOUT'])
+    return state
+
+
+class FilteredRefreshToken(RefreshToken):
+    """
+    Refresh token that only queries the blacklist when the in-process
+    blacklist filter cannot rule the token out.
+    """
+
+    def check_blacklist(self):
+        if token_blacklist_filter.might_be_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+
+def tokens_for_user(user, role):
+    """
+    Returns a refresh and access token pair for `user`. The role is stored
+    as a claim so requests can be authenticated without reading the user
+    row; the staff flag comes from `user_state`.
+    """
+    refresh = FilteredRefreshToken.for_user(user)
+    refresh['role'] = role
+    return {
+        "refresh": str(refresh),
+        "access": str(refresh.access_token)
+    }
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    User backed by the claims of an access token.
+    The id and role are answered from the claims and the staff flag from
+    the cached user state, anything else loads the user row once, on first
+    access.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, validated_token, is_staff):
+        user_model = get_user_model()
+        user_id = user_model._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        super().__init__(lambda: self.load_user(user_model, user_id))
+        # Bypass LazyObject.__setattr__, which would load the user
+        self.__dict__['claims'] = {
+            'pk': user_id,
+            'role': validated_token.get('role'),
+            'is_staff': is_staff,
+        }
+
+    @staticmethod
+    def load_user(user_model, user_id):
+        try:
+            user = user_model.objects.get(pk=user_id)
+        except user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+    def __bool__(self):
+        return True
+
+    @property
+    def pk(self):
+        return self.__dict__['claims']['pk']
+
+    id = pk
+
+    @property
+    def role(self):
+        role = self.__dict__['claims']['role']
+        if role is None:
+            # Tokens issued before the role claim existed
+            from .models import CrewMember
+            role = CREW_ROLE if CrewMember.objects.filter(pk=self.pk).exists() else CLIENT_ROLE
+            self.__dict__['claims']['role'] = role
+        return role
+
+    @property
+    def is_staff(self):
+        return self.__dict__['claims']['is_staff']
+
+    @property
+    def is_loaded(self):
+        return self._wrapped is not empty
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that does not read the user row.
+    `request.user` is a `ClaimsUser`, which only queries the database when a
+    view needs more than the id, role or staff flag. Access tokens live for
+    years, so the active, deleted and staff flags are not carried in the
+    claims but checked on every request against the short lived cache of
+    `user_state`.
+    """
+
+    def get_user_id(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        return get_user_model()._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+
+    def get_user(self, validated_token):
+        return self.user_for_state(validated_token, user_state(self.get_user_id(validated_token)))
+
+    def user_for_state(self, validated_token, state):
+        if state['is_deleted']:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not state['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return ClaimsUser(validated_token, is_staff=state['is_staff'])
+
+    async def aauthenticate(self, request):
+        """`authenticate` reading the user state without blocking the event loop."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        state = await auser_state(self.get_user_id(validated_token))
+        return self.user_for_state(validated_token, state), validated_token
@@ -0,0 +1,139 @@
+import hashlib
+import math
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from common.cache import is_process_local
+
+
+class BloomFilter:
+    """
+    Fixed size set of strings that can answer "definitely absent" or
+    "maybe present", with a false positive rate of about `error_rate` while
+    it holds at most `capacity` items.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big') | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+class TokenBlacklistFilter:
+    """
+    In-process pre-check for the simplejwt token blacklist.
+
+    A Bloom filter of the unexpired blacklisted token ids is rebuilt every
+    `rebuild_interval` seconds. Tokens blacklisted since then are marked in
+    the shared cache until every process has rebuilt past them. A token that
+    is neither in the filter nor marked is not blacklisted and needs no
+    query; anything else is confirmed against the database.
+
+    The rebuild_token_blacklist_filter command builds the filter and
+    publishes it in the shared cache; run on a schedule, request threads
+    only load the published filter. They build it themselves when the
+    published one is missing or older than `rebuild_interval`.
+
+    Markers in a process-local cache (locmem, dummy) never reach the other
+    workers, so with such an alias every token is checked in the database.
+    A system check warns about it, see kopero_auth.checks.
+    """
+
+    filter_key = 'token-blacklist-filter'
+
+    def __init__(self, rebuild_interval=300, error_rate=0.01, alias='default'):
+        self.rebuild_interval = rebuild_interval
+        self.error_rate = error_rate
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._filter = None
+        self._built_at = None
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @property
+    def enabled(self):
+        return not is_process_local(self.alias)
+
+    @property
+    def marker_timeout(self):
+        # Long enough to cover the oldest filter still in use plus a rebuild
+        return 2 * self.rebuild_interval + 60
+
+    def marker_key(self, jti):
+        return f'token-blacklist:{jti}'
+
+    def build(self):
+        """Returns a filter of the unexpired blacklisted tokens and when it was built."""
+        jtis = (
+            BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+            .values_list('token__jti', flat=True)
+        )
+        # Wall clock time, compared across processes
+        built_at = time.time()
+        # Leave headroom for the tokens added locally until the next rebuild
+        bloom = BloomFilter(int(jtis.count() * 1.25) + 1024, self.error_rate)
+        for jti in jtis.iterator(chunk_size=5000):
+            bloom.add(jti)
+        return bloom, built_at
+
+    def publish(self):
+        """Builds the filter, uses it and shares it with every other process."""
+        bloom, built_at = self.build()
+        self.backend.set(self.filter_key, (bloom, built_at), timeout=self.marker_timeout)
+        self._filter, self._built_at = bloom, built_at
+
+    def rebuild(self):
+        published = self.backend.get(self.filter_key)
+        if published is not None and time.time() - published[1] <= self.rebuild_interval:
+            self._filter, self._built_at = published
+        else:
+            self.publish()
+
+    def get_filter(self):
+        if self._filter is None or time.time() - self._built_at > self.rebuild_interval:
+            # Only one thread rebuilds, the others keep using the old filter
+            if self._lock.acquire(blocking=self._filter is None):
+                try:
+                    if self._filter is None or time.time() - self._built_at > self.rebuild_interval:
+                        self.rebuild()
+                finally:
+                    self._lock.release()
+        return self._filter
+
+    def add(self, jti):
+        """Records a newly blacklisted token for this and every other process."""
+        self.backend.set(self.marker_key(jti), 1, timeout=self.marker_timeout)
+        if self._filter is not None:
+            self._filter.add(jti)
+
+    def might_be_blacklisted(self, jti):
+        if not self.enabled:
+            return True
+        return jti in self.get_filter() or self.backend.get(self.marker_key(jti)) is not None
+
+
+token_blacklist_filter = TokenBlacklistFilter(
+    rebuild_interval=settings.TOKEN_BLACKLIST_FILTER['REBUILD_INTERVAL'],
+    error_rate=settings.TOKEN_BLACKLIST_FILTER['ERROR_RATE'],
+    alias=settings.TOKEN_BLACKLIST_FILTER['ALIAS'],
+)
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import transaction
+from common.cache import VersionedCache
+
+crew_directory_cache = VersionedCache(
+    'crews',
+    alias=settings.CREW_DIRECTORY_CACHE['ALIAS'],
+    local_size=settings.CREW_DIRECTORY_CACHE['LOCAL_SIZE'],
+    shared=settings.CREW_DIRECTORY_CACHE['SHARED'],
+    timeout=settings.CREW_DIRECTORY_CACHE['TIMEOUT'],
+    local_timeout=settings.CREW_DIRECTORY_CACHE['LOCAL_TIMEOUT'],
+)
+
+
+def category_scope(category):
+    return f'category:{category or "*"}'
+
+
+def member_scope(pk):
+    return f'member:{pk}'
+
+
+def invalidate_crew_member(pk, categories=None):
+    """
+    Retires the cached detail of a crew member and the directory pages that
+    may list them: the unfiltered pages and those of `categories`, or of
+    every category when they are not known.
+
+    The versions are bumped once the transaction commits, so a concurrent
+    request cannot cache the old rows under the new version.
+    """
+    from .models import CrewMember
+
+    if categories is None:
+        categories = [category for category, _ in CrewMember.CATEGORY_CHOICES]
+    scopes = [member_scope(pk), category_scope(None)] + [category_scope(category) for category in set(categories)]
+
+    def bump():
+        for scope in scopes:
+            crew_directory_cache.bump(scope)
+
+    transaction.on_commit(bump)
@@ -0,0 +1,16 @@
+from django.core.checks import Warning, register
+from .blacklist import token_blacklist_filter
+
+
+@register()
+def check_token_blacklist_filter(app_configs, **kwargs):
+    if token_blacklist_filter.enabled:
+        return []
+    return [
+        Warning(
+            "The token blacklist filter is off, every token refresh queries the blacklist.",
+            hint="Point TOKEN_BLACKLIST_FILTER['ALIAS'] at a cache shared by every process, such as redis.",
+            obj='kopero_auth.blacklist',
+            id='kopero_auth.W001',
+        )
+    ]
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework.exceptions import Throttled
+
+
+class HashingPoolBusy(Throttled):
+    default_detail = 'Too many sign in attempts at the moment, please retry shortly.'
+    default_code = 'hashing_pool_busy'
+
+
+class PasswordHashingPool:
+    """
+    Runs password hashing and verification on a bounded process pool.
+
+    Hashing is CPU bound and holds the GIL, so running it inline pins the
+    request worker. The pool keeps it off the workers and caps how many
+    hashes run at once; when `max_pending` calls are already running or
+    queued, new ones are refused with `HashingPoolBusy` (429 with
+    Retry-After) instead of queueing behind them. Async views await the
+    `a` variants, which wait for the pool without blocking the event loop.
+    With no workers configured, hashing runs inline.
+    """
+
+    def __init__(self, workers, max_pending, retry_after):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._pid = None
+
+    def get_executor(self):
+        with self._lock:
+            # A forked worker cannot use the processes of its parent's pool
+            if self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=django.setup)
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, func, *args):
+        executor = self.get_executor()
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolBusy(wait=self.retry_after)
+        try:
+            future = executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def call(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        return self.submit(func, *args).result()
+
+    async def acall(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def make_password(self, password):
+        if password is None:
+            # Unusable passwords are not hashed
+            return hashers.make_password(None)
+        return self.call(hashers.make_password, password)
+
+    def check_password(self, password, encoded):
+        if not hashers.is_password_usable(encoded):
+            return False
+        return self.call(hashers.check_password, password, encoded)
+
+    async def amake_password(self, password):
+        if password is None:
+            return hashers.make_password(None)
+        return await self.acall(hashers.make_password, password)
+
+    async def acheck_password(self, password, encoded):
+        if not hashers.is_password_usable(encoded):
+            return False
+        return await self.acall(hashers.check_password, password, encoded)
+
+
+password_hashing = PasswordHashingPool(
+    workers=settings.PASSWORD_HASHING['WORKERS'],
+    max_pending=settings.PASSWORD_HASHING['MAX_PENDING'],
+    retry_after=settings.PASSWORD_HASHING['RETRY_AFTER'],
+)
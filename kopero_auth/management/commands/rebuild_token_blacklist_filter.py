@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from kopero_auth.blacklist import token_blacklist_filter
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the token blacklist filter and share it with every process, '
+        'run it on a schedule more often than TOKEN_BLACKLIST_FILTER REBUILD_INTERVAL'
+    )
+
+    def handle(self, *args, **options):
+        if not token_blacklist_filter.enabled:
+            raise CommandError("TOKEN_BLACKLIST_FILTER['ALIAS'] is a process-local cache, the filter is off")
+        token_blacklist_filter.publish()
+        self.stdout.write(self.style.SUCCESS('Published the token blacklist filter'))
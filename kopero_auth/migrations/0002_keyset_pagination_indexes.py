@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 00:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('kopero_auth', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='baseuser',
+            index=models.Index(fields=['-date_joined', '-id'], name='kopero_auth_date_jo_bd4dab_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 00:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kopero_auth', '0003_crew_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseuser',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
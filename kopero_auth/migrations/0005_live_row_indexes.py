@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('kopero_auth', '0004_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='baseuser',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-date_joined', '-id'], name='baseuser_live_joined_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kopero_auth', '0005_live_row_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseuser',
+            name='calendar_token_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
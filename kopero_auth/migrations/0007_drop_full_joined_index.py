@@ -0,0 +1,17 @@
+# Generated by Django 5.1.1 on 2026-10-18 01:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kopero_auth', '0006_calendar_token_version'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='baseuser',
+            name='kopero_auth_date_jo_bd4dab_idx',
+        ),
+    ]
@@ -1,23 +1,27 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import PermissionsMixin
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from django.utils import timezone
-from django.core.mail import send_mail
+from common.mail import enqueue_email
+from common.models import SoftDeleteQuerySet
 from uuid import uuid4 as uuid
 from django.utils.translation import gettext_lazy as _
+from .hashing import password_hashing
 
 
 
-class MyUserManager(BaseUserManager):
+class MyUserManager(BaseUserManager.from_queryset(SoftDeleteQuerySet)):
     """
-    Custom base user manager for the base users
+    Custom base user manager for the base users, live users are read with
+    `alive()`
     """
     def _create_user(self, email, username, password=None, **extra_fields):
         if not email:
             raise ValueError('The Email field must be set')
         email = self.normalize_email(email)
         user = self.model(email=email, username=username, **extra_fields)
-        user.set_password(password)
+        user.password = password_hashing.make_password(password)
         user.save(using=self._db)
         return user
     
@@ -46,6 +50,8 @@ class BaseUser(AbstractBaseUser, PermissionsMixin):
     username = models.CharField(_("username"), max_length=150, blank=True, unique=True)
     phone = models.CharField(max_length=20, null=True, blank=True)
     image = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    # Resized copies of `image`, written by common.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     bio = models.TextField(max_length=1000, blank=True)
     is_ops_admin = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False)
@@ -67,6 +73,8 @@ class BaseUser(AbstractBaseUser, PermissionsMixin):
     )
 
     date_joined = models.DateTimeField(_("date joined"), default=timezone.now)
+    # Part of the calendar feed token, bumped to revoke the feed URL
+    calendar_token_version = models.PositiveIntegerField(default=0, editable=False)
 
     objects = MyUserManager()
 
@@ -96,11 +104,19 @@ class BaseUser(AbstractBaseUser, PermissionsMixin):
         return self.first_name
 
     def email_user(self, subject, message, from_email=None, **kwargs):
-        """Sends an email to this user."""
-        send_mail(subject, message, from_email, [self.email], **kwargs)
+        """Queues an email to this user in the outbox."""
+        enqueue_email(subject, message, from_email, [self.email], **kwargs)
 
     class Meta:
         abstract = False
+        indexes = [
+            # The directory and client lists only page through live users
+            models.Index(
+                fields=['-date_joined', '-id'],
+                condition=Q(is_deleted=False),
+                name='baseuser_live_joined_idx',
+            ),
+        ]
 
 class ClientManager(MyUserManager):
     """
@@ -149,8 +165,30 @@ class CrewMember(BaseUser):
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
     sessions_booked = models.JSONField(default=list, blank=True, null=True)
     average_rating = models.FloatField(default=0.0)
+    # Running review aggregates, kept up to date by booking.signals
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_1_count = models.IntegerField(default=0)
+    rating_2_count = models.IntegerField(default=0)
+    rating_3_count = models.IntegerField(default=0)
+    rating_4_count = models.IntegerField(default=0)
+    rating_5_count = models.IntegerField(default=0)
     objects = CrewMemberManager()
 
+    _original_category = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the category this crew member was loaded with so the
+        # directory pages of a category they leave are invalidated too
+        instance._original_category = instance.__dict__.get('category')
+        return instance
+
+    @property
+    def rating_histogram(self):
+        return {str(rating): getattr(self, f"rating_{rating}_count") for rating in range(1, 6)}
+
     def __str__(self):
         return self.get_full_name()
     class Meta:
@@ -1,12 +1,16 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 from .models import Client, CrewMember
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth.hashers import check_password, make_password
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from common.serializers import ImageVariantsField
+from .authentication import CLIENT_ROLE, CREW_ROLE, FilteredRefreshToken, tokens_for_user
+from .hashing import password_hashing
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.core.mail import send_mail
+from common.mail import enqueue_email
 from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
 from django.conf import settings
 from django.utils.translation import gettext as _
 import uuid
@@ -56,57 +60,90 @@ class ClientRegistrationSerializer(serializers.ModelSerializer):
         return user
     
 
-class CrewMemberLoginSerializer(serializers.Serializer):
+class LoginSerializer(serializers.Serializer):
     """
-    Serializes data for logging in crew member
+    Checks the email and password of a user of `model`, with `is_valid` or,
+    on the event loop, with `ais_valid`
     """
+    model = None
+    role = None
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
 
     def validate(self, data):
-        email = data.get("email")
-        password = data.get("password")
-        user = CrewMember.objects.filter(email=email).first()
+        user = self.model.objects.filter(email=data.get("email")).first()
+        return self.check_credentials(user, user and password_hashing.check_password(data.get("password"), user.password))
+
+    async def avalidate(self, data):
+        user = await self.model.objects.filter(email=data.get("email")).afirst()
+        return self.check_credentials(user, user and await password_hashing.acheck_password(data.get("password"), user.password))
+
+    def check_credentials(self, user, password_matches):
         if user:
-            if check_password(password, user.password):
+            if password_matches:
                 return user
             else:
                 raise serializers.ValidationError("Wrong password")
         else:
             raise serializers.ValidationError("Invalid login credentials")
-    
+
+    async def ais_valid(self):
+        """`is_valid` awaiting `avalidate` instead of calling `validate`"""
+        try:
+            data = self.to_internal_value(self.initial_data)
+            self._validated_data = await self.avalidate(data)
+        except ValidationError as exc:
+            self._validated_data = {}
+            self._errors = as_serializer_error(exc)
+        else:
+            self._errors = {}
+        return not self._errors
+
     def get_tokens(self, user):
-        refresh = RefreshToken.for_user(user)
+        return tokens_for_user(user, self.role)
+
+    async def aget_tokens(self, user):
+        # The refresh token is recorded as outstanding by the sync ORM
+        return await sync_to_async(self.get_tokens)(user)
+
+
+class CrewMemberLoginSerializer(LoginSerializer):
+    """
+    Serializes data for logging in crew member
+    """
+    model = CrewMember
+    role = CREW_ROLE
+
+    def get_user_data(self, user):
         return {
-            "refresh": str(refresh),
-            "access": str(refresh.access_token)
+            "id": user.id,
+            "email": user.email,
+            "full_name": user.full_name,
+            "category": user.category,
+            "phone": user.phone
         }
-    
 
-class ClientLoginSerializer(serializers.Serializer):
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Token refresh that checks the blacklist through the in-process filter
+    """
+    token_class = FilteredRefreshToken
+
+
+class ClientLoginSerializer(LoginSerializer):
     """
     Serializes data for logging in client
     """
-    email = serializers.EmailField()
-    password = serializers.CharField(write_only=True)
+    model = Client
+    role = CLIENT_ROLE
 
-    def validate(self, data):
-        email = data.get("email")
-        password = data.get("password")
-        user = Client.objects.filter(email=email).first()
-        if user:
-            if check_password(password, user.password):
-                return user
-            else:
-                raise serializers.ValidationError("Wrong password")
-        else:
-            raise serializers.ValidationError("Invalid login credentials")
-    
-    def get_tokens(self, user):
-        refresh = RefreshToken.for_user(user)
+    def get_user_data(self, user):
         return {
-            "refresh": str(refresh),
-            "access": str(refresh.access_token)
+            "id": user.id,
+            "email": user.email,
+            "username": user.username,
+            "phone": user.phone
         }
 
 class ReadClientSerializer(serializers.ModelSerializer):
@@ -138,6 +175,8 @@ class ClientSerializer(serializers.ModelSerializer):
     Serializer class for a Client instance for detail view
     """
     image_url = serializers.SerializerMethodField('get_image_url')
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Client
         fields = (
@@ -150,6 +189,7 @@ class ClientSerializer(serializers.ModelSerializer):
             "full_name",
             "phone",
             "image",
+            "image_variants",
             "bio",
             "is_active",
             "image_url",
@@ -176,6 +216,7 @@ class ReadCrewSerializer(serializers.ModelSerializer):
     """
     Serializer class for a Client instance
     """
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = CrewMember
@@ -187,11 +228,14 @@ class ReadCrewSerializer(serializers.ModelSerializer):
             "full_name",
             "phone",
             "image",
+            "image_variants",
             "is_active",
             "average_rating",
+            "rating_count",
+            "rating_histogram",
         )
         extra_kwargs = {"password": {"write_only": True}}
-        read_only_fields = ("id", "full_name")
+        read_only_fields = ("id", "full_name", "rating_count", "rating_histogram")
     def get_image(self, obj):
         return f"/media/{obj.image}" if obj.image else None
 
@@ -199,6 +243,7 @@ class CrewSerializer(serializers.ModelSerializer):
     """
     Serializer class for a Crew instance for detail view
     """
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = CrewMember
@@ -212,6 +257,7 @@ class CrewSerializer(serializers.ModelSerializer):
             "full_name",
             "phone",
             "image",
+            "image_variants",
             "sessions_booked",
             "is_active",
             "category",
@@ -263,7 +309,7 @@ class PasswordResetRequestSerializer(serializers.Serializer):
 
         # Generate reset link
         reset_link = f'{settings.FRONTEND_URL}/reset-password-confirm/?uid={uid}&tk={token}'
-        send_mail(
+        enqueue_email(
             subject="Password Reset Request",
             message=f"Click the following link to reset your password:\n{reset_link}",
             from_email=settings.DEFAULT_FROM_EMAIL,
@@ -294,6 +340,6 @@ class PasswordResetSerializer(serializers.Serializer):
     def save(self):
         uid = uuid.UUID(bytes=urlsafe_base64_decode(self.validated_data['uidb64']))
         user = Client.objects.get(pk=uid) if self.context.get('user_type') == 'client' else CrewMember.objects.get(pk=uid)
-        new_password = make_password(self.validated_data['new_password'])
+        new_password = password_hashing.make_password(self.validated_data['new_password'])
         user.password = new_password
         user.save()
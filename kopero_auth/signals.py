@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from common.images import image_variants
+from .authentication import user_state_key
+from .blacklist import token_blacklist_filter
+from .cache import invalidate_crew_member
+from .models import BaseUser, Client, CrewMember
+
+@receiver(post_save, sender=CrewMember)
+@receiver(post_delete, sender=CrewMember)
+def invalidate_crew_directory(sender, instance, **kwargs):
+    categories = {instance.category, instance._original_category} - {None}
+    invalidate_crew_member(instance.pk, categories)
+    instance._original_category = instance.category
+
+@receiver(post_save, sender=BaseUser)
+def invalidate_crew_directory_for_user(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Profile fields can also be saved through the parent model, for example
+    # on the authenticated user, which does not send the CrewMember signals.
+    # Whether the user is a crew member is not known without a query, so
+    # every scope that could show them is retired, which only costs cache writes.
+    if raw or update_fields == frozenset(['last_login']):
+        return
+    invalidate_crew_member(instance.pk)
+
+@receiver(post_save, sender=BlacklistedToken)
+def add_to_blacklist_filter(sender, instance, created, raw=False, **kwargs):
+    # Marked before commit, a rolled back marker only costs a database check
+    if created and not raw:
+        token_blacklist_filter.add(instance.token.jti)
+
+@receiver(post_save, sender=BaseUser)
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=CrewMember)
+def schedule_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        image_variants.schedule(instance)
+
+@receiver(post_save, sender=BaseUser)
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=CrewMember)
+@receiver(post_delete, sender=BaseUser)
+def invalidate_user_state(sender, instance, **kwargs):
+    # Also after commit, so a concurrent request cannot cache the old flags again
+    backend = caches[settings.USER_STATE_CACHE['ALIAS']]
+    key = user_state_key(instance.pk)
+    backend.delete(key)
+    transaction.on_commit(lambda: backend.delete(key))
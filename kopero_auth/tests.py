@@ -1,3 +1,219 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from kopero_auth.authentication import CLIENT_ROLE, FilteredRefreshToken, tokens_for_user, user_state_key
+from kopero_auth.blacklist import TokenBlacklistFilter, token_blacklist_filter
+from kopero_auth.cache import crew_directory_cache
+from kopero_auth.checks import check_token_blacklist_filter
+from kopero_auth.hashing import PasswordHashingPool, password_hashing
+from kopero_auth.models import BaseUser, Client, CrewMember
+from kopero_auth.views import CrewsListView
 
-# Create your tests here.
+
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.user = Client.objects.create_user("client@example.com", "client", "s3cret-pass")
+
+    def test_passwords_are_hashed_on_the_pool(self):
+        self.assertTrue(password_hashing.check_password("s3cret-pass", self.user.password))
+        self.assertFalse(password_hashing.check_password("wrong", self.user.password))
+
+        response = self.api.post(reverse("login_client"), {"email": self.user.email, "password": "s3cret-pass"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_full_pool_sheds_load(self):
+        full_pool = PasswordHashingPool(workers=1, max_pending=0, retry_after=3)
+        with mock.patch("kopero_auth.serializers.password_hashing", full_pool):
+            response = self.api.post(reverse("login_client"), {"email": self.user.email, "password": "s3cret-pass"})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "3")
+
+    def test_async_login_awaits_the_pool(self):
+        url = reverse("login_client_async")
+        response = self.api.post(url, {"email": self.user.email, "password": "s3cret-pass"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["user"]["id"], str(self.user.pk))
+        self.assertIn("refresh", response.json()["tokens"])
+
+        response = self.api.post(url, {"email": self.user.email, "password": "wrong"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"non_field_errors": ["Wrong password"]})
+
+        full_pool = PasswordHashingPool(workers=1, max_pending=0, retry_after=3)
+        with mock.patch("kopero_auth.serializers.password_hashing", full_pool):
+            response = self.api.post(url, {"email": self.user.email, "password": "s3cret-pass"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response["Retry-After"], "3")
+
+
+class TokenBlacklistTests(TestCase):
+    def setUp(self):
+        # The filter needs a cache shared by every process
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": directory.name},
+        })
+        override.enable()
+        self.addCleanup(override.disable)
+        self.api = APIClient()
+        self.user = Client.objects.create(email="client@example.com", username="client")
+        # Start every test from a filter built from this test's database
+        token_blacklist_filter.rebuild()
+
+    def test_rotated_refresh_token_is_refused(self):
+        refresh = tokens_for_user(self.user, CLIENT_ROLE)["refresh"]
+
+        # The filter rules the fresh token out without a blacklist lookup
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.post(reverse("token_refresh"), {"refresh": refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in queries if 'blacklistedtoken" INNER JOIN' in query["sql"]])
+
+        response = self.api.post(reverse("token_refresh"), {"refresh": refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Also once the marker is gone and the filter was rebuilt
+        token_blacklist_filter.backend.clear()
+        token_blacklist_filter.rebuild()
+        response = self.api.post(reverse("token_refresh"), {"refresh": refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_workers_load_the_published_filter(self):
+        refresh = FilteredRefreshToken(tokens_for_user(self.user, CLIENT_ROLE)["refresh"])
+        refresh.blacklist()
+        call_command("rebuild_token_blacklist_filter", stdout=io.StringIO())
+
+        # Another worker, which finds the filter in the cache
+        worker = TokenBlacklistFilter(alias="default")
+        with self.assertNumQueries(0):
+            self.assertIn(refresh["jti"], worker.get_filter())
+        self.assertEqual(check_token_blacklist_filter(None), [])
+
+    def test_process_local_cache_falls_back_to_the_blacklist(self):
+        refresh = tokens_for_user(self.user, CLIENT_ROLE)["refresh"]
+
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.api.post(reverse("token_refresh"), {"refresh": refresh})
+            self.assertEqual([warning.id for warning in check_token_blacklist_filter(None)], ["kopero_auth.W001"])
+            with self.assertRaises(CommandError):
+                call_command("rebuild_token_blacklist_filter", stdout=io.StringIO())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue([query for query in queries if 'blacklistedtoken" INNER JOIN' in query["sql"]])
+
+
+class TokenUserStateTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        self.user = Client.objects.create(email="client@example.com", username="client", is_staff=True)
+        access = tokens_for_user(self.user, CLIENT_ROLE)["access"]
+        self.api.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_deactivated_user_is_refused_despite_a_valid_token(self):
+        self.assertEqual(self.api.get(reverse("bookings")).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.api.get(reverse("db_pool_stats")).status_code, status.HTTP_200_OK)
+
+        # Demoted: the staff claim of the token is not trusted
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.api.get(reverse("db_pool_stats")).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.api.get(reverse("bookings")).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_soft_deleted_user_is_refused_once_the_state_expires(self):
+        self.assertEqual(self.api.get(reverse("bookings")).status_code, status.HTTP_200_OK)
+
+        # Updates skip the signals, the cached state times out instead
+        Client.objects.filter(pk=self.user.pk).update(is_deleted=True)
+        cache.delete(user_state_key(self.user.pk))
+        self.assertEqual(self.api.get(reverse("bookings")).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CrewDirectoryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        crew_directory_cache.local.clear()
+        self.api = APIClient()
+        self.crew = CrewMember.objects.create(
+            email="crew@example.com", username="crew", first_name="Ada", category=CrewMember.PHOTOGRAPHER,
+        )
+
+    def listed(self, category):
+        response = self.api.get(reverse("crews"), {"category": category})
+        return [crew["id"] for crew in response.data["results"]]
+
+    def test_category_change_moves_the_member_between_lists(self):
+        self.assertEqual(self.listed(CrewMember.PHOTOGRAPHER), [str(self.crew.pk)])
+        self.assertEqual(self.listed(CrewMember.VIDEOGRAPHER), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crew.category = CrewMember.VIDEOGRAPHER
+            self.crew.save()
+        self.assertEqual(self.listed(CrewMember.PHOTOGRAPHER), [])
+        self.assertEqual(self.listed(CrewMember.VIDEOGRAPHER), [str(self.crew.pk)])
+
+    def test_detail_is_revalidated_after_an_update(self):
+        self.api.force_authenticate(self.crew)
+        url = reverse("crew_details", args=[self.crew.pk])
+        etag = self.api.get(url)["ETag"]
+        # A cache hit carries the same validator, and answers it without a query
+        with self.assertNumQueries(0):
+            response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.api.get(url)["ETag"], etag)
+
+        # Also when saved through the parent model
+        with self.captureOnCommitCallbacks(execute=True):
+            user = BaseUser.objects.get(pk=self.crew.pk)
+            user.first_name = "Grace"
+            user.save()
+        response = self.api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["first_name"], "Grace")
+
+
+class CrewExportTests(TestCase):
+    def setUp(self):
+        self.api = APIClient()
+        for number in range(5):
+            CrewMember.objects.create(
+                email=f"crew{number}@example.com", username=f"crew{number}", category=CrewMember.PHOTOGRAPHER,
+            )
+
+    def export(self, export_format):
+        # Two rows per chunk, so the five rows span three chunks
+        with mock.patch.object(CrewsListView, "export_chunk_size", 2):
+            response = self.api.get(reverse("crews"), {"all": "true", "format": export_format})
+            with self.assertNumQueries(1):
+                body = b"".join(response.streaming_content).decode()
+        return response, body
+
+    def test_ndjson_export(self):
+        response, body = self.export("ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="crewmember.ndjson"')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(sorted(row["username"] for row in rows), [f"crew{number}" for number in range(5)])
+
+    def test_csv_export(self):
+        response, body = self.export("csv")
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual({row["category"] for row in rows}, {CrewMember.PHOTOGRAPHER})
@@ -14,6 +14,9 @@ from .views import (
     ClientDetailView,
     ClientsListView,
     CrewsListView,
+    AsyncCrewsListView,
+    AsyncCrewMemberLoginView,
+    AsyncClientLoginView,
     ClientPasswordResetRequestView,
     CrewPasswordResetView,
     ClientPasswordResetView,
@@ -25,7 +28,11 @@ urlpatterns = [
     path("register/client/", ClientRegistrationView.as_view(), name="register_customer"),
     path("login/crew/", CrewMemberLoginView.as_view(), name="login_crew_member"),
     path("login/client/", ClientLoginView.as_view(), name="login_client"),
+    # Native async logins, for ASGI servers
+    path("async/login/crew/", AsyncCrewMemberLoginView.as_view(), name="login_crew_member_async"),
+    path("async/login/client/", AsyncClientLoginView.as_view(), name="login_client_async"),
     path("logout/", LogoutView.as_view(), name="logout"),
+    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path('password-reset/client/', ClientPasswordResetRequestView.as_view(), name='client_password_reset_request'),
     path('password-reset/client/confirm/', ClientPasswordResetView.as_view(), name='client_password_reset_confirm'),
     path('password-reset/crew/', CrewPasswordResetRequestView.as_view(), name='crew_password_reset_request'),
@@ -34,5 +41,7 @@ urlpatterns = [
     path("clients/", ClientsListView.as_view(), name="clients"),
     path("clients/<uuid:pk>/", ClientDetailView.as_view(), name="client_details"),
     path("crews/", CrewsListView.as_view(), name="crews"),
+    # Native async version of the crew list, for ASGI servers
+    path("async/crews/", AsyncCrewsListView.as_view(), name="crews_async"),
     path("crews/<uuid:pk>/", CrewDetailView.as_view(), name="crew_details")
 ]
@@ -1,13 +1,15 @@
 import datetime
 from django.shortcuts import get_object_or_404
 from rest_framework import status
-from common.views import BaseDetailView
+from common.cache import etag_matches
+from common.views import AsyncAPIView, AsyncListView, BaseDetailView, KeysetPaginationMixin, StreamingExportMixin
 from kopero_auth.models import Client, CrewMember
+from .cache import category_scope, crew_directory_cache, member_scope
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.generics import GenericAPIView
-from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import FilteredRefreshToken
 from .serializers import (
     ClientSerializer,
     ClientUpdateSerializer,
@@ -70,17 +72,9 @@ class CrewMemberLoginView(APIView):
         serializer = CrewMemberLoginSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.validated_data
-            tokens = serializer.get_tokens(user)
-
             return Response({
-                "tokens": tokens,
-                "user": {
-                    "id": user.id,
-                    "email": user.email,
-                    "full_name": user.full_name,
-                    "category": user.category,
-                    "phone": user.phone
-                    }
+                "tokens": serializer.get_tokens(user),
+                "user": serializer.get_user_data(user)
             }, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -95,19 +89,46 @@ class ClientLoginView(APIView):
         serializer = ClientLoginSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.validated_data
-            tokens = serializer.get_tokens(user)
+            return Response({
+                "tokens": serializer.get_tokens(user),
+                "user": serializer.get_user_data(user)
+            }, status=status.HTTP_200_OK)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
 
+class AsyncLoginView(AsyncAPIView):
+    """
+    Login running on the event loop. The password is checked on the hashing
+    pool without blocking the loop, and refused with a 429 when it is full.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = ()
+    serializer_class = None
+
+    async def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        if await serializer.ais_valid():
+            user = serializer.validated_data
             return Response({
-                "tokens": tokens,
-                "user": {
-                    "id": user.id,
-                    "email": user.email,
-                    "username": user.username,
-                    "phone": user.phone
-                    }
+                "tokens": await serializer.aget_tokens(user),
+                "user": serializer.get_user_data(user)
             }, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+class AsyncCrewMemberLoginView(AsyncLoginView):
+    """
+    CrewMemberLoginView running on the event loop
+    """
+    serializer_class = CrewMemberLoginSerializer
+
+
+class AsyncClientLoginView(AsyncLoginView):
+    """
+    ClientLoginView running on the event loop
+    """
+    serializer_class = ClientLoginSerializer
+
 class LogoutView(APIView):
     """
     View for logging out all users
@@ -115,25 +136,28 @@ class LogoutView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
             return Response(status=status.HTTP_205_RESET_CONTENT)
         except:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
 
-class ClientsListView(GenericAPIView):
+class ClientsListView(StreamingExportMixin, KeysetPaginationMixin, GenericAPIView):
     """
     API view to list Client users.
 
     This view supports filtering by role and pagination. If the 'all' 
     query parameter is provided, all clients matching the filters will 
-    be returned without pagination.
+    be returned without pagination, streamed as NDJSON or CSV when 'format'
+    is 'ndjson' or 'csv'. If the 'cursor' query parameter is provided,
+    keyset pagination on the join date is used instead of pages.
 
     Attributes:
         model: The model class used for querying clients.
         serializer_class: The serializer class for serializing client data.
         read_serializer_class: The serializer class for read-only operations.
+        keyset_ordering: The unique ordering used for cursor pagination.
 
     Methods:
         get_read_serializer_class: Returns the appropriate serializer class for reading data.
@@ -144,6 +168,7 @@ class ClientsListView(GenericAPIView):
     model = Client
     serializer_class = ClientSerializer
     read_serializer_class = ReadClientSerializer
+    keyset_ordering = ('-date_joined', '-id')
 
     def get_read_serializer_class(self):
         """
@@ -169,9 +194,9 @@ class ClientsListView(GenericAPIView):
         queryset = []
         role = request.GET.get("role", None)  # Filter by role
         if role is not None:
-            queryset = self.model.objects.filter(role=role, is_deleted=False)
+            queryset = self.model.objects.alive().filter(role=role)
         else:
-            queryset = self.model.objects.filter(is_deleted=False) 
+            queryset = self.model.objects.alive()
         return queryset
 
     def get(self, request):
@@ -190,6 +215,8 @@ class ClientsListView(GenericAPIView):
         all_status = request.GET.get("all", None)
         queryset = self.get_queryset(request)
         if all_status is not None:
+            if self.is_streaming_export(request):
+                return self.stream_queryset(queryset, self.get_read_serializer_class(), context={'request':request})
             serializer = self.get_read_serializer_class()(queryset, many=True, context={'request':request})
             return Response(serializer.data) 
         else:  
@@ -219,9 +246,9 @@ class ClientDetailView(BaseDetailView):
     permission_classes = [IsAuthenticated]
     model = Client
 
-    def get_object(self, pk):
+    def get_object(self, request, pk):
         """
-        Retrieves a Client object based on the provided primary key.
+        Retrieves a live Client object based on the provided primary key.
 
         Args:
             request: The HTTP request object.
@@ -230,7 +257,7 @@ class ClientDetailView(BaseDetailView):
         Returns:
             Client: The client object if found; raises 404 if not.
         """
-        return get_object_or_404(Client, pk=pk)
+        return get_object_or_404(Client.objects.alive(), pk=pk)
 
     def get(self, request, pk=None):
         """
@@ -243,7 +270,7 @@ class ClientDetailView(BaseDetailView):
         Returns:
             Response: A response containing the serialized client data.
         """
-        crew_member = self.get_object(pk)
+        crew_member = self.get_object(request, pk)
         serializer = ClientSerializer(crew_member, context={'request':request})
         return Response(serializer.data)
 
@@ -256,7 +283,7 @@ class ClientDetailView(BaseDetailView):
         Returns:
             Response: A Response object indicating the result of the update operation.
         """
-        client = self.get_object(pk)
+        client = self.get_object(request, pk)
         serializer = ClientUpdateSerializer(client, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -265,13 +292,15 @@ class ClientDetailView(BaseDetailView):
 
 
 #Crew list and detail views
-class CrewsListView(GenericAPIView):
+class CrewsListView(StreamingExportMixin, KeysetPaginationMixin, GenericAPIView):
     """
     View to handle listing Crew Members.
 
     This view allows for the retrieval of crew members, with optional filtering
     based on the 'category' field. It supports pagination and can return all 
-    members if specified.
+    members if specified, streamed as NDJSON or CSV with 'format'. Passing a
+    'cursor' query parameter switches to keyset pagination on the join date.
+    JSON pages are served from the crew directory cache, scoped by category.
 
     Methods:
         get_read_serializer_class: Determines the appropriate serializer class 
@@ -283,6 +312,7 @@ class CrewsListView(GenericAPIView):
     model = CrewMember
     serializer_class = CrewSerializer
     read_serializer_class = ReadCrewSerializer
+    keyset_ordering = ('-date_joined', '-id')
 
     def get_read_serializer_class(self):
         """
@@ -311,9 +341,9 @@ class CrewsListView(GenericAPIView):
         queryset = []
         category = request.GET.get("category", None)  # Retrieve the 'category' filter
         if category is not None:
-            queryset = self.model.objects.filter(category=category, is_deleted=False)
+            queryset = self.model.objects.alive().filter(category=category)
         else:
-            queryset = self.model.objects.filter(is_deleted=False)
+            queryset = self.model.objects.alive()
         return queryset
 
     def get(self, request):
@@ -329,22 +359,59 @@ class CrewsListView(GenericAPIView):
         Returns:
             Response: A Response object containing the serialized data of crew members.
         """
+        all_status = request.GET.get("all", None)
+        if all_status is not None and self.is_streaming_export(request):
+            return self.stream_queryset(self.get_queryset(request), self.get_read_serializer_class())
+
+        key = f"list:{request.accepted_renderer.format}:{request.get_host()}{request.get_full_path()}"
+        scope = category_scope(request.GET.get("category", None))
+        return Response(crew_directory_cache.get_or_set(key, lambda: self.list(request), scope=scope))
+
+    def list(self, request):
         all_status = request.GET.get("all", None)
         queryset = self.get_queryset(request)
         if all_status is not None:
             serializer = self.get_read_serializer_class()(queryset, many=True)
-            return Response(serializer.data) 
+            return serializer.data
         else:  
             page = self.paginate_queryset(queryset)
             serializer = self.get_read_serializer_class()(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return self.get_paginated_response(serializer.data).data
+
+
+class AsyncCrewsListView(AsyncListView):
+    """
+    CrewsListView's JSON responses served on the event loop with the async
+    ORM, from the same crew directory cache scopes.
+    """
+    model = CrewMember
+    read_serializer_class = ReadCrewSerializer
+    keyset_ordering = ('-date_joined', '-id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        category = self.request.query_params.get("category", None)
+        if category is not None:
+            queryset = queryset.filter(category=category)
+        return queryset
+
+    async def get(self, request):
+        key = f"list:{self.renderer_class.format}:{request.get_host()}{request.get_full_path()}"
+        scope = category_scope(request.query_params.get("category", None))
+        return Response(await crew_directory_cache.aget_or_set(key, lambda: self.list(request), scope=scope))
+
+    def get_serializer_context(self):
+        # Same payload as CrewsListView, which renders relative image URLs
+        return {}
+
 
 class CrewDetailView(BaseDetailView):
     """
     View to handle operations on a specific Crew Member.
 
     This view allows for viewing, updating, or deleting a crew member based on 
-    their unique identifier (primary key).
+    their unique identifier (primary key). Details are served from the crew
+    directory cache.
 
     Methods:
         get_object: Retrieves the specified crew member or the authenticated user.
@@ -354,9 +421,9 @@ class CrewDetailView(BaseDetailView):
     permission_classes = [IsAuthenticated]
     model = CrewMember
 
-    def get_object(self, pk):
+    def get_object(self, request, pk):
         """
-        Retrieves a Crew Member object by its primary key.
+        Retrieves a live Crew Member object by its primary key.
 
         If a primary key is provided, the corresponding object is fetched.
         Otherwise, the authenticated user object is returned.
@@ -368,7 +435,7 @@ class CrewDetailView(BaseDetailView):
         Returns:
             CrewMember: The corresponding Crew Member object or the authenticated user.
         """
-        return get_object_or_404(CrewMember, pk=pk)
+        return get_object_or_404(CrewMember.objects.alive(), pk=pk)
 
     def get(self, request, pk=None):
         """
@@ -381,9 +448,16 @@ class CrewDetailView(BaseDetailView):
         Returns:
             Response: A Response object containing the serialized crew member data.
         """
-        crew_member = self.get_object(pk)
-        serializer = CrewSerializer(crew_member)
-        return Response(serializer.data)
+        def retrieve():
+            return CrewSerializer(self.get_object(request, pk)).data
+
+        # The ETag follows the member's cache version, alike for hits and misses
+        key = f"detail:{request.accepted_renderer.format}:{pk}"
+        version = crew_directory_cache.get_version(member_scope(pk))
+        etag = crew_directory_cache.etag(key, version)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(crew_directory_cache.get_or_set(key, retrieve, version), headers={'ETag': etag})
 
     def patch(self, request, pk=None):
         """
@@ -394,7 +468,7 @@ class CrewDetailView(BaseDetailView):
         Returns:
             Response: A Response object indicating the result of the update operation.
         """
-        crew_member = self.get_object(pk)
+        crew_member = self.get_object(request, pk)
         serializer = CrewUpdateSerializer(crew_member, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
@@ -0,0 +1,11 @@
+from django.conf import settings
+from common.cache import VersionedCache
+
+catalog_cache = VersionedCache(
+    'services',
+    alias=settings.CATALOG_CACHE['ALIAS'],
+    local_size=settings.CATALOG_CACHE['LOCAL_SIZE'],
+    shared=settings.CATALOG_CACHE['SHARED'],
+    timeout=settings.CATALOG_CACHE['TIMEOUT'],
+    local_timeout=settings.CATALOG_CACHE['LOCAL_TIMEOUT'],
+)
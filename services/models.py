@@ -12,6 +12,8 @@ class Service(models.Model):
     description = models.TextField(max_length=2000, blank=True)
     rate_per_hour = models.FloatField(default=1000.00)
     image = models.ImageField(upload_to="services", blank=True, null=True)
+    # Resized copies of `image`, written by common.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         """Returns the official representation of a service"""
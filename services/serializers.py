@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from common.serializers import ImageVariantsField
 from .models import Service
 
 
@@ -7,6 +8,8 @@ class ServiceSerializer(serializers.ModelSerializer):
     """
     Serializer for the service model
     """
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Service
         fields = "__all__"
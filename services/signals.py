@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from common.images import image_variants
+from .cache import catalog_cache
+from .models import Service
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def bump_catalog_version(sender, instance, **kwargs):
+    # Once committed, so a concurrent request cannot cache the old rows under the new version
+    transaction.on_commit(catalog_cache.bump)
+
+@receiver(post_save, sender=Service)
+def schedule_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        image_variants.schedule(instance)
@@ -1,3 +1,47 @@
+from unittest import mock
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from common.cache import VersionedCache
+from .cache import catalog_cache
+from .models import Service
 
-# Create your tests here.
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_cache.local.clear()
+        self.api = APIClient()
+        self.service = Service.objects.create(name="Portrait session", tag="portrait")
+
+    def names(self):
+        response = self.api.get(reverse("service-list"))
+        return response["ETag"], sorted(service["name"] for service in response.data["results"])
+
+    def test_catalog_is_retired_once_changes_commit(self):
+        etag, names = self.names()
+        self.assertEqual(names, ["Portrait session"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.create(name="Wedding", tag="wedding")
+            # Not before the commit, a concurrent request would cache the old rows again
+            self.assertEqual(self.names(), (etag, names))
+        new_etag, names = self.names()
+        self.assertEqual(names, ["Portrait session", "Wedding"])
+        self.assertNotEqual(new_etag, etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.delete()
+        self.assertEqual(self.names()[1], ["Wedding"])
+
+    def test_process_local_entries_expire(self):
+        # A bump made by another worker never reaches a locmem cache, its entries expire instead
+        versioned = VersionedCache("test", local_timeout=60)
+        self.assertFalse(versioned.shared)
+        now = 1000.0
+        with mock.patch("common.cache.time.monotonic", side_effect=lambda: now):
+            self.assertEqual(versioned.get_or_set("key", lambda: "old"), "old")
+            self.assertEqual(versioned.get_or_set("key", lambda: "new"), "old")
+            now += 61
+            self.assertEqual(versioned.get_or_set("key", lambda: "new"), "new")
@@ -7,5 +7,8 @@ router = DefaultRouter()
 router.register(r"", views.ServiceViewSet)
 
 urlpatterns = [
+    # Native async list and retrieve, for ASGI servers
+    path("async/", views.AsyncServiceView.as_view(), name="services_async"),
+    path("async/<uuid:pk>/", views.AsyncServiceView.as_view(), name="service_async"),
     path("", include(router.urls))
 ]
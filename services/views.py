@@ -1,12 +1,76 @@
+from django.core.exceptions import ValidationError
+from django.http import Http404
 from django.shortcuts import render
+from rest_framework import status
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
+from common.cache import etag_matches
+from common.views import AsyncGenericView
+from .cache import catalog_cache
 from .serializers import ServiceSerializer
 from .models import Service
 
 # Create your views here.
 class ServiceViewSet(ModelViewSet):
     """
-    Class based viewset for the service endpoint
+    Class based viewset for the service endpoint.
+    List and retrieve are served from the versioned catalog cache and carry
+    an ETag derived from the catalog version.
     """
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
+
+    def cached_response(self, request, view, *args, **kwargs):
+        version = catalog_cache.get_version()
+        key = f"{request.accepted_renderer.format}:{request.get_host()}{request.get_full_path()}"
+        etag = catalog_cache.etag(key, version)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = catalog_cache.get_or_set(key, lambda: view(request, *args, **kwargs).data, version)
+        return Response(data, headers={'ETag': etag})
+
+
+class AsyncServiceView(AsyncGenericView):
+    """
+    ServiceViewSet's list and retrieve running on the event loop with the
+    async ORM, served from the same catalog cache and with the same ETags.
+    """
+
+    def get_queryset(self):
+        return Service.objects.order_by('pk')
+
+    async def get(self, request, pk=None):
+        version = await catalog_cache.aget_version()
+        key = f"{self.renderer_class.format}:{request.get_host()}{request.get_full_path()}"
+        etag = catalog_cache.etag(key, version)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        if pk is None:
+            data = await catalog_cache.aget_or_set(key, lambda: self.list(request), version)
+        else:
+            data = await catalog_cache.aget_or_set(key, lambda: self.retrieve(request, pk), version)
+        return Response(data, headers={'ETag': etag})
+
+    async def list(self, request):
+        queryset = self.get_queryset()
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        rows = page if page is not None else [service async for service in queryset]
+        data = ServiceSerializer(rows, many=True, context=self.get_serializer_context()).data
+        if page is None:
+            return data
+        return self.paginator.get_paginated_response(data).data
+
+    async def retrieve(self, request, pk):
+        try:
+            service = await self.get_queryset().aget(pk=pk)
+        except (Service.DoesNotExist, ValidationError, ValueError):
+            raise Http404
+        return ServiceSerializer(service, context=self.get_serializer_context()).data